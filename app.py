@@ -136,37 +136,38 @@ if prompt := st.chat_input("Ask a question about your documents..."):
     # RAG Response
     if st.session_state.qa_chain:
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing documents..."):
-                try:
-                    # Request answer and sources
-                    result = st.session_state.qa_chain({"query": prompt})
-                    response_text = result["result"]
-                    source_docs = result["source_documents"]
-                    
-                    st.markdown(response_text)
-                    
-                    # Process sources with page numbers
-                    unique_sources = []
-                    for doc in source_docs:
-                        filename = doc.metadata.get("source", "Unknown")
-                        page = doc.metadata.get("page", 0) + 1
-                        snippet = doc.page_content[:200] + "..."
-                        source_info = f"**File:** {filename}, **Page:** {page}<br>{snippet}"
-                        if source_info not in unique_sources:
-                            unique_sources.append(source_info)
-                    
-                    with st.expander("Show Sources"):
-                        for src in unique_sources:
-                            st.markdown(f"<div class='source-box'>{src}</div>", unsafe_allow_html=True)
-                    
-                    # Store message with sources
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response_text,
-                        "sources": unique_sources
-                    })
-                except Exception as e:
-                    st.error(f"An error occurred: {e}")
+            try:
+                # Sources arrive as soon as retrieval finishes, then the answer streams in
+                from rag_engine import stream_answer
+                stream = stream_answer(st.session_state.qa_chain, prompt)
+                with st.spinner("Analyzing documents..."):
+                    source_docs = next(stream)
+                answer_area = st.container()
+
+                # Process sources with page numbers
+                unique_sources = []
+                for doc in source_docs:
+                    filename = doc.metadata.get("source", "Unknown")
+                    page = doc.metadata.get("page", 0) + 1
+                    snippet = doc.page_content[:200] + "..."
+                    source_info = f"**File:** {filename}, **Page:** {page}<br>{snippet}"
+                    if source_info not in unique_sources:
+                        unique_sources.append(source_info)
+                
+                with st.expander("Show Sources"):
+                    for src in unique_sources:
+                        st.markdown(f"<div class='source-box'>{src}</div>", unsafe_allow_html=True)
+
+                response_text = answer_area.write_stream(stream)
+                
+                # Store message with sources
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": response_text,
+                    "sources": unique_sources
+                })
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
     else:
         with st.chat_message("assistant"):
             st.warning("Please upload a PDF document in the sidebar first!")
@@ -1,4 +1,5 @@
 import os
+import threading
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
@@ -9,7 +10,18 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY") # Service Role Key for backend admin access
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_supabase: Client = None
+_supabase_lock = threading.Lock()
+
+
+def get_supabase() -> Client:
+    """The shared Supabase client, created on first use so startup doesn't depend on the service."""
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
 
 security = HTTPBearer()
 
@@ -18,7 +30,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     token = credentials.credentials
     try:
         # verify the jwt with supabase
-        user = supabase.auth.get_user(token)
+        user = get_supabase().auth.get_user(token)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
         return user.user
@@ -1,6 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse
 from backend.app.services.rag_service import rag_service
-from backend.app.api.v1.auth import get_current_user, supabase
+from backend.app.services.ingestion_jobs import ingestion_queue
+from backend.app.services.chat_persistence import ChatHistoryWriter
+from backend.app.services.chat_history import ChatHistory
+from backend.app.services.report_export import ReportExporter
+from backend.app.services.repository import repository_from_env
+from backend.app.api.v1.auth import get_current_user, get_supabase
 from typing import Optional
 from pydantic import BaseModel
 import os
@@ -9,22 +15,30 @@ import json
 
 import logging
 
-# Configure logging to a file
-logging.basicConfig(
-    filename="backend_debug.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Handlers are configured once by telemetry.configure_logging() in main.py
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Documents, sessions and messages: Supabase, or a local SQLite/Postgres (STORAGE_BACKEND)
+repository = repository_from_env(get_supabase)
+# Recent messages of each session, served without a query; the writer appends to it
+chat_history = ChatHistory.from_env(repository)
+# Chat messages are written behind the response, batched across requests
+chat_writer = ChatHistoryWriter.from_env(repository, chat_history)
+# PDF session reports, rendered on the process pool and cached on disk per session version
+report_exporter = ReportExporter.from_env()
+
 UPLOAD_DIR = os.path.join(os.getcwd(), "backend", "data", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 class QueryRequest(BaseModel):
     question: str
     session_id: str = "default"
+    # Optional hybrid search overrides: chunks to return, [keyword, semantic] weights, "rrf" or "weighted"
+    k: Optional[int] = None
+    weights: Optional[list[float]] = None
+    fusion: Optional[str] = None
 
 class CompareRequest(BaseModel):
     filenames: list[str]
@@ -45,22 +59,23 @@ async def upload_documents(files: list[UploadFile] = File(...)):
                 shutil.copyfileobj(file.file, buffer)
             file_paths.append(file_path)
             
-            # Log to Supabase DB
+            # Log to the documents table
             try:
-                supabase.table("documents").insert({
-                    "user_id": user_id,
-                    "filename": file.filename,
-                    "storage_path": file_path,
-                    "size_bytes": os.path.getsize(file_path)
-                }).execute()
+                await repository.add_document(user_id, file.filename, file_path, os.path.getsize(file_path))
             except Exception as db_error:
                 # Don't crash the upload if DB logging fails (e.g. unknown mock user)
                 logger.warning(f"Failed to log document to DB: {db_error}")
 
         filenames = [f.filename for f in files if f.filename]
-        await rag_service.process_pdfs(file_paths, user_id)
-        
-        return {"message": f"Successfully processed {len(files)} files", "filenames": filenames}
+        # Parsing and embedding run on the ingestion workers; poll /jobs/{job_id} for progress
+        job = ingestion_queue.submit(user_id, file_paths)
+
+        return {
+            "message": f"Queued {len(files)} files for processing",
+            "filenames": filenames,
+            "job_id": job.id,
+            "status": job.status,
+        }
     except Exception as e:
         logger.exception(f"Upload failed for user {user_id}: {str(e)}")
         error_msg = str(e)
@@ -71,52 +86,214 @@ async def upload_documents(files: list[UploadFile] = File(...)):
              )
         raise HTTPException(status_code=500, detail=error_msg)
 
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Returns stage-level progress for an ingestion job."""
+    job = ingestion_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancels a queued or running ingestion job."""
+    job = ingestion_queue.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@router.get("/stats/residency")
+async def residency_stats():
+    """Vector store residency: resident users/bytes, hit rate, loads and evictions."""
+    return rag_service.residency.stats()
+
+@router.get("/stats/answer-cache")
+async def answer_cache_stats():
+    """Answer cache entries, exact/semantic hit rate, evictions and invalidations."""
+    return rag_service.answer_cache.stats()
+
+@router.get("/stats/retrieval-cache")
+async def retrieval_cache_stats():
+    """Query embedding and retrieval (top-k chunk ids) cache hit rates."""
+    return {
+        "query_embeddings": rag_service.query_embedding_cache.stats(),
+        "retrieval": rag_service.retrieval_cache.stats(),
+    }
+
+@router.get("/stats/context")
+async def context_stats():
+    """Prompt context packing: chunks deduplicated/merged/dropped and estimated tokens in and out."""
+    return rag_service.context_packer.stats()
+
+@router.get("/stats/reranker")
+async def reranker_stats():
+    """Reranker timing per query and per scored pair, batches and score cache hit rate."""
+    if not rag_service.reranker:
+        return {"enabled": False}
+    return {"enabled": True, **rag_service.reranker.stats()}
+
+@router.get("/stats/chat-writes")
+async def chat_write_stats():
+    """Queue depth, batch sizes and failures of the write-behind chat history."""
+    return chat_writer.stats()
+
+@router.get("/stats/history")
+async def history_stats():
+    """Chat history cache: cached sessions, hit rate, loads and pages that needed the database."""
+    return chat_history.stats()
+
+@router.get("/stats/reports")
+async def report_stats():
+    """PDF report cache: cached reports and bytes, hit rate, renders and average render time."""
+    return report_exporter.stats()
+
+@router.get("/stats/compare")
+async def compare_stats():
+    """Map-step concurrency, LLM summary calls and the per-document summary cache."""
+    return rag_service.comparison.stats()
+
+@router.delete("/documents/{filename}")
+async def delete_document(filename: str):
+    """Removes a document from the user's index without rebuilding the rest."""
+    # Authentication disabled for testing - Using demo user ID from DB
+    user_id = "8625119c-5b13-4bc2-a21f-0abbf282a0cb"
+    try:
+        result = await rag_service.delete_document(user_id, filename)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    try:
+        await repository.delete_document(user_id, filename)
+    except Exception as db_error:
+        logger.warning(f"Failed to remove document row from DB: {db_error}")
+
+    file_path = os.path.join(UPLOAD_DIR, str(user_id), filename)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    return result
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(sources: list, tokens, on_complete=None) -> StreamingResponse:
+    """Streams `sources` first, then a `token` event per LLM chunk, then `done`.
+
+    on_complete(answer) is awaited after the last token and before `done`; a failure
+    while generating ends the stream with an `error` event instead.
+    """
+    async def events():
+        yield sse_event("sources", sources)
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+            if on_complete:
+                await on_complete("".join(parts))
+        except Exception as e:
+            logger.exception(f"Streaming response failed: {e}")
+            yield sse_event("error", {"detail": str(e)})
+            return
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/query")
 async def query_documents(request: QueryRequest):
     try:
         # Authentication disabled for testing - Using demo user ID from DB
         user_id = "8625119c-5b13-4bc2-a21f-0abbf282a0cb"
-        response = rag_service.query(request.question, user_id=user_id)
+        response = await rag_service.query(
+            request.question, user_id=user_id, k=request.k, weights=request.weights, fusion=request.fusion
+        )
         
-        # Persist message to Supabase
+        # Queue the exchange for the session; it is written in the background
         if request.session_id:
-            # 1. Ensure the session exists
-            try:
-                session_check = supabase.table("chat_sessions").select("id").eq("id", request.session_id).execute()
-                if not session_check.data:
-                    supabase.table("chat_sessions").insert({
-                        "id": request.session_id,
-                        "user_id": user_id,
-                        "title": "New Chat Session"
-                    }).execute()
-            except Exception as session_err:
-                logger.warning(f"Failed to ensure session existence: {session_err}")
-
-            # 2. Insert messages
-            supabase.table("chat_messages").insert({
-                "session_id": request.session_id,
-                "role": "user",
-                "content": request.question
-            }).execute()
-            
-            supabase.table("chat_messages").insert({
-                "session_id": request.session_id,
-                "role": "assistant",
-                "content": response["answer"],
-                "sources": response["sources"]
-            }).execute()
-            
+            await chat_writer.enqueue(request.session_id, user_id, request.question, response)
+
         return response
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Like /query, as Server-Sent Events: sources once retrieval is done, then answer tokens.
+
+    The messages are saved to the session after the answer completes.
+    """
+    # Authentication disabled for testing - Using demo user ID from DB
+    user_id = "8625119c-5b13-4bc2-a21f-0abbf282a0cb"
+    try:
+        sources, tokens = await rag_service.query_stream(
+            request.question, user_id=user_id, k=request.k, weights=request.weights, fusion=request.fusion
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def persist(answer: str):
+        if request.session_id:
+            response = {"answer": answer, "sources": sources}
+            await chat_writer.enqueue(request.session_id, user_id, request.question, response)
+
+    return sse_response(sources, tokens, on_complete=persist)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
 @router.get("/history/{session_id}")
-async def get_history(session_id: str):
+async def get_history(
+    session_id: str,
+    request: Request,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    sources: bool = True,
+):
+    """The session's messages in order: all of them, or one page when paging parameters are given.
+
+    Without before, after or limit the response is the JSON array of every message, as it
+    has always been. With any of them it is one page, {session_id, messages, older_cursor,
+    newer_cursor}, newest page first: pass older_cursor back as `before` to page further
+    back, and newer_cursor as `after` to fetch only new messages. With sources=false
+    messages are sent without their sources; load them with /history/{session_id}/sources.
+    Answers 304 when If-None-Match matches.
+    """
+    paged = before is not None or after is not None or limit is not None
     try:
-        res = supabase.table("chat_messages").select("*").eq("session_id", session_id).order("created_at").execute()
-        return res.data
+        if paged:
+            etag = await chat_history.page_etag(session_id, before, after, limit, sources)
+        else:
+            etag = await chat_history.session_etag(session_id, sources)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        if paged:
+            body = await chat_history.page(session_id, before, after, limit, sources)
+            body.pop("etag")
+        else:
+            body = await chat_history.all_messages(session_id, sources)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(body, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@router.get("/history/{session_id}/sources")
+async def get_history_sources(session_id: str, ids: list[str] = Query(...)):
+    """Sources of the given messages, for history pages fetched with sources=false."""
+    try:
+        return await chat_history.sources(session_id, ids)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -125,38 +302,64 @@ async def compare_documents(request: CompareRequest):
     try:
         # Authentication disabled for testing - Using demo user ID from DB
         user_id = "8625119c-5b13-4bc2-a21f-0abbf282a0cb"
-        response = rag_service.compare_documents(
+        response = await rag_service.compare_documents(
             user_id=user_id, 
             filenames=request.filenames, 
             aspect=request.aspect
         )
         return response
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/export/{session_id}")
-async def export_report(session_id: str):
-    """Generates a professional PDF report of the chat session."""
-    from fastapi.responses import StreamingResponse
-    from backend.app.utils.reporting import generate_session_report
-    
+@router.post("/compare/stream")
+async def compare_documents_stream(request: CompareRequest):
+    """Like /compare, as Server-Sent Events (see /query/stream)."""
+    # Authentication disabled for testing - Using demo user ID from DB
+    user_id = "8625119c-5b13-4bc2-a21f-0abbf282a0cb"
     try:
-        # Fetch session title and history
-        session_res = supabase.table("chat_sessions").select("title").eq("id", session_id).single().execute()
-        res = supabase.table("chat_messages").select("*").eq("session_id", session_id).order("created_at").execute()
-        
-        messages = res.data
-        title = session_res.data.get("title") if session_res.data else "Research Report"
-        
-        pdf_buffer = generate_session_report(title, messages)
-        
-        return StreamingResponse(
-            pdf_buffer, 
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=Project_Report_{session_id[:8]}.pdf"}
+        sources, tokens = await rag_service.compare_stream(
+            user_id=user_id,
+            filenames=request.filenames,
+            aspect=request.aspect
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return sse_response(sources, tokens)
+
+@router.get("/export/{session_id}")
+async def export_report(session_id: str, request: Request):
+    """Generates a professional PDF report of the chat session.
+
+    Rendered once per version of the session and then served from the report cache;
+    answers 304 when If-None-Match matches.
+    """
+    from fastapi.responses import FileResponse
+
+    try:
+        # The title is part of the report, so renaming a session gives it a new version
+        session = await repository.get_session(session_id)
+        title = session.get("title") if session else "Research Report"
+        key = report_exporter.key(session_id, await chat_history.last_message_id(session_id), title)
+        etag = f'"{key}"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        async def load():
+            return title, await chat_history.all_messages(session_id)
+
+        path = await report_exporter.export(key, load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=f"Project_Report_{session_id[:8]}.pdf",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
 
 @router.get("/files/{filename}")
 async def get_file(filename: str):
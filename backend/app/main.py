@@ -1,6 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.app.api.v1.endpoints import router as api_router
+from fastapi.responses import PlainTextResponse
+from backend.app.api.v1.endpoints import router as api_router, chat_writer, repository
+from backend.app.services.executors import shutdown_executors
+from backend.app.services.telemetry import configure_logging, shutdown_logging, stage_metrics
+
+configure_logging()
 
 app = FastAPI(title="AI Document Intelligence API", version="1.0.0")
 
@@ -13,8 +18,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Write out queued chat messages before the thread pool goes away
+    await chat_writer.close()
+    await repository.close()
+    shutdown_executors()
+    shutdown_logging()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage, per-user latency histograms in the Prometheus text format."""
+    return PlainTextResponse(stage_metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router, prefix="/api/v1")
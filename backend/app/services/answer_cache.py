@@ -0,0 +1,138 @@
+import os
+import re
+import copy
+import time
+from collections import OrderedDict
+import numpy as np
+from backend.app.services.embedding_cache import normalize_text
+
+TRAILING_PUNCTUATION_RE = re.compile(r"[\s?!.]+$")
+
+
+def normalize_question(question: str) -> str:
+    # "What is X?", "what is x" and "What is  X ?" are the same question
+    return TRAILING_PUNCTUATION_RE.sub("", normalize_text(question).lower())
+
+
+class CachedAnswer:
+    def __init__(self, result: dict, vector):
+        self.result = result
+        self.vector = vector
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    """Per-user cache of query answers, checked before retrieval and the LLM call.
+
+    Tier 1 is an exact match on the normalized question. Tier 2 embeds the question and
+    returns the answer of the most similar cached question if its cosine similarity is at
+    least similarity_threshold. Entries are scoped by user and by the user's index version,
+    so any upload or delete drops that user's answers. Entries expire after ttl_seconds and
+    the least recently used are evicted past max_entries.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # (user_id, normalized question) -> CachedAnswer, in LRU order
+        self.entries = OrderedDict()
+        self.user_versions = {}
+        # user_id -> (keys, unit-normalized vectors), rebuilt lazily after changes
+        self._matrices = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+        )
+
+    def _check_version(self, user_id: str, version: int):
+        """Drops the user's answers if their index changed since they were cached."""
+        if self.user_versions.get(user_id, version) != version:
+            stale = [key for key in self.entries if key[0] == user_id]
+            for key in stale:
+                del self.entries[key]
+            self._matrices.pop(user_id, None)
+            self.invalidations += len(stale)
+        self.user_versions[user_id] = version
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl_seconds:
+            del self.entries[key]
+            self._matrices.pop(key[0], None)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, user_id: str, version: int, question: str):
+        self._check_version(user_id, version)
+        entry = self._live((user_id, normalize_question(question)))
+        if entry is None:
+            return None
+        self.exact_hits += 1
+        return copy.deepcopy(entry.result)
+
+    def get_similar(self, user_id: str, version: int, vector):
+        """Answer of the closest cached question above the threshold; counts a miss otherwise."""
+        self._check_version(user_id, version)
+        matrix = self._matrices.get(user_id)
+        if matrix is None:
+            keys = [key for key, entry in self.entries.items() if key[0] == user_id and entry.vector is not None]
+            vectors = None
+            if keys:
+                vectors = np.array([self.entries[key].vector for key in keys], dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            matrix = self._matrices[user_id] = (keys, vectors)
+        keys, vectors = matrix
+        if keys:
+            query = np.asarray(vector, dtype=np.float32)
+            similarities = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                entry = self._live(keys[best])
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return copy.deepcopy(entry.result)
+        self.misses += 1
+        return None
+
+    def put(self, user_id: str, version: int, question: str, vector, result: dict):
+        if version < self.user_versions.get(user_id, version):
+            # Answered from an index that has changed since
+            return
+        self._check_version(user_id, version)
+        key = (user_id, normalize_question(question))
+        self.entries[key] = CachedAnswer(copy.deepcopy(result), vector)
+        self.entries.move_to_end(key)
+        self._matrices.pop(user_id, None)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self._matrices.pop(evicted[0], None)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,355 @@
+import os
+import re
+import json
+import math
+import shutil
+from collections import Counter, defaultdict
+from itertools import chain
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+
+BM25_DIR = "bm25"
+# Names the committed version directory, bm25.<version>
+POINTER = "bm25.json"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _max_per_term(offsets, tfs):
+    """Largest term frequency in each postings list (every list is non-empty)."""
+    if len(tfs) == 0:
+        return np.zeros(len(offsets) - 1, dtype=np.float32)
+    return np.maximum.reduceat(np.asarray(tfs), np.asarray(offsets[:-1])).astype(np.float32)
+
+
+def _read_pointer(index_path: str):
+    pointer = os.path.join(index_path, POINTER)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        return json.load(f)["version"]
+
+
+def _kth_largest(values, k: int):
+    return np.partition(values, len(values) - k)[len(values) - k]
+
+
+def _merge_scores(rows, scores, new_rows, new_scores):
+    """Adds a postings list's scores into sorted candidate rows, inserting rows not seen yet."""
+    if not len(rows):
+        return new_rows.astype(np.int32), new_scores.astype(np.float32)
+    positions = np.searchsorted(rows, new_rows)
+    inside = positions < len(rows)
+    found = np.zeros(len(new_rows), dtype=bool)
+    found[inside] = rows[positions[inside]] == new_rows[inside]
+    scores = scores.copy()
+    scores[positions[found]] += new_scores[found]
+    new = ~found
+    return np.insert(rows, positions[new], new_rows[new]), np.insert(scores, positions[new], new_scores[new])
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring.
+
+    Postings are stored CSR-style: for term id t, postings live in docs/tfs[offsets[t]:offsets[t+1]],
+    sorted by row. Rows are positions in doc_ids, the chunk ids shared with the FAISS docstore.
+    Saved as .npy arrays next to the FAISS index and memory-mapped on load, so a cold start
+    does not re-tokenize the corpus.
+
+    Queries use term-at-a-time MaxScore pruning: once the k-th best partial score beats the
+    best score the remaining terms could add, no unseen document can enter the top k, and
+    the remaining postings are only probed (binary search) at the surviving candidates.
+    Adds tokenize just the new chunks and merge postings with array copies; deletes are
+    tombstones until enough accumulate to compact.
+    """
+
+    def __init__(self, terms, offsets, docs, tfs, doc_lens, doc_ids, deleted=None, max_tf=None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.doc_ids = doc_ids
+        self.deleted = deleted if deleted is not None else np.zeros(len(doc_ids), dtype=bool)
+        self.max_tf = max_tf if max_tf is not None else _max_per_term(offsets, tfs)
+        self.k1 = k1
+        self.b = b
+        self._refresh_stats()
+        self._rows = None
+
+    def _refresh_stats(self):
+        live = ~self.deleted
+        self.num_live = int(live.sum())
+        self.avgdl = float(self.doc_lens[live].mean()) if self.num_live else 0.0
+        self.deleted_rows = np.flatnonzero(self.deleted)
+
+    @property
+    def num_docs(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, doc_ids: list[str], texts: list[str]):
+        term_docs = defaultdict(list)
+        term_tfs = defaultdict(list)
+        doc_lens = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_docs[term].append(row)
+                term_tfs[term].append(tf)
+
+        # Sorted vocabulary keeps the on-disk layout deterministic
+        terms = sorted(term_docs)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_docs[t]) for t in terms])
+        total = int(offsets[-1])
+        docs = np.fromiter(chain.from_iterable(term_docs[t] for t in terms), dtype=np.int32, count=total)
+        tfs = np.fromiter(chain.from_iterable(term_tfs[t] for t in terms), dtype=np.float32, count=total)
+        return cls(terms, offsets, docs, tfs, doc_lens, list(doc_ids))
+
+    def add(self, doc_ids: list[str], texts: list[str]):
+        """Appends chunks. Only the new texts are tokenized; existing postings are block-copied."""
+        if not doc_ids:
+            return
+        delta = BM25Index.build(doc_ids, texts)
+        base_rows = self.num_docs
+        terms = sorted(set(self.terms).union(delta.terms))
+        term_ids = {term: i for i, term in enumerate(terms)}
+        old_map = np.fromiter((term_ids[t] for t in self.terms), dtype=np.int64, count=len(self.terms))
+        new_map = np.fromiter((term_ids[t] for t in delta.terms), dtype=np.int64, count=len(delta.terms))
+
+        old_lens = np.diff(np.asarray(self.offsets))
+        new_lens = np.diff(delta.offsets)
+        old_lens_merged = np.zeros(len(terms), dtype=np.int64)
+        old_lens_merged[old_map] = old_lens
+        lens = old_lens_merged.copy()
+        lens[new_map] += new_lens
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lens)
+
+        docs = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.float32)
+        # Existing postings keep their order at the front of each merged list...
+        owner = np.repeat(np.arange(len(self.terms)), old_lens)
+        dest = offsets[old_map][owner] + (np.arange(len(owner)) - np.asarray(self.offsets[:-1])[owner])
+        docs[dest] = self.docs
+        tfs[dest] = self.tfs
+        # ...and the new rows (all larger) follow, so every list stays sorted by row
+        owner = np.repeat(np.arange(len(delta.terms)), new_lens)
+        dest = (offsets[new_map] + old_lens_merged[new_map])[owner] + (np.arange(len(owner)) - delta.offsets[:-1][owner])
+        docs[dest] = delta.docs + base_rows
+        tfs[dest] = delta.tfs
+
+        max_tf = np.zeros(len(terms), dtype=np.float32)
+        max_tf[old_map] = self.max_tf
+        max_tf[new_map] = np.maximum(max_tf[new_map], delta.max_tf)
+
+        self.terms, self.term_ids = terms, term_ids
+        self.offsets, self.docs, self.tfs, self.max_tf = offsets, docs, tfs, max_tf
+        self.doc_lens = np.concatenate([np.asarray(self.doc_lens), delta.doc_lens])
+        self.doc_ids = self.doc_ids + delta.doc_ids
+        self.deleted = np.concatenate([self.deleted, delta.deleted])
+        self._rows = None
+        self._refresh_stats()
+
+    def delete(self, doc_ids: list[str], compact_ratio: float = 0.2):
+        """Tombstones chunks; compacts once more than compact_ratio of rows are deleted."""
+        if self._rows is None:
+            self._rows = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+        rows = [self._rows[d] for d in doc_ids if d in self._rows]
+        if not rows:
+            return
+        self.deleted = np.array(self.deleted, copy=True)
+        self.deleted[rows] = True
+        if self.deleted.sum() > compact_ratio * self.num_docs:
+            self.compact()
+        else:
+            self._refresh_stats()
+
+    def compact(self):
+        """Drops tombstoned rows from every postings list without re-tokenizing."""
+        keep_rows = ~self.deleted
+        new_row = np.cumsum(keep_rows, dtype=np.int64) - 1
+        owner = np.repeat(np.arange(len(self.terms)), np.diff(np.asarray(self.offsets)))
+        keep = keep_rows[self.docs]
+        lens = np.bincount(owner[keep], minlength=len(self.terms))
+        keep_terms = lens > 0
+        self.terms = [t for t, kept in zip(self.terms, keep_terms) if kept]
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lens[keep_terms])
+        self.docs = new_row[np.asarray(self.docs)[keep]].astype(np.int32)
+        self.tfs = np.asarray(self.tfs)[keep]
+        self.max_tf = _max_per_term(self.offsets, self.tfs)
+        self.doc_lens = np.asarray(self.doc_lens)[keep_rows]
+        self.doc_ids = [d for d, kept in zip(self.doc_ids, keep_rows) if kept]
+        self.deleted = np.zeros(len(self.doc_ids), dtype=bool)
+        self._rows = None
+        self._refresh_stats()
+
+    def save(self, index_path: str):
+        """Writes the index as a new version directory, then points bm25.json at it.
+
+        Replacing the pointer is the commit: a crash leaves the previous version in place,
+        and retrievers still mapping an older directory keep reading valid files.
+        """
+        current = _read_pointer(index_path)
+        version = current + 1 if current else 1
+        path = os.path.join(index_path, f"{BM25_DIR}.{version}")
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "docs.npy"), self.docs)
+        np.save(os.path.join(path, "tfs.npy"), self.tfs)
+        np.save(os.path.join(path, "max_tf.npy"), self.max_tf)
+        np.save(os.path.join(path, "doc_lens.npy"), self.doc_lens)
+        np.save(os.path.join(path, "deleted.npy"), self.deleted)
+        with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f)
+        with open(os.path.join(path, "doc_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.doc_ids, f)
+        pointer = os.path.join(index_path, POINTER)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": version}, f)
+        os.replace(pointer + ".tmp", pointer)
+
+        # Older versions are unreferenced now. Where the OS refuses to delete files that are
+        # still mapped (Windows), they stay until a later save finds them free
+        for name in os.listdir(index_path):
+            if name == BM25_DIR or (name.startswith(f"{BM25_DIR}.") and name not in (f"{BM25_DIR}.{version}", POINTER)):
+                stale = os.path.join(index_path, name)
+                if os.path.isdir(stale):
+                    shutil.rmtree(stale, ignore_errors=True)
+
+    @classmethod
+    def load(cls, index_path: str):
+        """Loads a saved index with the postings memory-mapped. Returns None if none is saved."""
+        version = _read_pointer(index_path)
+        # Indexes saved before versioning live in bm25/
+        path = os.path.join(index_path, f"{BM25_DIR}.{version}" if version else BM25_DIR)
+        if not os.path.exists(os.path.join(path, "terms.json")):
+            return None
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        with open(os.path.join(path, "doc_ids.json"), "r", encoding="utf-8") as f:
+            doc_ids = json.load(f)
+
+        def optional(name):
+            file_path = os.path.join(path, name)
+            return np.load(file_path) if os.path.exists(file_path) else None
+
+        return cls(
+            terms,
+            np.load(os.path.join(path, "offsets.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "docs.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "tfs.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "doc_lens.npy")),
+            doc_ids,
+            deleted=optional("deleted.npy"),
+            max_tf=optional("max_tf.npy"),
+        )
+
+    def idf(self, df: int) -> float:
+        # Lucene's variant: always positive, unlike rank_bm25's Okapi idf for very common terms.
+        # Postings keep tombstoned rows until compaction, so df counts them and N must too
+        # (Lucene's maxDoc); with live rows as N a common term's idf goes negative
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def _term_scores(self, tf, rows, idf):
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens[rows] / self.avgdl)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query: str, k: int = 3, prune: bool = True):
+        """Returns up to k (chunk_id, score) pairs with a positive score, best first."""
+        if not self.num_live or k <= 0:
+            return []
+        k = min(k, self.num_live)
+
+        query_terms = []
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            idf = self.idf(end - start)
+            # dl >= 0 bounds the length norm below by k1 * (1 - b), independent of avgdl
+            max_tf = float(self.max_tf[term_id])
+            upper = max(0.0, idf * max_tf * (self.k1 + 1) / (max_tf + self.k1 * (1 - self.b)))
+            query_terms.append((upper, idf, start, end))
+        if not query_terms:
+            return []
+        # Highest-impact terms first, so the threshold rises as early as possible
+        query_terms.sort(key=lambda t: -t[0])
+        remaining = sum(t[0] for t in query_terms)
+
+        # Partial scores are kept only for candidate rows, sorted: a query costs the postings
+        # it reads, not a pass over the whole corpus
+        rows = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float32)
+        pruned = False
+        for upper, idf, start, end in query_terms:
+            remaining -= upper
+            docs = np.asarray(self.docs[start:end])
+            tfs = np.asarray(self.tfs[start:end])
+            if not pruned:
+                if len(self.deleted_rows):
+                    live = ~self.deleted[docs]
+                    docs, tfs = docs[live], tfs[live]
+                rows, scores = _merge_scores(rows, scores, docs, self._term_scores(tfs, docs, idf))
+                if not prune or len(rows) < k:
+                    continue
+                threshold = _kth_largest(scores, k)
+                if threshold > 0 and remaining < threshold:
+                    # No unseen document can reach the top k any more: only probe the candidates
+                    keep = scores + remaining >= threshold
+                    rows, scores = rows[keep], scores[keep]
+                    pruned = True
+            else:
+                positions = np.searchsorted(docs, rows)
+                inside = np.flatnonzero(positions < len(docs))
+                hits = inside[docs[positions[inside]] == rows[inside]]
+                if len(hits):
+                    scores[hits] += self._term_scores(tfs[positions[hits]], rows[hits], idf)
+                if len(rows) > k:
+                    keep = scores + remaining >= _kth_largest(scores, k)
+                    rows, scores = rows[keep], scores[keep]
+
+        if not len(rows):
+            return []
+        # Everything tied with the k-th score, ordered by score then row, keeps ties deterministic
+        top = np.flatnonzero(scores >= _kth_largest(scores, min(k, len(rows))))
+        top = top[np.lexsort((rows[top], -scores[top]))][:k]
+        return [(self.doc_ids[rows[i]], float(scores[i])) for i in top if scores[i] > 0]
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """LangChain retriever over a BM25Index, resolving chunk ids through the FAISS docstore."""
+
+    index: BM25Index
+    docstore: object
+    k: int = 3
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def get_documents_with_scores(self, query: str, k: int = None) -> list[tuple[Document, float]]:
+        """Top-k (chunk, BM25 score) pairs without the callback machinery of invoke()."""
+        hits = []
+        for doc_id, score in self.index.search(query, k or self.k):
+            doc = self.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                hits.append((doc, score))
+        return hits
+
+    def get_documents(self, query: str, k: int = None) -> list[Document]:
+        return [doc for doc, _ in self.get_documents_with_scores(query, k)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list[Document]:
+        return self.get_documents(query)
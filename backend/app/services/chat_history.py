@@ -0,0 +1,218 @@
+import os
+import time
+import hashlib
+from backend.app.services.retrieval import LRUCache
+from backend.app.services.telemetry import stage_metrics
+
+def message_key(message: dict) -> tuple:
+    """Position of a message in history: created_at, then id for messages sharing a timestamp."""
+    return message["created_at"], message["id"]
+
+
+def encode_cursor(message: dict) -> str:
+    return "|".join(message_key(message))
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) of a cursor. Raises ValueError for malformed cursors."""
+    created_at, _, message_id = cursor.partition("|")
+    if not created_at or not message_id:
+        raise ValueError(f"Invalid history cursor '{cursor}'")
+    return created_at, message_id
+
+
+class ChatHistory:
+    """Paged chat history reads through an in-process cache of each session's newest messages.
+
+    A cached session holds its newest `tail_size` messages (all of them when the session is
+    shorter), loaded with one query the first time it is read. ChatHistoryWriter writes
+    through: append() adds exchanges when they are queued, so a cached session is current
+    before its messages are durable, and settle() drops a session whose write failed.
+    Exchanges still queued are also merged into sessions loaded from the database, so a
+    reload never misses an answer that is waiting for its batch. Pages use cursors naming a
+    message's (created_at, id), so messages sharing a timestamp are neither skipped nor
+    repeated: `before` pages back through older history, `after` fetches what is new.
+    Entries are re-read after `ttl` seconds, to pick up writes from other processes.
+    """
+
+    def __init__(self, repository, max_sessions: int = 500, tail_size: int = 200, page_size: int = 50,
+                 ttl: float = 300.0):
+        self.repository = repository
+        self.tail_size = tail_size
+        self.page_size = page_size
+        self.ttl = ttl
+        # session id -> {"messages": newest messages in order, "complete": whole session?, "loaded_at"}
+        self.sessions = LRUCache(max_sessions)
+        # Queued but not yet written messages, by session id then message id
+        self.pending = {}
+        # Messages appended while a session is being loaded, merged when the load finishes
+        self._loading = {}
+        self.loads = 0
+        self.database_pages = 0
+        self.appended = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, repository):
+        return cls(
+            repository,
+            max_sessions=int(os.getenv("HISTORY_CACHE_SESSIONS", "500")),
+            tail_size=int(os.getenv("HISTORY_CACHE_MESSAGES", "200")),
+            page_size=int(os.getenv("HISTORY_PAGE_SIZE", "50")),
+            ttl=float(os.getenv("HISTORY_CACHE_TTL", "300")),
+        )
+
+    def append(self, session_id: str, messages: list[dict]):
+        """Records messages queued for writing (called by ChatHistoryWriter.enqueue)."""
+        self.pending.setdefault(session_id, {}).update((m["id"], m) for m in messages)
+        for loading in self._loading.get(session_id, []):
+            loading.extend(messages)
+        entry = self.sessions.entries.get(session_id)
+        if entry is not None:
+            merged = entry["messages"] + messages
+            entry["messages"] = merged[-self.tail_size:]
+            entry["complete"] = entry["complete"] and len(merged) <= self.tail_size
+            self.appended += len(messages)
+
+    def settle(self, session_id: str, messages: list[dict], written: bool):
+        """Marks queued messages as written, or drops the session from the cache if they were not."""
+        queued = self.pending.get(session_id, {})
+        for message in messages:
+            queued.pop(message["id"], None)
+        if not queued:
+            self.pending.pop(session_id, None)
+        if not written and self.sessions.entries.pop(session_id, None) is not None:
+            self.invalidations += 1
+
+    def _merge(self, messages: list[dict], extra: list[dict]) -> list[dict]:
+        seen = {m["id"] for m in messages}
+        missing = [m for m in extra if m["id"] not in seen]
+        if not missing:
+            return messages
+        return sorted(messages + missing, key=message_key)
+
+    async def _session(self, session_id: str) -> dict:
+        entry = self.sessions.get(session_id)
+        if entry is not None and time.monotonic() - entry["loaded_at"] < self.ttl:
+            return entry
+        queued = list(self.pending.get(session_id, {}).values())
+        loading = []
+        self._loading.setdefault(session_id, []).append(loading)
+        try:
+            with stage_metrics.span("history_load"):
+                # One more than the tail, to know whether it is the whole session
+                messages = await self.repository.list_messages(session_id, limit=self.tail_size + 1)
+        finally:
+            self._loading[session_id].remove(loading)
+            if not self._loading[session_id]:
+                del self._loading[session_id]
+        self.loads += 1
+        complete = len(messages) <= self.tail_size
+        messages = self._merge(messages[-self.tail_size:], queued + loading)
+        entry = {"messages": messages[-self.tail_size:], "complete": complete and len(messages) <= self.tail_size,
+                 "loaded_at": time.monotonic()}
+        self.sessions.put(session_id, entry)
+        return entry
+
+    async def page(self, session_id: str, before: str = None, after: str = None, limit: int = None,
+                   include_sources: bool = True) -> dict:
+        """Up to `limit` messages: the newest before `before`, or the oldest after `after`.
+
+        Served from the cached tail whenever it covers the page; only pages reaching past it
+        query the database. older_cursor pages further back (None at the start of the
+        session, and for `after` pages); newer_cursor is where to poll for new messages from.
+        """
+        limit = min(limit or self.page_size, self.tail_size)
+        before_key = decode_cursor(before) if before else None
+        after_key = decode_cursor(after) if after else None
+        entry = await self._session(session_id)
+        tail = entry["messages"]
+        if after_key:
+            # The tail is the newest stretch of the session: it covers everything after a cursor inside it
+            if entry["complete"] or (tail and message_key(tail[0]) <= after_key):
+                messages = [m for m in tail if message_key(m) > after_key][:limit]
+            else:
+                messages = await self._database_page(session_id, None, after_key, limit, include_sources)
+            has_older = False
+        else:
+            older = [m for m in tail if not before_key or message_key(m) < before_key]
+            if entry["complete"] or len(older) >= limit:
+                messages = older[-limit:]
+                has_older = len(older) > limit or not entry["complete"]
+            else:
+                page = await self._database_page(session_id, before_key, None, limit + 1, include_sources)
+                messages, has_older = page[-limit:], len(page) > limit
+        return {
+            "session_id": session_id,
+            "messages": _without_sources(messages) if not include_sources else messages,
+            "older_cursor": encode_cursor(messages[0]) if messages and has_older else None,
+            "newer_cursor": encode_cursor(messages[-1]) if messages else after,
+            "etag": self.etag(entry, before, after, limit, include_sources),
+        }
+
+    async def _database_page(self, session_id, before, after, limit, include_sources):
+        self.database_pages += 1
+        return await self.repository.list_messages(session_id, before=before, after=after, limit=limit,
+                                                   include_sources=include_sources)
+
+    def etag(self, entry: dict, *params) -> str:
+        # Messages are append-only, so the newest message identifies every page's content
+        newest = entry["messages"][-1]["id"] if entry["messages"] else ""
+        return '"' + hashlib.sha1(repr((newest, *params)).encode()).hexdigest()[:20] + '"'
+
+    async def page_etag(self, session_id: str, before: str = None, after: str = None, limit: int = None,
+                        include_sources: bool = True) -> str:
+        """The ETag page() would return, without building the page."""
+        for cursor in (before, after):
+            if cursor:
+                decode_cursor(cursor)
+        limit = min(limit or self.page_size, self.tail_size)
+        return self.etag(await self._session(session_id), before, after, limit, include_sources)
+
+    async def session_etag(self, session_id: str, include_sources: bool = True) -> str:
+        """The ETag of the whole session, as all_messages() returns it."""
+        return self.etag(await self._session(session_id), "all", include_sources)
+
+    async def last_message_id(self, session_id: str) -> str:
+        """Id of the session's newest message ("" when it has none); changes with every append."""
+        tail = (await self._session(session_id))["messages"]
+        return tail[-1]["id"] if tail else ""
+
+    async def all_messages(self, session_id: str, include_sources: bool = True) -> list[dict]:
+        """The whole session in order, from the cache when it holds all of it."""
+        entry = await self._session(session_id)
+        if entry["complete"]:
+            messages = list(entry["messages"])
+        else:
+            self.database_pages += 1
+            messages = self._merge(await self.repository.list_messages(session_id),
+                                   list(self.pending.get(session_id, {}).values()))
+        return messages if include_sources else _without_sources(messages)
+
+    async def sources(self, session_id: str, message_ids: list[str]) -> dict:
+        """{message id: sources}, for pages fetched without them."""
+        entry = self.sessions.entries.get(session_id)
+        cached = {m["id"]: m["sources"] for m in entry["messages"]} if entry else {}
+        cached.update((m["id"], m["sources"]) for m in self.pending.get(session_id, {}).values())
+        found = {i: cached[i] for i in message_ids if i in cached}
+        missing = [i for i in message_ids if i not in found]
+        if missing:
+            found.update(await self.repository.get_sources(session_id, missing))
+        return found
+
+    def stats(self):
+        return {
+            **self.sessions.stats(),
+            "tail_size": self.tail_size,
+            "page_size": self.page_size,
+            "ttl_s": self.ttl,
+            "loads": self.loads,
+            "database_pages": self.database_pages,
+            "appended": self.appended,
+            "pending_sessions": len(self.pending),
+            "invalidations": self.invalidations,
+        }
+
+
+def _without_sources(messages: list[dict]) -> list[dict]:
+    return [{k: v for k, v in m.items() if k != "sources"} for m in messages]
@@ -0,0 +1,229 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from backend.app.services.retrieval import LRUCache
+from backend.app.services.telemetry import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TITLE = "New Chat Session"
+
+
+class ChatHistoryWriter:
+    """Write-behind persistence of question/answer pairs.
+
+    enqueue() returns as soon as the exchange is queued; a background task writes
+    everything queued once batch_size exchanges are waiting or flush_interval seconds
+    after the first, as one session upsert for sessions not seen before plus one bulk
+    message insert. The queue is bounded: when it is full, enqueue() waits rather than
+    dropping messages. If a batch fails, its sessions are retried one by one so a bad
+    row only holds back its own exchanges. Those are queued again after an exponential
+    backoff (retry_delay doubling up to max_retry_delay) and dropped, and counted, only
+    after max_attempts writes or when a write fails during close(). Ids and timestamps
+    are assigned at enqueue time, which keeps history order when many messages land in
+    one insert and makes a retried insert write the same rows. With a ChatHistory, queued
+    messages are appended to it straight away and settled once written or dropped.
+    """
+
+    def __init__(self, repository, history=None, max_queue: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 0.5, known_sessions: int = 10000, max_attempts: int = 5,
+                 retry_delay: float = 1.0, max_retry_delay: float = 30.0):
+        self.repository = repository
+        self.history = history
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # Session ids already written, so their upsert is skipped
+        self.known_sessions = LRUCache(known_sessions)
+        self._queue = None
+        self._wake = None
+        self._worker = None
+        # Tasks waiting out a backoff before queueing failed exchanges again
+        self._retries = set()
+        self._closing = None
+        self.enqueued = 0
+        self.written = 0
+        self.retried = 0
+        self.dropped = 0
+        self.batches = 0
+        self.sessions_created = 0
+        self.flush_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, repository, history=None):
+        return cls(
+            repository,
+            history,
+            max_queue=int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.5")),
+            max_attempts=int(os.getenv("CHAT_WRITE_MAX_ATTEMPTS", "5")),
+            retry_delay=float(os.getenv("CHAT_WRITE_RETRY_DELAY", "1.0")),
+            max_retry_delay=float(os.getenv("CHAT_WRITE_MAX_RETRY_DELAY", "30")),
+        )
+
+    def _ensure_worker(self):
+        # Started lazily so the queue binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._wake = asyncio.Event()
+            self._closing = asyncio.Event()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(self, session_id: str, user_id: str, question: str, response: dict):
+        """Queues a question and its answer for the session, creating the session if needed."""
+        self._ensure_worker()
+        asked_at = datetime.now(timezone.utc)
+        messages = [
+            {"id": str(uuid.uuid4()), "session_id": session_id, "role": "user", "content": question,
+             "sources": [], "created_at": asked_at.isoformat(timespec="microseconds")},
+            {"id": str(uuid.uuid4()), "session_id": session_id, "role": "assistant", "content": response["answer"],
+             "sources": response["sources"],
+             "created_at": (asked_at + timedelta(microseconds=1)).isoformat(timespec="microseconds")},
+        ]
+        await self._queue.put({
+            "session": {"id": session_id, "user_id": user_id, "title": DEFAULT_SESSION_TITLE},
+            "messages": messages,
+            "attempts": 0,
+        })
+        if self.history is not None:
+            self.history.append(session_id, messages)
+        self.enqueued += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self):
+        """Waits until everything queued so far is written or dropped, retries included."""
+        if self._queue is None:
+            return
+        self._ensure_worker()
+        while True:
+            self._wake.set()
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.wait(set(self._retries))
+
+    async def close(self):
+        """Writes out the queue, retrying backed-off exchanges at once; what fails now is dropped."""
+        if self._closing is not None:
+            self._closing.set()
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.exception(f"Chat history batch of {len(batch)} failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if self._queue.qsize() >= self.batch_size:
+                self._wake.set()
+
+    async def _write_exchanges(self, exchanges: list[dict]):
+        sessions = {}
+        for exchange in exchanges:
+            session = exchange["session"]
+            if self.known_sessions.get(session["id"]) is None:
+                sessions.setdefault(session["id"], session)
+        if sessions:
+            await self.repository.ensure_sessions(list(sessions.values()))
+            for session_id in sessions:
+                self.known_sessions.put(session_id, True)
+            self.sessions_created += len(sessions)
+        await self.repository.insert_messages([message for exchange in exchanges for message in exchange["messages"]])
+
+    async def _write(self, batch: list[dict]):
+        start = time.perf_counter()
+        try:
+            with stage_metrics.span("persist"):
+                await self._write_exchanges(batch)
+            self.written += len(batch)
+            self._settle(batch, True)
+        except Exception as batch_error:
+            logger.warning(f"Chat history batch insert failed ({batch_error}), retrying per session")
+            by_session = {}
+            for exchange in batch:
+                by_session.setdefault(exchange["session"]["id"], []).append(exchange)
+            for session_id, exchanges in by_session.items():
+                try:
+                    await self._write_exchanges(exchanges)
+                    self.written += len(exchanges)
+                    self._settle(exchanges, True)
+                except Exception as e:
+                    self._failed(session_id, exchanges, e)
+        self.batches += 1
+        self.flush_seconds += time.perf_counter() - start
+
+    def _failed(self, session_id: str, exchanges: list[dict], error: Exception):
+        """Schedules a session's failed exchanges for another attempt, or drops them."""
+        attempts = max(exchange["attempts"] for exchange in exchanges) + 1
+        if attempts >= self.max_attempts or self._closing.is_set():
+            self.dropped += len(exchanges)
+            self._settle(exchanges, False)
+            logger.error(f"Dropped {len(exchanges)} chat exchanges for session {session_id} "
+                         f"after {attempts} attempts: {error}")
+            return
+        for exchange in exchanges:
+            exchange["attempts"] = attempts
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        logger.warning(f"Writing {len(exchanges)} chat exchanges for session {session_id} failed ({error}), "
+                       f"retrying in {delay:g}s")
+        self.retried += len(exchanges)
+        retry = asyncio.create_task(self._requeue(exchanges, delay))
+        self._retries.add(retry)
+        retry.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, exchanges: list[dict], delay: float):
+        # close() cuts the wait short, so shutdown gives every exchange a last attempt
+        try:
+            await asyncio.wait_for(self._closing.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        for exchange in exchanges:
+            await self._queue.put(exchange)
+        self._wake.set()
+
+    def _settle(self, exchanges: list[dict], written: bool):
+        if self.history is None:
+            return
+        for exchange in exchanges:
+            self.history.settle(exchange["session"]["id"], exchange["messages"], written)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval_s": self.flush_interval,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "retrying": len(self._retries),
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "sessions_created": self.sessions_created,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "avg_flush_ms": round(self.flush_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "known_sessions": self.known_sessions.stats(),
+        }
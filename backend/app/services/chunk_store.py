@@ -0,0 +1,325 @@
+import os
+import json
+import weakref
+import hashlib
+from collections.abc import Mapping
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+# One fixed-width record per chunk, pointing into the text/metadata/id blobs
+ROW_DTYPE = np.dtype([
+    ("text_off", "<u8"), ("text_len", "<u4"),
+    ("meta_off", "<u8"), ("meta_len", "<u4"),
+    ("id_off", "<u8"), ("id_len", "<u4"),
+    ("id_hash", "<i8"),
+])
+BLOBS = ("text", "meta", "ids")
+# Rewrite everything as one segment once this share of the rows on disk belongs to deleted
+# chunks, or once a store has this many segments
+COMPACT_RATIO = 0.5
+MAX_SEGMENTS = 16
+# Every ChunkStore still open in this process; save_chunk_store keeps the files they map
+_open_stores = weakref.WeakSet()
+
+
+def id_hash(chunk_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def _file(path: str, prefix: str, name: str) -> str:
+    return os.path.join(path, f"{prefix}.{name}")
+
+
+def _map(file_path: str, dtype, count: int):
+    # np.memmap can't map zero bytes
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode="r", shape=(count,))
+
+
+def read_state(path: str, prefix: str = "index"):
+    state_path = _file(path, prefix, "state.json")
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _segments(state: dict) -> list[dict]:
+    # States saved before segments describe one blob set that each save appended to
+    if "segments" in state:
+        return state["segments"]
+    return [{"id": state["blobs"], "rows": state["rows"],
+             **{f"{name}_bytes": state[f"{name}_bytes"] for name in BLOBS}}]
+
+
+def _state_files(prefix: str, state: dict) -> set:
+    """Names of the files a saved version reads."""
+    files = {f"{prefix}.{state['version']}.live.npy", state["faiss"]}
+    files.update(f"{prefix}.{segment['id']}.{name}.bin" for segment in _segments(state) for name in BLOBS + ("rows",))
+    return files
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """Append-only columnar chunk store, used as the FAISS docstore instead of a pickle.
+
+    Chunk text, JSON metadata and ids are concatenated into three blobs, with a fixed-width
+    row per chunk holding their offsets and lengths. Everything is memory-mapped on open, so
+    loading is O(1) and a search only decodes the rows it returns. A small per-version
+    "live" array maps FAISS positions to rows and holds rows sorted by id hash for lookups.
+
+    Rows live in segments, one per save that added chunks, each with its own row and blob
+    files; row numbers run on across segments. Adds and deletes made after opening are kept
+    in memory until save_chunk_store writes the new rows as a segment and commits the next
+    version. Files are never modified once written, and files an older version still needs
+    are deleted only once no store in this process has them open, so readers of an older
+    version keep valid mappings (Windows refuses to truncate or delete mapped files).
+    """
+
+    def __init__(self, path: str, state: dict, prefix: str = "index"):
+        self.path = path
+        self.prefix = prefix
+        self.state = state
+        segments = _segments(state)
+        self.row_starts = np.cumsum([0] + [segment["rows"] for segment in segments])
+        self.rows = [
+            _map(_file(path, prefix, f"{segment['id']}.rows.bin"), ROW_DTYPE, segment["rows"])
+            for segment in segments
+        ]
+        self.blobs = [
+            {name: _map(_file(path, prefix, f"{segment['id']}.{name}.bin"), np.uint8, segment[f"{name}_bytes"])
+             for name in BLOBS}
+            for segment in segments
+        ]
+        live_path = _file(path, prefix, f"{state['version']}.live.npy")
+        live = np.load(live_path, mmap_mode="r") if state["live"] else np.zeros((4, 0), dtype=np.int64)
+        self.hash_keys, self.hash_rows, self.pos_keys, self.pos_rows = live
+        # Changes since the store was opened, written out by save_chunk_store
+        self.added = {}
+        self.deleted_rows = set()
+        _open_stores.add(self)
+
+    @classmethod
+    def open(cls, path: str, prefix: str = "index"):
+        """Opens the latest saved version, or returns None if nothing is saved in path."""
+        state = read_state(path, prefix)
+        return cls(path, state, prefix) if state else None
+
+    def files(self) -> set:
+        """Names of the files this store reads, kept on disk while it is open."""
+        return _state_files(self.prefix, self.state)
+
+    def _record(self, row: int):
+        segment = int(np.searchsorted(self.row_starts, row, side="right")) - 1
+        return self.blobs[segment], self.rows[segment][row - self.row_starts[segment]]
+
+    def _blob(self, blobs: dict, name: str, offset, length) -> str:
+        return blobs[name][int(offset):int(offset) + int(length)].tobytes().decode("utf-8")
+
+    def _id_at(self, row: int) -> str:
+        blobs, record = self._record(row)
+        return self._blob(blobs, "ids", record["id_off"], record["id_len"])
+
+    def _doc_at(self, row: int) -> Document:
+        blobs, record = self._record(row)
+        return Document(
+            id=self._blob(blobs, "ids", record["id_off"], record["id_len"]),
+            page_content=self._blob(blobs, "text", record["text_off"], record["text_len"]),
+            metadata=json.loads(self._blob(blobs, "meta", record["meta_off"], record["meta_len"])),
+        )
+
+    def id_hashes(self, rows: np.ndarray) -> np.ndarray:
+        """Id hashes of committed rows, read from their row records."""
+        hashes = np.zeros(len(rows), dtype=np.int64)
+        segments = np.searchsorted(self.row_starts, rows, side="right") - 1
+        for i, segment_rows in enumerate(self.rows):
+            in_segment = segments == i
+            hashes[in_segment] = segment_rows["id_hash"][rows[in_segment] - self.row_starts[i]]
+        return hashes
+
+    def _find_row(self, chunk_id: str):
+        """Row of a committed, not deleted chunk, found by binary search on its id hash."""
+        h = id_hash(chunk_id)
+        start = int(np.searchsorted(self.hash_keys, h, side="left"))
+        end = int(np.searchsorted(self.hash_keys, h, side="right"))
+        for i in range(start, end):
+            row = int(self.hash_rows[i])
+            if row not in self.deleted_rows and self._id_at(row) == chunk_id:
+                return row
+        return None
+
+    def search(self, search: str):
+        if search in self.added:
+            return self.added[search]
+        row = self._find_row(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self._doc_at(row)
+
+    def add(self, texts: dict) -> None:
+        overlapping = [i for i in texts if i in self.added or self._find_row(i) is not None]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.added.update(texts)
+
+    def delete(self, ids: list) -> None:
+        found = False
+        for chunk_id in ids:
+            if self.added.pop(chunk_id, None) is not None:
+                found = True
+                continue
+            row = self._find_row(chunk_id)
+            if row is not None:
+                self.deleted_rows.add(row)
+                found = True
+        if not found:
+            raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+
+    def __len__(self):
+        return len(self.hash_keys) - len(self.deleted_rows) + len(self.added)
+
+    def position_map(self):
+        """Read-only FAISS position -> chunk id view; decodes ids only when looked up."""
+        return ChunkIdMap(self)
+
+    def position_dict(self) -> dict:
+        """FAISS position -> chunk id as a plain dict, for stores that will be modified."""
+        return {int(p): self._id_at(int(r)) for p, r in zip(self.pos_keys, self.pos_rows)}
+
+    def committed_rows(self) -> dict:
+        """Chunk id -> row for every committed chunk that is not deleted."""
+        return {
+            self._id_at(int(row)): int(row)
+            for row in self.hash_rows if int(row) not in self.deleted_rows
+        }
+
+
+class ChunkIdMap(Mapping):
+    """index_to_docstore_id for a read-only store, backed by the live array."""
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __getitem__(self, position):
+        keys = self.store.pos_keys
+        i = int(np.searchsorted(keys, position))
+        if i == len(keys) or keys[i] != position:
+            raise KeyError(position)
+        return self.store._id_at(int(self.store.pos_rows[i]))
+
+    def __iter__(self):
+        return iter(self.store.pos_keys.tolist())
+
+    def __len__(self):
+        return len(self.store.pos_keys)
+
+
+def _write_segment(path: str, prefix: str, segment: dict, chunk_ids: list, docs: list) -> np.ndarray:
+    """Writes chunks as a new segment's row and blob files and returns their id hashes."""
+    encoded = {
+        "text": [doc.page_content.encode("utf-8") for doc in docs],
+        "meta": [json.dumps(doc.metadata, ensure_ascii=False).encode("utf-8") for doc in docs],
+        "ids": [chunk_id.encode("utf-8") for chunk_id in chunk_ids],
+    }
+    records = np.zeros(len(docs), dtype=ROW_DTYPE)
+    records["id_hash"] = [id_hash(chunk_id) for chunk_id in chunk_ids]
+    columns = {"text": "text", "meta": "meta", "ids": "id"}
+    for name, parts in encoded.items():
+        lengths = np.fromiter((len(p) for p in parts), dtype=np.int64, count=len(parts))
+        records[f"{columns[name]}_off"] = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(parts) else 0
+        records[f"{columns[name]}_len"] = lengths
+        # A new segment's files are not committed yet, so no store maps them
+        with open(_file(path, prefix, f"{segment['id']}.{name}.bin"), "wb") as f:
+            f.write(b"".join(parts))
+        segment[f"{name}_bytes"] = int(lengths.sum())
+    with open(_file(path, prefix, f"{segment['id']}.rows.bin"), "wb") as f:
+        f.write(records.tobytes())
+    segment["rows"] = len(docs)
+    return records["id_hash"]
+
+
+def save_chunk_store(path: str, docstore, index_to_docstore_id, write_index, prefix: str = "index",
+                     extra: dict = None) -> dict:
+    """Persists the chunks referenced by index_to_docstore_id as the next store version.
+
+    write_index(file_path) is called to write the FAISS index for this version; the
+    state file written last is the commit point for both. extra is recorded in the state.
+    Returns the new state.
+    """
+    os.makedirs(path, exist_ok=True)
+    old = read_state(path, prefix)
+    version = old["version"] + 1 if old else 1
+    positions = np.fromiter(index_to_docstore_id.keys(), dtype=np.int64, count=len(index_to_docstore_id))
+    chunk_ids = list(index_to_docstore_id.values())
+    old_segments = _segments(old) if old else []
+    segment = {"id": max((s["id"] for s in old_segments), default=0) + 1}
+
+    # Keep the current segments and add one for the new chunks when this store was opened on
+    # the current version and deletes are few; otherwise (first save, pickled store, many dead
+    # rows or segments) write everything as a single fresh segment
+    rows = None
+    if (isinstance(docstore, ChunkStore) and old and os.path.samefile(docstore.path, path)
+            and docstore.state["version"] == old["version"] and len(old_segments) < MAX_SEGMENTS):
+        committed = docstore.committed_rows()
+        rows = np.array([committed.get(chunk_id, -1) for chunk_id in chunk_ids], dtype=np.int64)
+        new = np.flatnonzero(rows < 0)
+        total = int(docstore.row_starts[-1])
+        dead = total - (len(chunk_ids) - len(new))
+        if dead > COMPACT_RATIO * total:
+            rows = None
+    if rows is not None:
+        segments = list(old_segments)
+        hashes = np.zeros(len(chunk_ids), dtype=np.int64)
+        kept = rows >= 0
+        hashes[kept] = docstore.id_hashes(rows[kept])
+        if len(new):
+            new_ids = [chunk_ids[i] for i in new]
+            hashes[new] = _write_segment(path, prefix, segment, new_ids, [docstore.search(i) for i in new_ids])
+            rows[new] = np.arange(total, total + len(new))
+            segments.append(segment)
+    else:
+        docs = [docstore.search(chunk_id) for chunk_id in chunk_ids]
+        missing = [chunk_id for chunk_id, doc in zip(chunk_ids, docs) if not isinstance(doc, Document)]
+        if missing:
+            raise ValueError(f"Could not find documents for ids: {missing[:5]}")
+        hashes = _write_segment(path, prefix, segment, chunk_ids, docs)
+        rows = np.arange(len(chunk_ids), dtype=np.int64)
+        segments = [segment]
+
+    by_hash = np.lexsort((rows, hashes))
+    by_position = np.argsort(positions, kind="stable")
+    live = np.stack([hashes[by_hash], rows[by_hash], positions[by_position], rows[by_position]])
+    np.save(_file(path, prefix, f"{version}.live.npy"), live)
+    faiss_name = f"{prefix}.{version}.faiss"
+    write_index(os.path.join(path, faiss_name))
+
+    state = {**(extra or {}), "version": version, "live": len(chunk_ids), "faiss": faiss_name, "segments": segments}
+    state_path = _file(path, prefix, "state.json")
+    with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(state_path + ".tmp", state_path)
+    remove_unused(path, prefix)
+    return state
+
+
+def remove_unused(path: str, prefix: str = "index"):
+    """Deletes files of older versions (and a pickled index.faiss/index.pkl pair) nothing reads.
+
+    Files a store in this process still has open are kept for a later call to remove, as
+    are files the OS refuses to delete because another process maps them.
+    """
+    state = read_state(path, prefix)
+    if state is None:
+        return
+    keep = {f"{prefix}.state.json"} | _state_files(prefix, state)
+    folder = os.path.abspath(path)
+    for store in list(_open_stores):
+        if store.prefix == prefix and os.path.abspath(store.path) == folder:
+            keep |= store.files()
+    for name in os.listdir(path):
+        if name.startswith(f"{prefix}.") and name not in keep:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
@@ -0,0 +1,111 @@
+import os
+import asyncio
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from backend.app.services.retrieval import LRUCache
+from backend.app.services.answer_cache import normalize_question
+
+MAP_PROMPT = ChatPromptTemplate.from_template(
+    """You are analysing the document "{filename}".
+Using only the excerpts below, summarize what this document says about: {aspect}.
+Keep its specific claims, figures, positions and caveats. If the excerpts don't address the topic, say so.
+
+Excerpts:
+{context}"""
+)
+
+REDUCE_PROMPT = ChatPromptTemplate.from_template(
+    """Analyze the following documents: {filenames}.
+Focus specifically on: {aspect}.
+
+Each document has been summarized below with respect to that focus.
+
+{summaries}
+
+Identify:
+1. Key similarities / Consensus points.
+2. Significant contradictions or differing viewpoints.
+3. Unique insights found in only one of the documents.
+
+Structure your response with clear headings and bullet points."""
+)
+
+NO_EVIDENCE = "No indexed content relevant to this aspect was found in this document."
+
+
+def evidence_query(aspect: str) -> str:
+    # Independent of which other files are selected, so a document's evidence and
+    # summary depend only on the document and the aspect
+    return f"What does this document say about {aspect}?"
+
+
+class MapReduceComparison:
+    """Cross-document comparison that scales with the number of files.
+
+    Map: each document's evidence is summarized with respect to the aspect, concurrently,
+    with at most max_concurrency LLM calls in flight across all requests. Summaries are
+    cached by (document sha256, aspect), so re-comparing a file against others is free.
+    Reduce: one streamed call compares the summaries.
+    """
+
+    def __init__(self, max_concurrency: int = 4, cache_size: int = 1024):
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.summary_cache = LRUCache(cache_size)
+        self._llm = None
+        self._map_chain = None
+        self._reduce_chain = None
+        self.map_calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=int(os.getenv("COMPARE_MAP_CONCURRENCY", "4")),
+            cache_size=int(os.getenv("COMPARE_SUMMARY_CACHE_SIZE", "1024")),
+        )
+
+    def _chains(self, llm):
+        if self._llm is not llm:
+            self._map_chain = create_stuff_documents_chain(llm, MAP_PROMPT)
+            self._reduce_chain = REDUCE_PROMPT | llm | StrOutputParser()
+            self._llm = llm
+        return self._map_chain, self._reduce_chain
+
+    async def _summarize(self, llm, filename: str, sha256: str, docs, aspect: str) -> str:
+        if not docs:
+            return NO_EVIDENCE
+        key = (getattr(llm, "model", type(llm).__name__), sha256, normalize_question(aspect)) if sha256 else None
+        summary = self.summary_cache.get(key) if key else None
+        if summary is not None:
+            return summary
+        map_chain, _ = self._chains(llm)
+        async with self.semaphore:
+            self.map_calls += 1
+            summary = await map_chain.ainvoke({"context": docs, "filename": filename, "aspect": aspect})
+        if key:
+            self.summary_cache.put(key, summary)
+        return summary
+
+    async def summarize(self, llm, documents: list, aspect: str) -> list[tuple[str, str]]:
+        """(filename, summary) for each (filename, sha256, evidence docs), in input order."""
+        summaries = await asyncio.gather(*(
+            self._summarize(llm, filename, sha256, docs, aspect) for filename, sha256, docs in documents
+        ))
+        return [(filename, summary) for (filename, _, _), summary in zip(documents, summaries)]
+
+    def reduce(self, llm, summaries: list[tuple[str, str]], aspect: str):
+        """Async iterator over the comparison's tokens."""
+        _, reduce_chain = self._chains(llm)
+        return reduce_chain.astream({
+            "filenames": ", ".join(filename for filename, _ in summaries),
+            "aspect": aspect,
+            "summaries": "\n\n".join(f"### {filename}\n{summary}" for filename, summary in summaries),
+        })
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "map_calls": self.map_calls,
+            "summary_cache": self.summary_cache.stats(),
+        }
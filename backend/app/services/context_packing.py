@@ -0,0 +1,148 @@
+import os
+import math
+from langchain_core.documents import Document
+from backend.app.services.document_manifest import chunk_source
+from backend.app.services.pdf_pipeline import CHUNK_OVERLAP
+
+# Gemini's tokenizer isn't available offline; ~4 characters per token is its documented average
+CHARS_PER_TOKEN = 4
+# Shortest shared boundary treated as splitter overlap rather than coincidence
+MIN_OVERLAP = 20
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def chunk_index(doc: Document):
+    """Position of the chunk within its document, from a chunk_id()-style id."""
+    if doc.id and chunk_source(doc.id) is not None:
+        return int(doc.id.rsplit("#", 1)[1])
+    return None
+
+
+def overlap_length(left: str, right: str, max_overlap: int = CHUNK_OVERLAP * 2) -> int:
+    """Length of the longest suffix of left that is a prefix of right (0 below MIN_OVERLAP)."""
+    if len(left) < MIN_OVERLAP or len(right) < MIN_OVERLAP:
+        return 0
+    probe = right[:MIN_OVERLAP]
+    start = len(left) - min(len(left), len(right), max_overlap)
+    i = left.find(probe, start)
+    while i != -1:
+        if right.startswith(left[i:]):
+            return len(left) - i
+        i = left.find(probe, i + 1)
+    return 0
+
+
+class ContextPacker:
+    """Turns fused retrieval results into the context actually sent to the LLM.
+
+    Chunks are deduplicated by id and by text. Neighbouring chunks from the same page
+    (consecutive chunk ids, or text sharing the splitter's overlap) are merged into one
+    passage with the overlap removed. With a token_budget, passages are then added
+    best-ranked first while they fit; a merged passage ranks as its best chunk. Without one
+    (the default, unless CONTEXT_TOKEN_BUDGET is set) every passage is kept, so packing only
+    drops repeated text. Token counts before and after are kept for /stats/context.
+    """
+
+    def __init__(self, token_budget: int = None):
+        self.token_budget = token_budget
+        self.calls = 0
+        self.chunks_in = 0
+        self.chunks_out = 0
+        self.duplicates = 0
+        self.merged = 0
+        self.over_budget = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    @classmethod
+    def from_env(cls):
+        budget = os.getenv("CONTEXT_TOKEN_BUDGET")
+        return cls(token_budget=int(budget) if budget else None)
+
+    def _dedup(self, docs: list[Document]) -> list[Document]:
+        seen_ids, seen_texts, unique = set(), set(), []
+        for doc in docs:
+            if (doc.id and doc.id in seen_ids) or doc.page_content in seen_texts:
+                self.duplicates += 1
+                continue
+            seen_ids.add(doc.id)
+            seen_texts.add(doc.page_content)
+            unique.append(doc)
+        return unique
+
+    def _merge(self, docs: list[Document]) -> list[tuple[int, Document]]:
+        """(rank, passage) pairs, merging neighbouring chunks of the same page."""
+        pages = {}
+        for rank, doc in enumerate(docs):
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            pages.setdefault(key, []).append((rank, doc, chunk_index(doc)))
+
+        passages = []
+        for members in pages.values():
+            # Document order where ids give it, otherwise retrieval order
+            members.sort(key=lambda member: (member[2] is None, member[2] or 0, member[0]))
+            rank, doc, last_index = members[0]
+            text = doc.page_content
+            for next_rank, next_doc, next_index in members[1:]:
+                overlap = overlap_length(text, next_doc.page_content)
+                # Without ids the order is unknown, so the next chunk may also precede the passage
+                preceding = overlap_length(next_doc.page_content, text) if not overlap and next_index is None else 0
+                if overlap or preceding or (last_index is not None and next_index == last_index + 1):
+                    if preceding:
+                        text = next_doc.page_content + text[preceding:]
+                    else:
+                        text += next_doc.page_content[overlap:] if overlap else "\n" + next_doc.page_content
+                    rank = min(rank, next_rank)
+                    self.merged += 1
+                elif next_doc.page_content in text:
+                    self.duplicates += 1
+                    continue
+                else:
+                    passages.append((rank, Document(id=doc.id, page_content=text, metadata=doc.metadata)))
+                    rank, doc, text = next_rank, next_doc, next_doc.page_content
+                last_index = next_index
+            passages.append((rank, Document(id=doc.id, page_content=text, metadata=doc.metadata)))
+        passages.sort(key=lambda passage: passage[0])
+        return passages
+
+    def pack(self, docs: list[Document]) -> list[Document]:
+        """Deduplicated, merged passages within the token budget (if any), best first."""
+        self.calls += 1
+        self.chunks_in += len(docs)
+        self.tokens_in += sum(estimate_tokens(doc.page_content) for doc in docs)
+
+        packed, used = [], 0
+        for _, passage in self._merge(self._dedup(docs)):
+            tokens = estimate_tokens(passage.page_content)
+            if self.token_budget is not None and used + tokens > self.token_budget:
+                if packed:
+                    self.over_budget += 1
+                    continue
+                # Always answer from something: cut the best passage down to the budget
+                passage = Document(id=passage.id, page_content=passage.page_content[:self.token_budget * CHARS_PER_TOKEN],
+                                   metadata=passage.metadata)
+                tokens = estimate_tokens(passage.page_content)
+            packed.append(passage)
+            used += tokens
+
+        self.chunks_out += len(packed)
+        self.tokens_out += used
+        return packed
+
+    def stats(self):
+        return {
+            "token_budget": self.token_budget,
+            "calls": self.calls,
+            "chunks_in": self.chunks_in,
+            "chunks_out": self.chunks_out,
+            "duplicates_dropped": self.duplicates,
+            "chunks_merged": self.merged,
+            "over_budget_dropped": self.over_budget,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "avg_tokens_out": round(self.tokens_out / self.calls, 1) if self.calls else 0.0,
+            "token_reduction": round(1 - self.tokens_out / self.tokens_in, 4) if self.tokens_in else 0.0,
+        }
@@ -0,0 +1,70 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(filename: str, sha256: str, n: int) -> str:
+    """Stable FAISS docstore id for the n-th chunk of a document version."""
+    return f"{filename}#{sha256[:12]}#{n}"
+
+
+def chunk_source(chunk_id_: str):
+    """The filename a chunk_id() belongs to, or None if chunk_id_ isn't in that format."""
+    parts = chunk_id_.rsplit("#", 2)
+    if len(parts) == 3 and len(parts[1]) == 12 and parts[2].isdigit():
+        return parts[0]
+    return None
+
+
+class DocumentManifest:
+    """Per-user record of which documents are indexed, their content hash and chunk ids.
+
+    Stored as manifest.json next to the FAISS index. `version` is bumped on every change
+    to the user's corpus, so caches can key on it.
+    """
+
+    def __init__(self, path: str, version: int = 0, documents: dict = None):
+        self.path = path
+        self.version = version
+        self.documents = documents or {}
+
+    @classmethod
+    def load(cls, index_path: str):
+        path = os.path.join(index_path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data.get("version", 0), data.get("documents", {}))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Write-then-rename so a crash never leaves a half-written manifest
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, filename: str, sha256: str) -> bool:
+        entry = self.documents.get(filename)
+        return entry is not None and entry["sha256"] == sha256
+
+    def chunk_ids(self, filename: str) -> list[str]:
+        entry = self.documents.get(filename)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def set(self, filename: str, sha256: str, chunk_ids: list[str], pages: int):
+        self.documents[filename] = {"sha256": sha256, "chunk_ids": chunk_ids, "pages": pages}
+
+    def remove(self, filename: str):
+        return self.documents.pop(filename, None)
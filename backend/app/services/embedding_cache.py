@@ -0,0 +1,186 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from backend.app.services.executors import run_in_thread
+from backend.app.services.embedding_scheduler import EmbeddingError
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("backend", "data", "embedding_cache.sqlite"))
+CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace-only differences (re-wrapped lines, trailing spaces) must not miss the cache
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent content-addressed embedding cache.
+
+    Vectors are stored as float32 blobs in SQLite, keyed by sha256(model, normalized text),
+    so identical chunks across uploads and users are embedded once. The total blob size is
+    bounded by max_bytes; least recently used entries are evicted past the bound.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = int(CACHE_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def get_many(self, model: str, texts: list[str]) -> dict:
+        """Returns {index: vector} for every text already in the cache."""
+        keys = [cache_key(model, t) for t in texts]
+        found = {}
+        with self._lock:
+            unique = list(set(keys))
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        result = {i: found[key] for i, key in enumerate(keys) if key in found}
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, model: str, texts: list[str], vectors):
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows[cache_key(model, text)] = (model, blob, len(blob), now)
+        with self._lock:
+            existing = 0
+            for start in range(0, len(rows), 500):
+                part = list(rows)[start:start + 500]
+                existing += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()],
+            )
+            self.total_bytes += sum(row[2] for row in rows.values()) - existing
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Evict down to 90% of the bound so we don't evict again on the very next insert
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            victims = []
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                victims.append((key,))
+                self.total_bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self.evictions += len(victims)
+
+    async def embed(self, model: str, texts: list[str], embed_fn, progress_callback=None):
+        """Returns vectors for texts, calling `await embed_fn(missing_texts)` only for cache misses.
+
+        progress_callback(done, total) counts every text, cached ones included; when it is given,
+        embed_fn is called with progress_callback= too. If embed_fn raises EmbeddingError, the
+        vectors it did get are cached before the error is re-raised, with `partial` mapped to
+        indices of `texts`.
+        """
+        cached = await run_in_thread(self.get_many, model, texts)
+        missing = [i for i in range(len(texts)) if i not in cached]
+
+        def report(done):
+            if progress_callback:
+                progress_callback(done, len(texts))
+
+        report(len(cached))
+        if missing:
+            # Identical chunks within one call are embedded once
+            unique = {}
+            for i in missing:
+                unique.setdefault(normalize_text(texts[i]), texts[i])
+            unique_texts = list(unique.values())
+
+            def unique_progress(done, _total):
+                # Duplicates finish with their first copy, so scale to the missing chunk count
+                report(len(cached) + done * len(missing) // len(unique_texts))
+
+            try:
+                if progress_callback:
+                    vectors = await embed_fn(unique_texts, progress_callback=unique_progress)
+                else:
+                    vectors = await embed_fn(unique_texts)
+            except EmbeddingError as e:
+                done = sorted(e.partial)
+                if done:
+                    await run_in_thread(self.put_many, model, [unique_texts[j] for j in done],
+                                        [e.partial[j] for j in done])
+                by_text = {normalize_text(unique_texts[j]): e.partial[j] for j in done}
+                partial = dict(cached)
+                partial.update((i, by_text[normalize_text(texts[i])]) for i in missing
+                               if normalize_text(texts[i]) in by_text)
+                raise EmbeddingError(str(e), partial) from e
+            await run_in_thread(self.put_many, model, unique_texts, vectors)
+            by_text = {normalize_text(t): v for t, v in zip(unique_texts, vectors)}
+            for i in missing:
+                cached[i] = by_text[normalize_text(texts[i])]
+            report(len(texts))
+        return [cached[i] for i in range(len(texts))]
+
+
+_embedding_cache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -0,0 +1,281 @@
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # Requests larger than the bucket would never fit; let them drain it instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def drain(self, seconds: float):
+        """Empties the bucket and holds it for `seconds`, e.g. after the server says Retry-After."""
+        self._refill()
+        self.tokens = -seconds * self.rate
+
+
+class EmbeddingError(Exception):
+    """Raised when a batch exhausts its retries. `partial` maps text index -> vector for
+    everything that did succeed, so the caller can resume without re-embedding it."""
+
+    def __init__(self, message: str, partial: dict):
+        super().__init__(message)
+        self.partial = partial
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    if getattr(e, "response", None) is not None:
+        status = status or getattr(e.response, "status_code", None)
+    if status == 429 or str(status) == "429":
+        return True
+    message = str(e)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "rate limit" in message.lower()
+
+
+def retry_after_seconds(e: Exception):
+    """Server-suggested wait from a Retry-After header or Gemini's retry_delay, if any."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", str(e)) or \
+        re.search(r"retry in ([\d.]+)\s*s", str(e), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for quota accounting
+    return len(text) // 4 + 1
+
+
+class EmbeddingScheduler:
+    """Rate-limit-aware embedding client.
+
+    Splits texts into batches, keeps up to `max_concurrency` batches in flight while staying
+    under requests/min and tokens/min budgets, grows the batch size while calls succeed and
+    halves it once per rate-limit window: the first 429 sets a backoff deadline, and batches
+    rejected before it passes wait for the same deadline instead of halving again.
+    Rate-limited batches are retried with jittered exponential backoff (or the server's
+    Retry-After); batches that already succeeded are never re-sent. embed_resumable()
+    restarts a run that gave up from its EmbeddingError.partial after a cooldown.
+    """
+
+    def __init__(self, embed_fn, requests_per_minute: float = 1500, tokens_per_minute: float = 1_000_000,
+                 max_concurrency: int = 4, min_batch_size: int = 8, max_batch_size: int = 100,
+                 max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0, max_resumes: int = 2,
+                 resume_cooldown: float = None):
+        self.embed_fn = embed_fn
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size = min(50, max_batch_size)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_resumes = max_resumes
+        self.resume_cooldown = max_delay if resume_cooldown is None else resume_cooldown
+        self._semaphore = None
+        # Batches rate limited before this time belong to the same window and share its backoff
+        self._backoff_until = 0.0
+        self.metrics = {
+            "requests": 0,
+            "texts": 0,
+            "tokens": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "backoffs": 0,
+            "failures": 0,
+            "resumes": 0,
+            "api_seconds": 0.0,
+        }
+        self._first_call = None
+        self._last_done = None
+
+    @classmethod
+    def from_env(cls, embed_fn):
+        return cls(
+            embed_fn,
+            requests_per_minute=float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1500")),
+            tokens_per_minute=float(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000")),
+            max_concurrency=int(os.getenv("EMBED_MAX_CONCURRENCY", "4")),
+            max_batch_size=int(os.getenv("EMBED_MAX_BATCH_SIZE", "100")),
+            max_resumes=int(os.getenv("EMBED_RESUME_ATTEMPTS", "2")),
+            resume_cooldown=float(os.getenv("EMBED_RESUME_COOLDOWN", "60")),
+        )
+
+    def stats(self):
+        # Wall-clock throughput; api_seconds sums concurrent calls so it can exceed elapsed time
+        elapsed = (self._last_done - self._first_call) if self._last_done else 0.0
+        return {
+            **self.metrics,
+            "batch_size": self.batch_size,
+            "elapsed_seconds": round(elapsed, 3),
+            "texts_per_sec": round(self.metrics["texts"] / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        suggested = retry_after_seconds(e)
+        if suggested is not None:
+            return suggested + random.uniform(0, self.base_delay)
+        # Full jitter keeps concurrent batches from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _call(self, texts: list[str]):
+        tokens = sum(estimate_tokens(t) for t in texts)
+        await self.request_bucket.acquire(1)
+        await self.token_bucket.acquire(tokens)
+        start = time.perf_counter()
+        if self._first_call is None:
+            self._first_call = start
+        try:
+            vectors = await self.embed_fn(texts)
+        finally:
+            self._last_done = time.perf_counter()
+            self.metrics["requests"] += 1
+            self.metrics["api_seconds"] += self._last_done - start
+        self.metrics["texts"] += len(texts)
+        self.metrics["tokens"] += tokens
+        return vectors
+
+    async def _run_batch(self, texts, indices, results, progress, stop: asyncio.Event):
+        """Embeds texts[indices], splitting the batch on rate limits. Fills `results` in place.
+
+        Returns early, without sending anything more, once `stop` is set.
+        """
+        queue = [indices]
+        attempt = 0
+        while queue and not stop.is_set():
+            batch = queue.pop(0)
+            try:
+                async with self._semaphore:
+                    if stop.is_set():
+                        return
+                    vectors = await self._call([texts[i] for i in batch])
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    self.metrics["failures"] += 1
+                    raise
+                self.metrics["rate_limited"] += 1
+                if attempt >= self.max_retries:
+                    self.metrics["failures"] += 1
+                    raise EmbeddingError(f"Embedding batch still rate limited after {attempt} retries: {e}", results)
+                attempt += 1
+                self.metrics["retries"] += 1
+                now = time.monotonic()
+                if now >= self._backoff_until:
+                    # First 429 of this window: multiplicative decrease, and hold every batch
+                    self.metrics["backoffs"] += 1
+                    self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                    delay = self._backoff(attempt, e)
+                    self._backoff_until = now + delay
+                    self.request_bucket.drain(delay)
+                else:
+                    delay = self._backoff_until - now + random.uniform(0, self.base_delay)
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                # Retry the batch in pieces of the current size
+                if len(batch) > self.batch_size:
+                    queue = [batch[j:j + self.batch_size] for j in range(0, len(batch), self.batch_size)] + queue
+                else:
+                    queue.insert(0, batch)
+                continue
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+            # Retries are counted since the last piece of this batch that got through
+            attempt = 0
+            # Additive increase while the quota holds
+            self.batch_size = min(self.max_batch_size, self.batch_size + 4)
+            if progress:
+                progress(len(results))
+
+    async def embed(self, texts: list[str], completed: dict = None, progress_callback=None):
+        """Returns one vector per text, in order.
+
+        `completed` is an index -> vector map from an earlier EmbeddingError; those texts are
+        skipped. progress_callback(done, total) is called after every successful batch.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = dict(completed or {})
+        remaining = [i for i in range(len(texts)) if i not in results]
+
+        def progress(done):
+            if progress_callback:
+                progress_callback(done, len(texts))
+
+        # Cut batches at the current adaptive size; they run concurrently up to max_concurrency
+        batches = []
+        position = 0
+        while position < len(remaining):
+            batches.append(remaining[position:position + self.batch_size])
+            position += self.batch_size
+        stop = asyncio.Event()
+
+        async def run_batch(batch):
+            try:
+                await self._run_batch(texts, batch, results, progress, stop)
+            except Exception:
+                # No new requests, but let calls already in flight land in `results`:
+                # the API has done (and billed) that work, so it belongs in the partial result
+                stop.set()
+                raise
+
+        outcomes = await asyncio.gather(*[run_batch(batch) for batch in batches], return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if errors:
+            raise errors[0]
+        return [results[i] for i in range(len(texts))]
+
+    async def embed_resumable(self, texts: list[str], progress_callback=None):
+        """embed(), resumed up to max_resumes times from EmbeddingError.partial after resume_cooldown.
+
+        Only the texts that were not embedded yet are sent again; the final EmbeddingError
+        still carries everything that succeeded.
+        """
+        completed = {}
+        for resume in range(self.max_resumes + 1):
+            try:
+                return await self.embed(texts, completed, progress_callback)
+            except EmbeddingError as e:
+                completed = e.partial
+                if resume == self.max_resumes:
+                    raise
+                self.metrics["resumes"] += 1
+                logger.warning(f"Embedding gave up with {len(completed)}/{len(texts)} texts done ({e}); "
+                               f"resuming in {self.resume_cooldown:.0f}s")
+                await asyncio.sleep(self.resume_cooldown)
@@ -0,0 +1,48 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+# Blocking I/O and native code that releases the GIL (FAISS adds/searches, disk loads)
+THREAD_WORKERS = int(os.getenv("RAG_THREAD_WORKERS", "8"))
+# Pure-Python CPU work that holds the GIL (PDF parsing, text splitting)
+PROCESS_WORKERS = int(os.getenv("RAG_PROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+_thread_pool = None
+_process_pool = None
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="rag-io")
+    return _thread_pool
+
+
+def process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+    return _process_pool
+
+
+async def run_in_thread(fn, *args, **kwargs):
+    """Runs a blocking call on the bounded thread pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(thread_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_in_process(fn, *args, **kwargs):
+    """Runs a picklable CPU-bound call on the bounded process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool(), partial(fn, *args, **kwargs))
+
+
+def shutdown_executors():
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
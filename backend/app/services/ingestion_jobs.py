@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from backend.app.services.rag_service import rag_service
+
+logger = logging.getLogger(__name__)
+
+# Stages an ingestion job moves through, in order
+STAGES = ["load", "split", "embed", "index"]
+
+# Terminal job states - a job in one of these will never change again
+FINISHED_STATES = {"completed", "failed", "cancelled"}
+
+
+class IngestionJob:
+    """Tracks one upload batch from the queue through every ingestion stage."""
+
+    def __init__(self, user_id: str, file_paths: list[str]):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.file_paths = file_paths
+        self.status = "queued"
+        self.stage = None
+        self.stages = {name: {"status": "pending", "done": 0, "total": 0} for name in STAGES}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def report(self, stage: str, done: int, total: int):
+        """Progress callback handed to RAGService.process_pdfs.
+
+        Stages overlap (embedding starts while later pages are still parsing), so each
+        stage tracks its own progress and `stage` is the furthest one that has started.
+        A total of 0 means the total is not known yet.
+        """
+        if self.stage is None or STAGES.index(stage) > STAGES.index(self.stage):
+            self.stage = stage
+        self.stages[stage].update(
+            status="completed" if total and done >= total else "running",
+            done=done,
+            total=total,
+        )
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "filenames": [os.path.basename(p) for p in self.file_paths],
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionQueue:
+    """In-process job queue drained by a fixed pool of ingestion workers."""
+
+    def __init__(self, process_fn, num_workers: int = 2, max_jobs: int = 1000):
+        self.process_fn = process_fn
+        self.num_workers = num_workers
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self._queue = None
+        self._workers = []
+
+    def _ensure_workers(self):
+        # Workers are started lazily so the queue binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(i)) for i in range(self.num_workers)
+            ]
+
+    def submit(self, user_id: str, file_paths: list[str]) -> IngestionJob:
+        self._ensure_workers()
+        self._prune()
+        job = IngestionJob(user_id, file_paths)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Cancels a queued or running job. Returns the job, or None if unknown.
+
+        A job that has reached the "index" stage is committing its chunks to the user's index
+        and is left to finish: the commit is not interruptible.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES or job.stage == "index":
+            return job
+        if job.task is not None:
+            # Running: interrupt at the next await point inside process_pdfs
+            job.task.cancel()
+        else:
+            # Still queued: the worker will skip it when it is dequeued
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def _prune(self):
+        """Drops the oldest finished jobs once the history grows past max_jobs."""
+        if len(self.jobs) < self.max_jobs:
+            return
+        finished = sorted(
+            (j for j in self.jobs.values() if j.status in FINISHED_STATES),
+            key=lambda j: j.finished_at or 0,
+        )
+        for job in finished[:len(self.jobs) - self.max_jobs + 1]:
+            del self.jobs[job.id]
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = time.time()
+        job.task = asyncio.create_task(
+            self.process_fn(job.file_paths, job.user_id, progress_callback=job.report)
+        )
+        try:
+            await job.task
+            job.status = "completed"
+            for stage in job.stages.values():
+                stage["status"] = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            if job.stage:
+                job.stages[job.stage]["status"] = "cancelled"
+        except Exception as e:
+            logger.exception(f"Ingestion job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            if job.stage:
+                job.stages[job.stage]["status"] = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.task = None
+
+
+ingestion_queue = IngestionQueue(
+    rag_service.process_pdfs,
+    num_workers=int(os.getenv("INGESTION_WORKERS", "2")),
+)
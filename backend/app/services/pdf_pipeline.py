@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+from collections import deque
+from functools import lru_cache
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from backend.app.services.executors import process_pool, PROCESS_WORKERS
+from backend.app.services.telemetry import stage_metrics
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Pages parsed per process-pool task; small enough to spread one large PDF over every core
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+
+def count_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+@lru_cache(maxsize=2)
+def _open_pdf(file_path: str, mtime_ns: int, size: int):
+    """One reader and page label list per file in each worker, shared by its page-range tasks.
+
+    Keyed by mtime and size too, so a re-uploaded file is read again. page_labels is
+    rebuilt on every access, so it is read once here rather than once per page.
+    """
+    reader = PdfReader(file_path)
+    return reader, reader.page_labels
+
+
+def open_pdf(file_path: str):
+    stat = os.stat(file_path)
+    return _open_pdf(file_path, stat.st_mtime_ns, stat.st_size)
+
+
+def parse_page_range(file_path: str, start: int, end: int):
+    """Extracts and chunks pages [start, end) of a PDF. Runs in a worker process.
+
+    Chunks match what PyPDFLoader + RecursiveCharacterTextSplitter produce, because
+    the splitter never merges text across pages. Returns (chunks, parse seconds, split
+    seconds); the timings are recorded by the parent, which owns the metrics.
+    """
+    start_time = time.perf_counter()
+    reader, labels = open_pdf(file_path)
+    filename = os.path.basename(file_path)
+    total_pages = len(reader.pages)
+    pages = []
+    for page_number in range(start, min(end, total_pages)):
+        pages.append(Document(
+            page_content=reader.pages[page_number].extract_text(),
+            metadata={
+                "source": filename,
+                "page": page_number,
+                "page_label": labels[page_number],
+                "total_pages": total_pages,
+            },
+        ))
+    parsed_time = time.perf_counter()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = text_splitter.split_documents(pages)
+    return chunks, parsed_time - start_time, time.perf_counter() - parsed_time
+
+
+async def stream_pdf_chunks(file_paths: list[str], executor=None, pages_per_task: int = PAGES_PER_TASK,
+                            max_in_flight: int = None, user_id: str = None):
+    """Parses PDFs across a process pool and yields chunks as page ranges finish.
+
+    Yields (file_index, pages_done, total_pages, chunks) tuples in file/page order, so the
+    output is deterministic regardless of which worker finishes first. At most max_in_flight
+    page ranges are outstanding, which bounds memory to a few ranges' worth of chunks.
+    Parse and split times of each range are recorded under user_id.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or process_pool()
+    max_in_flight = max_in_flight or 2 * getattr(executor, "_max_workers", PROCESS_WORKERS)
+
+    page_counts = await asyncio.gather(*[
+        loop.run_in_executor(executor, count_pages, file_path) for file_path in file_paths
+    ])
+    tasks = (
+        (file_index, start, min(start + pages_per_task, total_pages), total_pages)
+        for file_index, (file_path, total_pages) in enumerate(zip(file_paths, page_counts))
+        for start in range(0, total_pages, pages_per_task)
+    )
+
+    in_flight = deque()
+
+    def submit_next():
+        task = next(tasks, None)
+        if task is None:
+            return False
+        file_index, start, end, _ = task
+        future = loop.run_in_executor(executor, parse_page_range, file_paths[file_index], start, end)
+        in_flight.append((task, future))
+        return True
+
+    try:
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+        while in_flight:
+            (file_index, _, end, total_pages), future = in_flight.popleft()
+            chunks, parse_seconds, split_seconds = await future
+            stage_metrics.observe("parse", parse_seconds, user_id)
+            stage_metrics.observe("split", split_seconds, user_id)
+            # Keep the pool busy while the caller embeds what we yield
+            submit_next()
+            yield file_index, end, total_pages, chunks
+    finally:
+        for _, future in in_flight:
+            future.cancel()
@@ -1,26 +1,70 @@
 import os
 import time
+import asyncio
 import base64
+import copy
+import logging
+import numpy as np
+from collections import deque
+from functools import partial
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
-from langchain.chains import RetrievalQA
 from langchain_core.messages import HumanMessage
+from langchain_core.documents import Document
 from dotenv import load_dotenv
+from backend.app.services.executors import run_in_thread
+from backend.app.services.pdf_pipeline import stream_pdf_chunks
+from backend.app.services.embedding_scheduler import EmbeddingScheduler
+from backend.app.services.embedding_cache import get_embedding_cache, normalize_text
+from backend.app.services.document_manifest import DocumentManifest, file_sha256, chunk_id
+from backend.app.services.bm25_index import BM25Index, BM25IndexRetriever
+from backend.app.services.vector_index import ANNConfig, ANNVectorStore
+from backend.app.services.residency import ResidencyManager, dir_size
+from backend.app.services.answer_cache import AnswerCache
+from backend.app.services.retrieval import HybridPipeline, LRUCache, build_qa_chain, filter_key
+from backend.app.services.comparison import MapReduceComparison, evidence_query
+from backend.app.services.context_packing import ContextPacker
+from backend.app.services.reranker import Reranker
+from backend.app.services.telemetry import stage_metrics
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Evidence chunks each compared document contributes to its summary
+COMPARE_K_PER_DOCUMENT = 6
+
 class RAGService:
     def __init__(self):
         self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
         self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
-        # Store vector stores by user_id
-        self.user_vector_stores = {}
-        self.user_bm25_retrievers = {}
+        # Rate-limited, concurrent batching in front of the embeddings API
+        self.embedding_scheduler = EmbeddingScheduler.from_env(
+            lambda texts: self.embeddings.aembed_documents(texts)
+        )
+        # Re-uploaded or overlapping chunks are served from disk instead of the API
+        self.embedding_cache = get_embedding_cache()
+        # Index type (flat/IVF/HNSW/PQ) by corpus size, plus nprobe/efSearch
+        self.ann_config = ANNConfig.from_env()
+        # Per-user vector stores and BM25 retrievers, LRU-evicted within a memory budget
+        self.residency = ResidencyManager.from_env()
+        # Repeated and near-duplicate questions are answered without retrieval or Gemini
+        self.answer_cache = AnswerCache.from_env()
+        # user_id -> manifest version, bumped on every upload/delete
+        self.user_versions = {}
+        # Repeated questions skip the embeddings API and the FAISS/BM25 searches
+        self.query_embedding_cache = LRUCache(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")))
+        self.retrieval_cache = LRUCache(int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096")))
+        self._qa_chain_llm = None
+        self._qa_chain = None
+        # Optional cross-encoder rescoring of a wider candidate set (RERANKER=cross-encoder)
+        self.reranker = Reranker.from_env()
+        # Dedups/merges retrieved chunks and fits them to the prompt token budget
+        self.context_packer = ContextPacker.from_env()
+        # Per-document summaries for compare, bounded concurrency and cached by (doc hash, aspect)
+        self.comparison = MapReduceComparison.from_env()
+        # Serializes index mutations (append/replace/delete) per user
+        self.user_locks = {}
         self.index_dir = os.path.join("backend", "data", "vector_index")
         os.makedirs(self.index_dir, exist_ok=True)
 
@@ -39,215 +83,574 @@ class RAGService:
                     },
                 ]
             )
-            response = self.llm.invoke([message])
+            response = await self.llm.ainvoke([message])
             return response.content
         except Exception as e:
-            print(f"Error describing image {image_path}: {e}")
+            logger.warning(f"Error describing image {image_path}: {e}")
             return ""
 
-    async def process_pdfs(self, file_paths: list[str], user_id: str):
-        all_docs = []
-        for file_path in file_paths:
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-            
-            # Tag with source filename
-            filename = os.path.basename(file_path)
-            for doc in documents:
-                doc.metadata["source"] = filename
+    async def _embed_texts(self, texts: list[str]):
+        """Embeds chunk texts, sending only cache misses through the scheduler."""
+        return await self.embedding_cache.embed(self.embeddings.model, texts, self.embedding_scheduler.embed_resumable)
+
+    async def _add_to_store(self, batch, vectors, vector_store):
+        """Adds embedded chunks to vector_store on the thread pool, creating it if needed."""
+        text_embeddings = [(doc.page_content, vector) for doc, vector in zip(batch, vectors)]
+        metadatas = [doc.metadata for doc in batch]
+        ids = [doc.id for doc in batch]
+        if vector_store is None:
+            return await run_in_thread(
+                ANNVectorStore.from_embeddings, text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+            )
+        await run_in_thread(vector_store.add_embeddings, text_embeddings, metadatas=metadatas, ids=ids)
+        return vector_store
+
+    def _user_index_path(self, user_id: str):
+        return os.path.join(self.index_dir, str(user_id))
+
+    async def _index_version(self, user_id: str) -> int:
+        if user_id not in self.user_versions:
+            manifest = await run_in_thread(DocumentManifest.load, self._user_index_path(user_id))
+            self.user_versions[user_id] = manifest.version
+        return self.user_versions[user_id]
+
+    def _user_lock(self, user_id: str):
+        if user_id not in self.user_locks:
+            self.user_locks[user_id] = asyncio.Lock()
+        return self.user_locks[user_id]
+
+    async def _read_vector_store(self, user_id: str, mmap: bool):
+        user_index_path = self._user_index_path(user_id)
+        if not ANNVectorStore.exists(user_index_path):
+            return None
+        logger.info(f"Loading vector store for user {user_id} from disk...")
+        with stage_metrics.span("load", user_id):
+            vector_store = await run_in_thread(
+                ANNVectorStore.load_local,
+                user_index_path, 
+                self.embeddings, 
+                # Only unpickles indexes saved before the chunk store; they are converted on next save
+                allow_dangerous_deserialization=True,
+                mmap=mmap
+            )
+        vector_store.set_search_params(self.ann_config)
+        return vector_store
+
+    async def _load_resident(self, user_id: str):
+        vector_store = await self._read_vector_store(user_id, mmap=True)
+        if vector_store is None:
+            return None
+        return vector_store, await run_in_thread(dir_size, self._user_index_path(user_id))
+
+    async def _load_vector_store(self, user_id: str, writable: bool = False):
+        """Returns the user's FAISS store from memory or disk, or None if they have no index.
+
+        Stores loaded for queries memory-map the index files and are read-only. With
+        writable=True, the caller gets its own copy read into RAM: queries keep searching
+        the resident store until residency.put swaps the modified one in.
+        """
+        entry = await self.residency.get_or_load(user_id, self._load_resident)
+        if entry is None:
+            return None
+        if writable:
+            return await self._read_vector_store(user_id, mmap=False)
+        return entry.vector_store
+
+    async def _load_writable_bm25(self, user_id: str, vector_store):
+        """The BM25 retriever to update alongside a writable copy of the user's store."""
+        entry = self.residency.entries.get(user_id)
+        if entry is not None and entry.bm25_retriever:
+            # _update_bm25 only reads the index, which it copies before changing
+            return entry.bm25_retriever
+        return await self._load_bm25(user_id, vector_store)
+
+    async def _maybe_migrate(self, vector_store):
+        """Rebuilds the user's FAISS index as the type its current size calls for, if it changed."""
+        target = vector_store.migration_target(self.ann_config)
+        if target is None:
+            return
+        positions = sorted(vector_store.index_to_docstore_id)
+        logger.info(f"Migrating vector index from {vector_store.kind} to {target} ({len(positions)} vectors)...")
+        vectors = None
+        if vector_store.kind == "ivf_pq":
+            # PQ codes are lossy: retrain from the exact vectors the embedding cache still has
+            texts = [vector_store.docstore.search(vector_store.index_to_docstore_id[p]).page_content for p in positions]
+            cached = await run_in_thread(self.embedding_cache.get_many, self.embeddings.model, texts)
+            vectors = await run_in_thread(vector_store.reconstruct_vectors, np.array(positions, dtype=np.int64))
+            for i, vector in cached.items():
+                vectors[i] = vector
+        await run_in_thread(vector_store.migrate, target, self.ann_config, vectors)
+
+    async def _rebuild_bm25(self, user_id: str, vector_store):
+        """Rebuilds and persists the user's BM25 index from the chunks held by the docstore."""
+        doc_ids = list(vector_store.index_to_docstore_id.values())
+        texts = [vector_store.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        bm25_index = await run_in_thread(BM25Index.build, doc_ids, texts)
+        # Swap in the new index before saving so no retriever still maps the old files
+        bm25_retriever = BM25IndexRetriever(
+            index=bm25_index, docstore=vector_store.docstore, k=3 # Number of keyword results
+        )
+        self._set_bm25(user_id, vector_store, bm25_retriever)
+        with stage_metrics.span("save", user_id):
+            await run_in_thread(bm25_index.save, self._user_index_path(user_id))
+        return bm25_retriever
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            all_docs.extend(text_splitter.split_documents(documents))
+    def _set_bm25(self, user_id: str, vector_store, bm25_retriever):
+        # Only attach to the resident entry if it still holds the store this retriever reads from
+        entry = self.residency.entries.get(user_id)
+        if entry is not None and entry.vector_store is vector_store:
+            entry.bm25_retriever = bm25_retriever
+            entry.pipeline = None
 
+    async def _update_bm25(self, user_id: str, bm25_retriever, vector_store, removed_ids, added_ids):
+        """Applies deletes and appends to the user's BM25 index and persists it.
 
-            # --- Multimodal Extraction (Optional/Experimental) ---
-            # DISABLED: This is causing hangs during PDF processing
-            # Try to extract images from PDF using unstructured if available
-            """
-            try:
-                from unstructured.partition.pdf import partition_pdf
+        Only the added chunks are tokenized. The update runs on a copy that is swapped in
+        afterwards, so concurrent searches never see a half-merged index.
+        """
+        if bm25_retriever is None:
+            return await self._rebuild_bm25(user_id, vector_store)
+        texts = [vector_store.docstore.search(doc_id).page_content for doc_id in added_ids]
+        bm25_index = copy.copy(bm25_retriever.index)
+
+        def apply():
+            bm25_index.delete(removed_ids)
+            bm25_index.add(added_ids, texts)
+
+        await run_in_thread(apply)
+        bm25_retriever = BM25IndexRetriever(
+            index=bm25_index, docstore=vector_store.docstore, k=bm25_retriever.k
+        )
+        self._set_bm25(user_id, vector_store, bm25_retriever)
+        with stage_metrics.span("save", user_id):
+            await run_in_thread(bm25_index.save, self._user_index_path(user_id))
+        return bm25_retriever
+
+    async def _load_bm25(self, user_id: str, vector_store):
+        """Returns the user's BM25 retriever, memory-mapping the saved index after a restart."""
+        entry = self.residency.entries.get(user_id)
+        if entry is not None and entry.vector_store is vector_store and entry.bm25_retriever:
+            return entry.bm25_retriever
+
+        with stage_metrics.span("load", user_id):
+            bm25_index = await run_in_thread(BM25Index.load, self._user_index_path(user_id))
+        if bm25_index is None:
+            # Index saved before BM25 was persisted: build it once from the docstore
+            logger.info(f"No saved BM25 index for user {user_id}, building it from the docstore...")
+            return await self._rebuild_bm25(user_id, vector_store)
+
+        bm25_retriever = BM25IndexRetriever(index=bm25_index, docstore=vector_store.docstore, k=3)
+        self._set_bm25(user_id, vector_store, bm25_retriever)
+        return bm25_retriever
+
+    async def process_pdfs(self, file_paths: list[str], user_id: str, progress_callback=None):
+        """Loads, splits, embeds and indexes PDFs into the user's existing index.
+
+        New files are appended, files whose content changed replace their previous chunks,
+        and files whose hash is already indexed are skipped. Only new pages are parsed and
+        embedded. progress_callback(stage, done, total) is called as each stage advances.
+        """
+        def report(stage, done, total):
+            if progress_callback:
+                progress_callback(stage, done, total)
+
+        user_index_path = self._user_index_path(user_id)
+        manifest = await run_in_thread(DocumentManifest.load, user_index_path)
+        hashes = await asyncio.gather(*[run_in_thread(file_sha256, path) for path in file_paths])
+        to_index = []
+        for file_path, sha256 in zip(file_paths, hashes):
+            if manifest.is_unchanged(os.path.basename(file_path), sha256):
+                logger.info(f"Skipping unchanged document {os.path.basename(file_path)}")
+                continue
+            to_index.append((file_path, sha256))
+
+        if not to_index:
+            for stage in ("load", "split", "embed", "index"):
+                report(stage, 1, 1)
+            return await self._load_vector_store(user_id)
+
+        file_paths = [path for path, _ in to_index]
+        file_chunk_ids = [[] for _ in to_index]
+        file_pages = [0 for _ in to_index]
+
+        # Chunks are handed to the embedding scheduler in windows; it splits each window into
+        # adaptive batches and several windows can be in flight while FAISS adds stay in order.
+        # New chunks go into a staging store that is merged into the user's index at the end.
+        window_size = 256
+        max_windows_in_flight = 2
+        in_flight = deque()
+        vector_store = None
+        pending = []
+        chunk_count = 0
+        embedded = 0
+        files_done = 0
+
+        async def embed(texts):
+            with stage_metrics.span("embed", user_id):
+                return await self._embed_texts(texts)
+
+        def submit(window):
+            texts = [doc.page_content for doc in window]
+            in_flight.append((window, asyncio.create_task(embed(texts))))
+
+        async def drain(limit):
+            nonlocal vector_store, embedded
+            while len(in_flight) > limit:
+                window, task = in_flight.popleft()
+                vectors = await task
+                with stage_metrics.span("index_add", user_id):
+                    vector_store = await self._add_to_store(window, vectors, vector_store)
+                embedded += len(window)
+                report("embed", embedded, chunk_count)
+
+        # Page ranges are parsed and split across the process pool and streamed back in
+        # order. Embedding starts on the first full window while later pages are still parsing,
+        # and only a few windows of chunks are held in memory at a time.
+        try:
+            async for file_index, pages_done, total_pages, chunks in stream_pdf_chunks(file_paths, user_id=user_id):
+                filename, sha256 = os.path.basename(file_paths[file_index]), to_index[file_index][1]
+                for doc in chunks:
+                    doc.id = chunk_id(filename, sha256, len(file_chunk_ids[file_index]))
+                    file_chunk_ids[file_index].append(doc.id)
+                file_pages[file_index] = total_pages
+                chunk_count += len(chunks)
+                pending.extend(chunks)
+                report("split", chunk_count, 0)
+
+                if pages_done == total_pages:
+                    files_done += 1
+                    report("load", files_done, len(file_paths))
+                    filename = os.path.basename(file_paths[file_index])
+
+                    # --- Multimodal Extraction (Optional/Experimental) ---
+                    # DISABLED: This is causing hangs during PDF processing
+                    # Try to extract images from PDF using unstructured if available
+                    """
+                    try:
+                        from unstructured.partition.pdf import partition_pdf
                 
-                extract_dir = os.path.join("backend/data/extracted", filename.replace(" ", "_"))
-                os.makedirs(extract_dir, exist_ok=True)
+                        extract_dir = os.path.join("backend/data/extracted", filename.replace(" ", "_"))
+                        os.makedirs(extract_dir, exist_ok=True)
                 
-                # Check if file exists before processing
-                if not os.path.exists(file_path):
-                    print(f"File not found: {file_path}")
-                    continue
-
-                elements = partition_pdf(
-                    filename=file_path,
-                    extract_images_in_pdf=True,
-                    infer_table_structure=True,
-                    chunking_strategy="by_title",
-                    max_characters=4000,
-                    new_after_n_chars=3800,
-                    extract_image_block_output_dir=extract_dir,
-                )
+                        # Check if file exists before processing
+                        if not os.path.exists(file_path):
+                            logger.warning(f"File not found: {file_path}")
+                            continue
+
+                        elements = partition_pdf(
+                            filename=file_path,
+                            extract_images_in_pdf=True,
+                            infer_table_structure=True,
+                            chunking_strategy="by_title",
+                            max_characters=4000,
+                            new_after_n_chars=3800,
+                            extract_image_block_output_dir=extract_dir,
+                        )
                 
-                for i, el in enumerate(elements):
-                    if el.category == "Image" or el.category == "Table":
-                        # If it's a table, we already have the text/html
-                        # If it's an image, we need to describe it
-                        content = str(el)
-                        # Find related image if category is Image
-                        # (Simplified logic: unstructured doesn't always map back perfectly in this simple loop)
+                        for i, el in enumerate(elements):
+                            if el.category == "Image" or el.category == "Table":
+                                # If it's a table, we already have the text/html
+                                # If it's an image, we need to describe it
+                                content = str(el)
+                                # Find related image if category is Image
+                                # (Simplified logic: unstructured doesn't always map back perfectly in this simple loop)
                         
-                        image_files = list(Path(extract_dir).glob("*.jpg")) + list(Path(extract_dir).glob("*.png"))
-                        if el.category == "Image" and image_files:
-                            # For now, let's just describe the latest image if we're in Image category
-                            latest_img = max(image_files, key=os.path.getctime)
-                            description = await self._describe_image(str(latest_img))
-                            content = f"[Visual Content Description]: {description}"
+                                image_files = list(Path(extract_dir).glob("*.jpg")) + list(Path(extract_dir).glob("*.png"))
+                                if el.category == "Image" and image_files:
+                                    # For now, let's just describe the latest image if we're in Image category
+                                    latest_img = max(image_files, key=os.path.getctime)
+                                    description = await self._describe_image(str(latest_img))
+                                    content = f"[Visual Content Description]: {description}"
                         
-                        from langchain_core.documents import Document
-                        all_docs.append(Document(
-                            page_content=content,
-                            metadata={"source": filename, "page": el.metadata.page_number if el.metadata.page_number else 0, "type": el.category}
-                        ))
-            except ImportError:
-                print("Unstructured not installed or dependencies missing. Skipping multimodal extraction.")
-            except Exception as e:
-                print(f"Multimodal extraction error for {filename}: {e}")
-            """
-
-        if not all_docs:
-            print(f"No documents extracted from files: {file_paths}")
+                                from langchain_core.documents import Document
+                                pending.append(Document(
+                                    page_content=content,
+                                    metadata={"source": filename, "page": el.metadata.page_number if el.metadata.page_number else 0, "type": el.category}
+                                ))
+                    except ImportError:
+                        logger.warning("Unstructured not installed or dependencies missing. Skipping multimodal extraction.")
+                    except Exception as e:
+                        logger.warning(f"Multimodal extraction error for {filename}: {e}")
+                    """
+
+                while len(pending) >= window_size:
+                    window, pending = pending[:window_size], pending[window_size:]
+                    submit(window)
+                    await drain(max_windows_in_flight - 1)
+
+            if pending:
+                submit(pending)
+            await drain(0)
+        finally:
+            # On failure or cancellation, stop any embedding work still in flight
+            for _, task in in_flight:
+                task.cancel()
+
+        report("load", len(file_paths), len(file_paths))
+        report("split", chunk_count, chunk_count)
+        report("embed", embedded, chunk_count)
+
+        if vector_store is None:
+            logger.warning(f"No documents extracted from files: {file_paths}")
             return None
 
-        # 2. FAISS creation with improved batch processing
-        batch_size = 50
-        vector_store = None
-        
-        print(f"Processing {len(all_docs)} document chunks...")
-        for i in range(0, len(all_docs), batch_size):
-            batch = all_docs[i:i + batch_size]
-            success = False
-            retries = 3
-            retry_delay = 5
-            
-            while not success and retries > 0:
-                try:
-                    if vector_store is None:
-                        vector_store = FAISS.from_documents(batch, self.embeddings)
-                    else:
-                        vector_store.add_documents(batch)
-                    success = True
-                except Exception as e:
-                    if "429" in str(e):
-                        print(f"Rate limited. Waiting {retry_delay}s... (Batch {i//batch_size})")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                        retries -= 1
-                    else:
-                        raise e
-        
-        if vector_store:
-            self.user_vector_stores[user_id] = vector_store
-            
-            # Save FAISS index
-            user_index_path = os.path.join(self.index_dir, str(user_id))
-            vector_store.save_local(user_index_path)
-            
-            # 1. Initialize BM25 Retriever for the user
-            self.user_bm25_retrievers[user_id] = BM25Retriever.from_documents(all_docs)
-            self.user_bm25_retrievers[user_id].k = 3 # Number of keyword results
-        
-        return vector_store
+        logger.info(f"Indexed {embedded} document chunks...")
+        report("index", 0, 1)
+        # Shielded: once committing starts it runs to the end even if the job is cancelled, so
+        # saved index files are never left without the manifest, BM25 and residency updates
+        user_store = await asyncio.shield(self._commit_upload(
+            user_id, user_index_path, vector_store, to_index, file_chunk_ids, file_pages))
+        report("index", 1, 1)
 
-    def query(self, question: str, user_id: str):
-        vector_store = self.user_vector_stores.get(user_id)
-        
-        if not vector_store:
-            # Try loading from disk
-            user_index_path = os.path.join(self.index_dir, str(user_id))
-            if os.path.exists(user_index_path):
-                print(f"Loading vector store for user {user_id} from disk...")
-                vector_store = FAISS.load_local(
-                    user_index_path, 
-                    self.embeddings, 
-                    allow_dangerous_deserialization=True
-                )
-                self.user_vector_stores[user_id] = vector_store
+        return user_store
+
+    async def _commit_upload(self, user_id, user_index_path, vector_store, to_index, file_chunk_ids, file_pages):
+        """Merges an upload's staging store into the user's index and saves it, under the user lock."""
+        async with self._user_lock(user_id):
+            user_store = await self._load_vector_store(user_id, writable=True)
+            bm25_retriever = await self._load_writable_bm25(user_id, user_store) if user_store else None
+            # Re-read under the lock: another job may have committed since we started
+            manifest = await run_in_thread(DocumentManifest.load, user_index_path)
+            stale_ids = []
+            for (file_path, sha256), ids, pages in zip(to_index, file_chunk_ids, file_pages):
+                filename = os.path.basename(file_path)
+                stale_ids.extend(manifest.chunk_ids(filename))
+                manifest.set(filename, sha256, ids, pages)
+
+            if user_store is None:
+                user_store = vector_store
             else:
-                raise ValueError("No documents processed for this user. Please upload PDFs first.")
-
-        bm25_retriever = self.user_bm25_retrievers.get(user_id)
-        
-        # If BM25 is missing (e.g. after restart), we fallback to pure Vector Search
-        # or we could implement doc persistence to rebuild it.
-        # For now, let's use FAISS if BM25 is missing.
-        if not bm25_retriever:
-            print(f"BM25 retriever missing for user {user_id}, using FAISS only.")
-            retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-        else:
-            # Create the Ensemble Retriever (Weighted Hybrid Search)
-            retriever = EnsembleRetriever(
-                retrievers=[
-                    bm25_retriever, 
-                    vector_store.as_retriever(search_kwargs={"k": 5})
-                ],
-                weights=[0.4, 0.6] # 40% Keyword, 60% Semantic
-            )
+                # Replace-by-document: drop the old version's chunks, then append the new ones.
+                # Both cost O(changed chunks), not O(corpus)
+                with stage_metrics.span("index_add", user_id):
+                    if stale_ids:
+                        await run_in_thread(user_store.delete, stale_ids)
+                    await run_in_thread(user_store.merge_from, vector_store)
+            # Train/switch to an ANN index as the corpus grows past the flat threshold
+            await self._maybe_migrate(user_store)
+            user_store.set_search_params(self.ann_config)
 
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True
-        )
-        
-        result = qa_chain.invoke({"query": question})
-        return {
-            "answer": result["result"],
-            "sources": [
-                {"content": doc.page_content, "metadata": doc.metadata} 
-                for doc in result["source_documents"]
-            ]
-        }
-
-    def compare_documents(self, user_id: str, filenames: list[str], aspect: str = "general"):
-        """Specialized logic for cross-document analysis."""
-        vector_store = self.user_vector_stores.get(user_id)
+            # Save FAISS index, then the manifest that describes it
+            with stage_metrics.span("save", user_id):
+                await run_in_thread(user_store.save_local, user_index_path)
+                manifest.version += 1
+                await run_in_thread(manifest.save)
+            self.user_versions[user_id] = manifest.version
+
+            added_ids = [doc_id for ids in file_chunk_ids for doc_id in ids]
+            bm25_retriever = await self._update_bm25(user_id, bm25_retriever, user_store, stale_ids, added_ids)
+            # The in-RAM store we just wrote becomes the resident one
+            size_bytes = await run_in_thread(dir_size, user_index_path)
+            self.residency.put(user_id, user_store, size_bytes, bm25_retriever)
+        return user_store
+
+    async def delete_document(self, user_id: str, filename: str):
+        """Removes one document's chunks from the user's index."""
+        async with self._user_lock(user_id):
+            user_index_path = self._user_index_path(user_id)
+            manifest = await run_in_thread(DocumentManifest.load, user_index_path)
+            entry = manifest.remove(filename)
+            vector_store = await self._load_vector_store(user_id, writable=True)
+            if entry is None or vector_store is None:
+                raise ValueError(f"Document '{filename}' is not indexed for this user.")
+            bm25_retriever = await self._load_writable_bm25(user_id, vector_store)
+
+            if entry["chunk_ids"]:
+                await run_in_thread(vector_store.delete, entry["chunk_ids"])
+            await self._maybe_migrate(vector_store)
+            with stage_metrics.span("save", user_id):
+                await run_in_thread(vector_store.save_local, user_index_path)
+                manifest.version += 1
+                await run_in_thread(manifest.save)
+            self.user_versions[user_id] = manifest.version
+            bm25_retriever = await self._update_bm25(user_id, bm25_retriever, vector_store, entry["chunk_ids"], [])
+            size_bytes = await run_in_thread(dir_size, user_index_path)
+            self.residency.put(user_id, vector_store, size_bytes, bm25_retriever)
+        return {"filename": filename, "chunks_removed": len(entry["chunk_ids"])}
+
+    async def _embed_query(self, text: str, user_id: str = None):
+        key = (self.embeddings.model, normalize_text(text))
+        vector = self.query_embedding_cache.get(key)
+        if vector is None:
+            with stage_metrics.span("embed_query", user_id):
+                vector = await self.embeddings.aembed_query(text)
+            self.query_embedding_cache.put(key, vector)
+        return vector
+
+    async def _pipeline(self, user_id: str):
+        """Returns the user's prebuilt retrieval pipeline, building it once per resident index."""
+        vector_store = await self._load_vector_store(user_id)
         if not vector_store:
-            raise ValueError("No vector store found for user.")
+            return None
+        entry = self.residency.entries.get(user_id)
+        if entry is not None and entry.vector_store is vector_store and entry.pipeline is not None:
+            return entry.pipeline
+
+        # The BM25 index is persisted next to FAISS, so hybrid search also works after a restart
+        bm25_retriever = await self._load_bm25(user_id, vector_store)
+        pipeline = HybridPipeline(vector_store, bm25_retriever, user_id=user_id)
+        entry = self.residency.entries.get(user_id)
+        if entry is not None and entry.vector_store is vector_store and entry.bm25_retriever is bm25_retriever:
+            entry.pipeline = pipeline
+        return pipeline
+
+    def _get_qa_chain(self):
+        # The prompt/LLM chain doesn't depend on the user, so one instance serves every request
+        if self._qa_chain is None or self._qa_chain_llm is not self.llm:
+            self._qa_chain = build_qa_chain(self.llm)
+            self._qa_chain_llm = self.llm
+        return self._qa_chain
+
+    async def _retrieve(self, user_id: str, version: int, pipeline, mode: str, search, question: str, **params):
+        """Awaits search() for (Document, score) hits, or re-reads its cached chunk ids and scores.
 
-        # Filter documents by filenames if provided
-        # Note: FAISS filtering can be tricky, typically done via metadata
-        filter_dict = {"source": filenames}
-        
-        # We manually query for related snippets across these specific files
-        comparison_prompt = f"""
-        Analyze the following documents: {', '.join(filenames)}.
-        Focus specifically on: {aspect}.
-        
-        Identify:
-        1. Key similarities / Consensus points.
-        2. Significant contradictions or differing viewpoints.
-        3. Unique insights found in only one of the documents.
-        
-        Structure your response with clear headings and bullet points.
+        params (k, weights, filters...) are whatever besides the question shapes the result.
         """
-        
-        # We use a retriever with filtering
-        retriever = vector_store.as_retriever(
-            search_kwargs={"k": 10, "filter": {"source": {"$in": filenames}}}
+        key = (user_id, version, mode, normalize_text(question), filter_key(params))
+        cached = self.retrieval_cache.get(key)
+        if cached is not None:
+            return pipeline.resolve(cached)
+        hits = await search()
+        self.retrieval_cache.put(key, [(doc.id, score) for doc, score in hits])
+        return hits
+
+    async def _answer_stream(self, docs, question: str, on_complete=None, user_id: str = None):
+        """Yields answer tokens from the shared "stuff" chain; on_complete(answer) runs at the end."""
+        parts = []
+        start = time.perf_counter()
+        async for token in self._get_qa_chain().astream({"context": docs, "question": question}):
+            if not parts:
+                stage_metrics.observe("llm_first_token", time.perf_counter() - start, user_id)
+            parts.append(token)
+            yield token
+        stage_metrics.observe("llm", time.perf_counter() - start, user_id)
+        if on_complete:
+            on_complete("".join(parts))
+
+    async def query_stream(self, question: str, user_id: str, k: int = None, weights: list[float] = None,
+                           fusion: str = None):
+        """Retrieves for the question and returns (sources, tokens) before generation starts.
+
+        tokens is an async iterator over the answer as the LLM produces it; the complete
+        answer goes into the answer cache once it is exhausted. k, weights (BM25, FAISS) and
+        fusion ("rrf" or "weighted") override the hybrid search defaults for this request.
+        """
+        if k is not None and k < 1:
+            raise ValueError("k must be at least 1.")
+        if weights is not None and len(weights) != 2:
+            raise ValueError("weights must be [keyword weight, semantic weight].")
+        pipeline = await self._pipeline(user_id)
+        if not pipeline:
+            raise ValueError("No documents processed for this user. Please upload PDFs first.")
+
+        # 1. Answer cache: exact question first, then a near-duplicate by embedding similarity.
+        # It's keyed by question only, so requests with their own search settings bypass it
+        version = await self._index_version(user_id)
+        use_answer_cache = k is None and weights is None and fusion is None
+        if use_answer_cache:
+            cached = self.answer_cache.get_exact(user_id, version, question)
+            if cached is not None:
+                return cached["sources"], _replay(cached["answer"])
+        question_vector = await self._embed_query(question, user_id)
+        if use_answer_cache:
+            cached = self.answer_cache.get_similar(user_id, version, question_vector)
+            if cached is not None:
+                return cached["sources"], _replay(cached["answer"])
+
+        # 2. Hybrid search: BM25 and FAISS concurrently, fused, through the user's prebuilt pipeline.
+        # With a reranker, a wider candidate set is retrieved and only its top few are kept
+        search_k = max(self.reranker.candidates, k or 0) if self.reranker else k
+        hits = await self._retrieve(
+            user_id, version, pipeline, "hybrid",
+            partial(pipeline.asearch, question, question_vector, k=search_k, weights=weights, fusion=fusion),
+            question, k=search_k, weights=weights, fusion=fusion
         )
-        
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True
+        if self.reranker:
+            with stage_metrics.span("rerank", user_id):
+                hits = await run_in_thread(self.reranker.rerank, question, hits, k)
+        # BM25 and FAISS often return the same or overlapping chunks
+        docs = self.context_packer.pack(_scored(hits))
+        sources = _sources(docs)
+
+        # 3. Answer with the shared "stuff" chain
+        def cache_answer(answer):
+            if use_answer_cache:
+                response = {"answer": answer, "sources": sources}
+                self.answer_cache.put(user_id, version, question, question_vector, response)
+
+        return sources, self._answer_stream(docs, question, on_complete=cache_answer, user_id=user_id)
+
+    async def query(self, question: str, user_id: str, k: int = None, weights: list[float] = None,
+                    fusion: str = None):
+        sources, tokens = await self.query_stream(question, user_id, k=k, weights=weights, fusion=fusion)
+        answer = "".join([token async for token in tokens])
+        return {"answer": answer, "sources": sources}
+
+    async def compare_stream(self, user_id: str, filenames: list[str], aspect: str = "general"):
+        """Map-reduce cross-document analysis as (sources, tokens), like query_stream.
+
+        Sources are each file's aspect evidence; the per-document summaries run when the
+        token iterator is first consumed, followed by the streamed comparison.
+        """
+        pipeline = await self._pipeline(user_id)
+        if not pipeline:
+            raise ValueError("No vector store found for user.")
+        filenames = list(dict.fromkeys(filenames))
+        if not filenames:
+            raise ValueError("Select at least one document to compare.")
+
+        # Evidence for the aspect from each selected file's own chunks
+        version = await self._index_version(user_id)
+        question = evidence_query(aspect)
+        question_vector = await self._embed_query(question, user_id)
+        hits = await self._retrieve(
+            user_id, version, pipeline, "balanced",
+            partial(run_in_thread, pipeline.balanced, question_vector, filenames, COMPARE_K_PER_DOCUMENT),
+            question, k=COMPARE_K_PER_DOCUMENT, filter={"source": {"$in": filenames}}
         )
-        
-        result = qa_chain.invoke({"query": comparison_prompt})
-        return {
-            "analysis": result["result"],
-            "sources": [
-                {"content": doc.page_content, "metadata": doc.metadata} 
-                for doc in result["source_documents"]
-            ]
-        }
+        docs = _scored(hits)
+        manifest = await run_in_thread(DocumentManifest.load, self._user_index_path(user_id))
+        documents = [
+            (filename, manifest.documents.get(filename, {}).get("sha256"),
+             self.context_packer.pack([doc for doc in docs if doc.metadata.get("source") == filename]))
+            for filename in filenames
+        ]
+
+        async def analysis():
+            # Map: per-document summaries, concurrently and cached; reduce: one streamed comparison
+            with stage_metrics.span("compare_map", user_id):
+                summaries = await self.comparison.summarize(self.llm, documents, aspect)
+            start = time.perf_counter()
+            async for token in self.comparison.reduce(self.llm, summaries, aspect):
+                yield token
+            stage_metrics.observe("compare_reduce", time.perf_counter() - start, user_id)
+
+        return _sources([doc for _, _, evidence in documents for doc in evidence]), analysis()
+
+    async def compare_documents(self, user_id: str, filenames: list[str], aspect: str = "general"):
+        """Specialized logic for cross-document analysis."""
+        sources, tokens = await self.compare_stream(user_id, filenames, aspect)
+        analysis = "".join([token async for token in tokens])
+        return {"analysis": analysis, "sources": sources}
+
+
+def _scored(hits):
+    # Copies, so the score doesn't leak into docstore objects shared across requests
+    return [
+        Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "relevance_score": score})
+        for doc, score in hits
+    ]
+
+
+def _sources(docs):
+    return [
+        {"content": doc.page_content, "metadata": doc.metadata} 
+        for doc in docs
+    ]
+
+
+async def _replay(answer: str):
+    # A cached answer is sent as a single token
+    yield answer
 
 rag_service = RAGService()
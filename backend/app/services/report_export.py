@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from backend.app.services.executors import run_in_process
+from backend.app.services.telemetry import stage_metrics
+from backend.app.utils.reporting import render_session_report
+
+logger = logging.getLogger(__name__)
+
+
+class ReportExporter:
+    """PDF session reports rendered on the process pool and cached on disk.
+
+    A report is keyed by (session id, id of the session's last message, session title):
+    messages are append-only and the title is the only other thing a report shows, so the
+    key changes exactly when the report would. Renders run in a worker
+    process, off the event loop and the API's GIL, laying out batch_size messages at a time;
+    concurrent exports of the same report share one render. Finished files are served in
+    chunks from disk, and the least recently exported beyond max_entries are deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 64, batch_size: int = 50):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self._renders = {}
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("REPORT_CACHE_DIR", os.path.join("backend", "data", "reports")),
+            max_entries=int(os.getenv("REPORT_CACHE_ENTRIES", "64")),
+            batch_size=int(os.getenv("REPORT_BATCH_MESSAGES", "50")),
+        )
+
+    def key(self, session_id: str, last_message_id: str, title: str = None) -> str:
+        return hashlib.sha1(repr((session_id, last_message_id, title)).encode()).hexdigest()[:24]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def cached(self, key: str):
+        """The report's path if it is already rendered, else None."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        # mtime orders eviction
+        os.utime(path)
+        self.hits += 1
+        return path
+
+    async def export(self, key: str, load):
+        """The path of the rendered report; `load` is awaited for (title, messages) only on a miss."""
+        path = self.cached(key)
+        if path:
+            return path
+        render = self._renders.get(key)
+        if render is None:
+            self.misses += 1
+            render = self._renders[key] = asyncio.ensure_future(self._render(key, load))
+            render.add_done_callback(lambda _: self._renders.pop(key, None))
+        return await asyncio.shield(render)
+
+    async def _render(self, key: str, load):
+        title, messages = await load()
+        path = self.path(key)
+        partial = f"{path}.{os.getpid()}.part"
+        start = time.perf_counter()
+        try:
+            with stage_metrics.span("report_render"):
+                await run_in_process(render_session_report, title, messages, partial, self.batch_size)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self.renders += 1
+        self.render_seconds += time.perf_counter() - start
+        self._evict()
+        return path
+
+    def _evict(self):
+        reports = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".pdf")]
+        if len(reports) <= self.max_entries:
+            return
+        reports.sort(key=os.path.getmtime)
+        for path in reports[:len(reports) - self.max_entries]:
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError as e:
+                logger.warning(f"Could not evict report {path}: {e}")
+
+    def stats(self):
+        reports = [name for name in os.listdir(self.cache_dir) if name.endswith(".pdf")]
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(reports),
+            "max_entries": self.max_entries,
+            "bytes": sum(os.path.getsize(os.path.join(self.cache_dir, name)) for name in reports),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "rendering": len(self._renders),
+            "renders": self.renders,
+            "avg_render_ms": round(self.render_seconds / self.renders * 1000, 2) if self.renders else 0.0,
+            "evictions": self.evictions,
+        }
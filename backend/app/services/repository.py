@@ -0,0 +1,378 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from backend.app.services.executors import run_in_thread
+
+MESSAGE_COLUMNS = ("id", "session_id", "role", "content", "sources", "created_at")
+
+
+def message_columns(include_sources: bool = True) -> tuple:
+    return MESSAGE_COLUMNS if include_sources else tuple(c for c in MESSAGE_COLUMNS if c != "sources")
+
+
+class Repository(ABC):
+    """Storage for the documents, chat_sessions and chat_messages tables.
+
+    Every method is a coroutine. Messages are dicts with MESSAGE_COLUMNS; created_at is an
+    ISO 8601 string with microseconds, and list_messages() returns messages ordered by
+    (created_at, id), so messages sharing a timestamp still have one stable order.
+    A message's id may be set by the caller, otherwise the database assigns one. Backends
+    implement every abstract method; close() is optional.
+    """
+
+    @abstractmethod
+    async def add_document(self, user_id: str, filename: str, storage_path: str, size_bytes: int):
+        """Records an uploaded document."""
+
+    @abstractmethod
+    async def delete_document(self, user_id: str, filename: str):
+        """Removes the user's record of a document."""
+
+    @abstractmethod
+    async def get_session(self, session_id: str):
+        """The session as {"id", "user_id", "title"}, or None."""
+
+    @abstractmethod
+    async def ensure_sessions(self, sessions: list[dict]):
+        """Inserts the sessions that don't exist yet; existing ones are left unchanged."""
+
+    @abstractmethod
+    async def insert_messages(self, messages: list[dict]):
+        """Inserts all messages, or none of them if one fails.
+
+        Messages whose id is already stored are skipped, so retrying an insert that did
+        commit (e.g. after a timeout) neither fails nor duplicates rows.
+        """
+
+    @abstractmethod
+    async def list_messages(self, session_id: str, before: tuple = None, after: tuple = None, limit: int = None,
+                            include_sources: bool = True) -> list[dict]:
+        """The session's messages strictly between `after` and `before`, (created_at, id) keys.
+
+        With a limit, the first `limit` after `after` when it is given, otherwise the newest
+        `limit` (a page of history ending at `before`). Always in (created_at, id) order.
+        Without include_sources, messages have no "sources" key.
+        """
+
+    @abstractmethod
+    async def get_sources(self, session_id: str, message_ids: list[str]) -> dict:
+        """{message id: sources} for the given messages of the session."""
+
+    async def close(self):
+        """Releases connections; the default holds none."""
+
+
+def message_page_query(session_id, before, after, limit, include_sources: bool, placeholder: str):
+    """SQL and parameters for Repository.list_messages; placeholder is "?" (sqlite3) or "$" (asyncpg).
+
+    before and after are (created_at, id) pairs, compared as row values so the
+    (session_id, created_at, id) index serves the range.
+    """
+    params = [session_id]
+
+    def param(value):
+        params.append(value)
+        return "?" if placeholder == "?" else f"${len(params)}"
+
+    def key(cursor):
+        created_at, message_id = cursor
+        return f"({param(created_at)}, {param(message_id)}{'' if placeholder == '?' else '::uuid'})"
+
+    where = "session_id = " + ("?" if placeholder == "?" else "$1")
+    if before:
+        where += f" AND (created_at, id) < {key(before)}"
+    if after:
+        where += f" AND (created_at, id) > {key(after)}"
+    columns = ", ".join(message_columns(include_sources))
+    if limit is None:
+        return f"SELECT {columns} FROM chat_messages WHERE {where} ORDER BY created_at, id", params
+    if after:
+        return (f"SELECT {columns} FROM chat_messages WHERE {where} ORDER BY created_at, id"
+                f" LIMIT {param(limit)}", params)
+    # Newest page first through the (session_id, created_at, id) index, then back in history order
+    return (f"SELECT * FROM (SELECT {columns} FROM chat_messages WHERE {where}"
+            f" ORDER BY created_at DESC, id DESC LIMIT {param(limit)}) AS page ORDER BY created_at, id", params)
+
+
+class SupabaseRepository(Repository):
+    """The Supabase (PostgREST) tables. supabase-py is synchronous, so calls run on the thread pool.
+
+    client_factory is called on first use, so startup does not depend on the service.
+    """
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+
+    def _table(self, name: str):
+        return self.client_factory().table(name)
+
+    async def add_document(self, user_id, filename, storage_path, size_bytes):
+        await run_in_thread(lambda: self._table("documents").insert({
+            "user_id": user_id, "filename": filename, "storage_path": storage_path, "size_bytes": size_bytes,
+        }).execute())
+
+    async def delete_document(self, user_id, filename):
+        await run_in_thread(
+            lambda: self._table("documents").delete().eq("user_id", user_id).eq("filename", filename).execute()
+        )
+
+    async def get_session(self, session_id):
+        res = await run_in_thread(
+            lambda: self._table("chat_sessions").select("id, user_id, title").eq("id", session_id).limit(1).execute()
+        )
+        return res.data[0] if res.data else None
+
+    async def ensure_sessions(self, sessions):
+        # Insert-if-missing in one request; existing sessions keep their title
+        await run_in_thread(
+            lambda: self._table("chat_sessions").upsert(sessions, on_conflict="id", ignore_duplicates=True).execute()
+        )
+
+    async def insert_messages(self, messages):
+        await run_in_thread(
+            lambda: self._table("chat_messages").upsert(messages, on_conflict="id", ignore_duplicates=True).execute()
+        )
+
+    async def list_messages(self, session_id, before=None, after=None, limit=None, include_sources=True):
+        newest_first = limit is not None and after is None
+
+        def keyset(op, cursor):
+            # PostgREST has no row comparison: created_at op c, or the same created_at and id op i
+            created_at, message_id = cursor
+            return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{message_id})'
+
+        def fetch():
+            query = self._table("chat_messages").select(",".join(message_columns(include_sources))) \
+                .eq("session_id", session_id)
+            if before:
+                query = query.or_(keyset("lt", before))
+            if after:
+                query = query.or_(keyset("gt", after))
+            query = query.order("created_at", desc=newest_first).order("id", desc=newest_first)
+            if limit is not None:
+                query = query.limit(limit)
+            return query.execute()
+
+        res = await run_in_thread(fetch)
+        return res.data[::-1] if newest_first else res.data
+
+    async def get_sources(self, session_id, message_ids):
+        res = await run_in_thread(
+            lambda: self._table("chat_messages").select("id, sources")
+            .eq("session_id", session_id).in_("id", message_ids).execute()
+        )
+        return {row["id"]: row["sources"] or [] for row in res.data}
+
+
+class SQLiteRepository(Repository):
+    """The same tables in an embedded SQLite database, for local and single-node use.
+
+    Each thread-pool thread keeps its own connection; WAL lets reads run alongside the
+    single writer. Messages are indexed by (session_id, created_at, id), the history order.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            storage_path TEXT NOT NULL,
+            size_bytes INTEGER,
+            page_count INTEGER,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+        );
+        CREATE INDEX IF NOT EXISTS documents_user_filename ON documents (user_id, filename);
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            title TEXT,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+        );
+        CREATE INDEX IF NOT EXISTS chat_sessions_user ON chat_sessions (user_id);
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+            role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+            content TEXT NOT NULL,
+            sources TEXT NOT NULL DEFAULT '[]',
+            created_at TEXT NOT NULL
+        );
+        DROP INDEX IF EXISTS chat_messages_session_created;
+        CREATE INDEX IF NOT EXISTS chat_messages_session_created_id ON chat_messages (session_id, created_at, id);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _write(self, sql: str, rows):
+        conn = self._connect()
+        with conn:
+            conn.executemany(sql, rows)
+
+    def _read(self, sql: str, params):
+        return self._connect().execute(sql, params).fetchall()
+
+    async def add_document(self, user_id, filename, storage_path, size_bytes):
+        await run_in_thread(
+            self._write,
+            "INSERT INTO documents (id, user_id, filename, storage_path, size_bytes) VALUES (?, ?, ?, ?, ?)",
+            [(str(uuid.uuid4()), user_id, filename, storage_path, size_bytes)],
+        )
+
+    async def delete_document(self, user_id, filename):
+        await run_in_thread(self._write, "DELETE FROM documents WHERE user_id = ? AND filename = ?",
+                            [(user_id, filename)])
+
+    async def get_session(self, session_id):
+        rows = await run_in_thread(self._read, "SELECT id, user_id, title FROM chat_sessions WHERE id = ?",
+                                   (session_id,))
+        return dict(rows[0]) if rows else None
+
+    async def ensure_sessions(self, sessions):
+        await run_in_thread(
+            self._write, "INSERT OR IGNORE INTO chat_sessions (id, user_id, title) VALUES (?, ?, ?)",
+            [(s["id"], s["user_id"], s.get("title")) for s in sessions],
+        )
+
+    async def insert_messages(self, messages):
+        await run_in_thread(
+            self._write,
+            "INSERT OR IGNORE INTO chat_messages (id, session_id, role, content, sources, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(m.get("id") or str(uuid.uuid4()), m["session_id"], m["role"], m["content"],
+              json.dumps(m.get("sources") or []), m["created_at"]) for m in messages],
+        )
+
+    async def list_messages(self, session_id, before=None, after=None, limit=None, include_sources=True):
+        sql, params = message_page_query(session_id, before, after, limit, include_sources, "?")
+        rows = await run_in_thread(self._read, sql, params)
+        messages = [dict(row) for row in rows]
+        if include_sources:
+            for message in messages:
+                message["sources"] = json.loads(message["sources"])
+        return messages
+
+    async def get_sources(self, session_id, message_ids):
+        marks = ", ".join("?" * len(message_ids))
+        rows = await run_in_thread(
+            self._read, f"SELECT id, sources FROM chat_messages WHERE session_id = ? AND id IN ({marks})",
+            (session_id, *message_ids),
+        )
+        return {row["id"]: json.loads(row["sources"]) for row in rows}
+
+
+class PostgresRepository(Repository):
+    """The Postgres tables of schema.sql through a pooled asyncpg connection.
+
+    Talks to the database directly (e.g. Supabase's Postgres or a local one) instead of over
+    PostgREST. The pool is created on first use. Needs `pip install asyncpg`.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        import asyncpg  # optional dependency, fail at construction
+        self._asyncpg = asyncpg
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+
+    async def _get_pool(self):
+        if self._pool is None:
+            self._pool = await self._asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        return self._pool
+
+    async def add_document(self, user_id, filename, storage_path, size_bytes):
+        pool = await self._get_pool()
+        await pool.execute(
+            "INSERT INTO documents (user_id, filename, storage_path, size_bytes) VALUES ($1, $2, $3, $4)",
+            user_id, filename, storage_path, size_bytes,
+        )
+
+    async def delete_document(self, user_id, filename):
+        pool = await self._get_pool()
+        await pool.execute("DELETE FROM documents WHERE user_id = $1 AND filename = $2", user_id, filename)
+
+    async def get_session(self, session_id):
+        pool = await self._get_pool()
+        row = await pool.fetchrow("SELECT id, user_id, title FROM chat_sessions WHERE id = $1", session_id)
+        return {"id": str(row["id"]), "user_id": str(row["user_id"]), "title": row["title"]} if row else None
+
+    async def ensure_sessions(self, sessions):
+        pool = await self._get_pool()
+        await pool.executemany(
+            "INSERT INTO chat_sessions (id, user_id, title) VALUES ($1, $2, $3) ON CONFLICT (id) DO NOTHING",
+            [(s["id"], s["user_id"], s.get("title")) for s in sessions],
+        )
+
+    async def insert_messages(self, messages):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn, conn.transaction():
+            await conn.executemany(
+                "INSERT INTO chat_messages (id, session_id, role, content, sources, created_at)"
+                " VALUES (COALESCE($1::uuid, gen_random_uuid()), $2, $3, $4, $5::jsonb, $6)"
+                " ON CONFLICT (id) DO NOTHING",
+                [(m.get("id"), m["session_id"], m["role"], m["content"], json.dumps(m.get("sources") or []),
+                  datetime.fromisoformat(m["created_at"])) for m in messages],
+            )
+
+    async def list_messages(self, session_id, before=None, after=None, limit=None, include_sources=True):
+        pool = await self._get_pool()
+        sql, params = message_page_query(
+            session_id, before and (datetime.fromisoformat(before[0]), before[1]),
+            after and (datetime.fromisoformat(after[0]), after[1]), limit, include_sources, "$",
+        )
+        messages = []
+        for row in await pool.fetch(sql, *params):
+            message = {**dict(row), "id": str(row["id"]), "session_id": str(row["session_id"]),
+                       "created_at": row["created_at"].isoformat(timespec="microseconds")}
+            if include_sources:
+                message["sources"] = json.loads(row["sources"]) if row["sources"] else []
+            messages.append(message)
+        return messages
+
+    async def get_sources(self, session_id, message_ids):
+        pool = await self._get_pool()
+        rows = await pool.fetch(
+            "SELECT id, sources FROM chat_messages WHERE session_id = $1 AND id = ANY($2::uuid[])",
+            session_id, message_ids,
+        )
+        return {str(row["id"]): json.loads(row["sources"]) if row["sources"] else [] for row in rows}
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def repository_from_env(supabase_client_factory) -> Repository:
+    """STORAGE_BACKEND=supabase (default), sqlite (SQLITE_PATH) or postgres (DATABASE_URL, PG_POOL_MIN/MAX)."""
+    kind = os.getenv("STORAGE_BACKEND", "supabase").lower()
+    if kind == "supabase":
+        return SupabaseRepository(supabase_client_factory)
+    if kind == "sqlite":
+        return SQLiteRepository(os.getenv("SQLITE_PATH", os.path.join("backend", "data", "app.sqlite")))
+    if kind == "postgres":
+        return PostgresRepository(
+            os.environ["DATABASE_URL"],
+            min_size=int(os.getenv("PG_POOL_MIN", "1")),
+            max_size=int(os.getenv("PG_POOL_MAX", "10")),
+        )
+    raise ValueError(f"Unknown storage backend '{kind}', expected supabase, sqlite or postgres")
@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+import threading
+from backend.app.services.retrieval import LRUCache
+from backend.app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderScorer:
+    """(query, passage) relevance from a small sentence-transformers cross-encoder on CPU.
+
+    The model is loaded on first use. Needs `pip install sentence-transformers`.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, device: str = "cpu"):
+        from sentence_transformers import CrossEncoder  # optional dependency, fail at construction
+        self._cross_encoder_cls = CrossEncoder
+        self.name = model_name
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def __call__(self, query: str, texts: list[str]) -> list[float]:
+        with self._lock:
+            if self._model is None:
+                self._model = self._cross_encoder_cls(self.name, device=self.device)
+        return [float(score) for score in self._model.predict([(query, text) for text in texts], batch_size=len(texts))]
+
+
+class Reranker:
+    """Rescores the top `candidates` retrieved chunks and keeps the best `top_n` for the LLM.
+
+    scorer(query, texts) -> scores is called with at most batch_size texts at a time, and
+    any object with that signature and a `name` can be plugged in. Scores are cached by
+    (scorer, query, chunk id); chunk ids change with the chunk's content, so entries never
+    go stale. Timings and cache hits are kept for /stats/reranker.
+    """
+
+    def __init__(self, scorer, candidates: int = 50, top_n: int = 5, batch_size: int = 16, cache_size: int = 20000):
+        self.scorer = scorer
+        self.candidates = candidates
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.cache = LRUCache(cache_size)
+        # rerank() runs on the thread pool
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.pairs = 0
+        self.batches = 0
+        self.score_seconds = 0.0
+        self.total_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """The reranker configured by RERANKER (unset or "none" disables it), or None."""
+        kind = os.getenv("RERANKER", "none").lower()
+        if kind in ("", "none"):
+            return None
+        if kind != "cross-encoder":
+            raise ValueError(f"Unknown reranker '{kind}', expected none or cross-encoder")
+        try:
+            scorer = CrossEncoderScorer(os.getenv("RERANKER_MODEL", DEFAULT_CROSS_ENCODER))
+        except ImportError:
+            logger.warning("sentence-transformers not installed. Reranking disabled.")
+            return None
+        return cls(
+            scorer,
+            candidates=int(os.getenv("RERANKER_CANDIDATES", "50")),
+            top_n=int(os.getenv("RERANKER_TOP_N", "5")),
+            batch_size=int(os.getenv("RERANKER_BATCH_SIZE", "16")),
+        )
+
+    def rerank(self, query: str, hits, top_n: int = None) -> list:
+        """Best top_n of the (Document, score) hits by reranker score, as (Document, score)."""
+        start = time.perf_counter()
+        query_key = normalize_text(query)
+        keys = [(self.scorer.name, query_key, doc.id or doc.page_content) for doc, _ in hits]
+        with self._lock:
+            scores = [self.cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        score_start = time.perf_counter()
+        for b in range(0, len(missing), self.batch_size):
+            batch = missing[b:b + self.batch_size]
+            batch_scores = self.scorer(query, [hits[i][0].page_content for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+            with self._lock:
+                self.batches += 1
+                for i in batch:
+                    self.cache.put(keys[i], scores[i])
+        score_seconds = time.perf_counter() - score_start
+
+        order = sorted(range(len(hits)), key=lambda i: -scores[i])[:top_n or self.top_n]
+        with self._lock:
+            self.calls += 1
+            self.pairs += len(missing)
+            self.score_seconds += score_seconds
+            self.total_seconds += time.perf_counter() - start
+        return [(hits[i][0], scores[i]) for i in order]
+
+    def stats(self):
+        return {
+            "scorer": self.scorer.name,
+            "candidates": self.candidates,
+            "top_n": self.top_n,
+            "batch_size": self.batch_size,
+            "calls": self.calls,
+            "pairs_scored": self.pairs,
+            "batches": self.batches,
+            "score_cache": self.cache.stats(),
+            "avg_rerank_ms": round(self.total_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+            "avg_scoring_ms_per_pair": round(self.score_seconds / self.pairs * 1000, 3) if self.pairs else 0.0,
+        }
@@ -0,0 +1,147 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def dir_size(path: str) -> int:
+    """Total size of the files under path, in bytes."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Replaced by a concurrent save
+    return total
+
+
+class ResidentUser:
+    def __init__(self, vector_store, size_bytes: int, bm25_retriever=None):
+        self.vector_store = vector_store
+        self.bm25_retriever = bm25_retriever
+        # Prebuilt retrieval pipeline over the two, built on first query
+        self.pipeline = None
+        self.size_bytes = size_bytes
+        self.hits = 0
+        self.loaded_at = time.time()
+
+
+class ResidencyManager:
+    """Keeps users' vector stores and BM25 retrievers in memory within a byte budget.
+
+    Entries are evicted least recently used first ("lru") or least frequently used first
+    ("lfu", ties broken by recency) once the resident total passes budget_bytes. Sizes are
+    the user's on-disk index size, a proxy for what loading it costs in RAM and page cache.
+    Concurrent first loads of the same user share a single load.
+    """
+
+    def __init__(self, budget_bytes: int, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy '{policy}', expected lru or lfu")
+        self.budget_bytes = budget_bytes
+        self.policy = policy
+        self.entries = OrderedDict()
+        self._loading = {}
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            budget_bytes=int(float(os.getenv("RESIDENCY_BUDGET_MB", "2048")) * 1024 * 1024),
+            policy=os.getenv("RESIDENCY_POLICY", "lru"),
+        )
+
+    def get(self, user_id: str):
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.entries.move_to_end(user_id)
+            entry.hits += 1
+        return entry
+
+    async def get_or_load(self, user_id: str, load_fn):
+        """Returns the user's entry, loading it with `await load_fn(user_id)` on a miss.
+
+        load_fn returns (vector_store, size_bytes), or None if the user has no index.
+        """
+        entry = self.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+
+        task = self._loading.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._load(user_id, load_fn))
+            self._loading[user_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        # shield: one waiter being cancelled must not cancel the load the others share
+        return await asyncio.shield(task)
+
+    async def _load(self, user_id: str, load_fn):
+        start = time.perf_counter()
+        loaded = await load_fn(user_id)
+        self.loads += 1
+        self.load_seconds += time.perf_counter() - start
+        if loaded is None:
+            return None
+        if user_id in self.entries:
+            # An ingestion put a newer store while we were reading the old files
+            return self.entries[user_id]
+        vector_store, size_bytes = loaded
+        return self.put(user_id, vector_store, size_bytes)
+
+    def put(self, user_id: str, vector_store, size_bytes: int, bm25_retriever=None):
+        """Makes vector_store the user's resident store, replacing any previous one."""
+        self.evict(user_id, count=False)
+        entry = ResidentUser(vector_store, size_bytes, bm25_retriever)
+        self.entries[user_id] = entry
+        self.resident_bytes += size_bytes
+        self._evict_over_budget(keep=user_id)
+        return entry
+
+    def evict(self, user_id: str, count: bool = True):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return
+        self.resident_bytes -= entry.size_bytes
+        if count:
+            self.evictions += 1
+            self.evicted_bytes += entry.size_bytes
+
+    def _evict_over_budget(self, keep: str):
+        while self.resident_bytes > self.budget_bytes and len(self.entries) > 1:
+            candidates = [user_id for user_id in self.entries if user_id != keep]
+            if self.policy == "lfu":
+                # OrderedDict order is recency, so min() breaks ties towards the least recent
+                victim = min(candidates, key=lambda user_id: self.entries[user_id].hits)
+            else:
+                victim = candidates[0]
+            logger.info(f"Evicting vector store for user {victim} ({self.entries[victim].size_bytes} bytes)")
+            self.evict(victim)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "resident_users": len(self.entries),
+            "resident_bytes": self.resident_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "loads": self.loads,
+            "avg_load_ms": round(self.load_seconds / self.loads * 1000, 1) if self.loads else 0.0,
+            "loading": len(self._loading),
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
@@ -0,0 +1,179 @@
+import json
+import asyncio
+from collections import OrderedDict
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+from backend.app.services.executors import run_in_thread
+from backend.app.services.telemetry import stage_metrics
+
+RRF_C = 60
+FUSION_METHODS = ("rrf", "weighted")
+# With a per-request k, each list fetches this many times k candidates before fusion
+CANDIDATE_FACTOR = 4
+
+
+class LRUCache:
+    """Bounded in-memory map evicting the least recently used key, with hit/miss counters."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def filter_key(filter: dict = None) -> str:
+    return json.dumps(filter, sort_keys=True) if filter else ""
+
+
+def fuse(ranked_lists, weights, method: str = "rrf", k: int = None, c: int = RRF_C) -> list[tuple[Document, float]]:
+    """Fuses ranked (Document, score) lists into (Document, fused score) pairs, best first.
+
+    "rrf" sums weight / (c + rank) over the lists a chunk appears in, like EnsembleRetriever.
+    "weighted" sums weight * the chunk's min-max normalized score in each list, so input
+    scores must be higher-is-better. Chunks are matched by id (text for id-less chunks).
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {FUSION_METHODS}")
+    slots, docs, positions = {}, [], []
+    for hits in ranked_lists:
+        slot_ids = np.empty(len(hits), dtype=np.int64)
+        for i, (doc, _) in enumerate(hits):
+            key = doc.id or doc.page_content
+            if key not in slots:
+                slots[key] = len(docs)
+                docs.append(doc)
+            slot_ids[i] = slots[key]
+        positions.append(slot_ids)
+
+    fused = np.zeros(len(docs))
+    for hits, slot_ids, weight in zip(ranked_lists, positions, weights):
+        if not len(hits):
+            continue
+        if method == "rrf":
+            contribution = weight / (c + np.arange(1, len(hits) + 1))
+        else:
+            scores = np.fromiter((score for _, score in hits), dtype=np.float64, count=len(hits))
+            span = scores.max() - scores.min()
+            contribution = weight * ((scores - scores.min()) / span if span > 0 else np.ones_like(scores))
+        np.add.at(fused, slot_ids, contribution)
+
+    # Stable, so ties keep first-seen order
+    order = np.argsort(-fused, kind="stable")[:k]
+    return [(docs[i], float(fused[i])) for i in order]
+
+
+def build_qa_chain(llm):
+    """The "stuff" chain RetrievalQA.from_chain_type builds, minus the retriever, so it can be reused."""
+    return create_stuff_documents_chain(llm, PROMPT_SELECTOR.get_prompt(llm))
+
+
+class HybridPipeline:
+    """A user's prebuilt hybrid retrieval over BM25 and FAISS.
+
+    Built once per resident index and reused across requests, replacing the EnsembleRetriever
+    and RetrievalQA that used to be constructed per query. Takes a precomputed query vector,
+    so the question is embedded once (and cached) rather than inside the retriever.
+    asearch() runs the sparse and dense searches concurrently on the thread pool and fuses
+    them with fuse(); weights, k and fusion can be set per request. A per-request k caps
+    the fused result only: each list fetches candidate_factor * k candidates, so a chunk
+    one retriever ranks just below k can still reach the top k on the other's support.
+    Every search returns (Document, score) pairs, higher is better. Search and fusion times
+    are recorded under user_id.
+    """
+
+    def __init__(self, vector_store, bm25_retriever, weights=(0.4, 0.6), sparse_k: int = 3, dense_k: int = 5,
+                 fusion: str = "rrf", user_id: str = None, candidate_factor: int = CANDIDATE_FACTOR):
+        self.vector_store = vector_store
+        self.bm25_retriever = bm25_retriever
+        self.weights = weights # 40% Keyword, 60% Semantic
+        self.sparse_k = sparse_k
+        self.dense_k = dense_k
+        self.fusion = fusion
+        self.user_id = user_id
+        self.candidate_factor = candidate_factor
+
+    def _similarity(self, distance: float) -> float:
+        # FAISS returns L2 distances unless the store uses inner product
+        if self.vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            return float(distance)
+        return -float(distance)
+
+    def dense(self, vector, k: int = None, filter: dict = None) -> list[tuple[Document, float]]:
+        with stage_metrics.span("retrieve_faiss", self.user_id):
+            hits = self.vector_store.similarity_search_with_score_by_vector(vector, k=k or self.dense_k, filter=filter)
+        return [(doc, self._similarity(distance)) for doc, distance in hits]
+
+    def sparse(self, question: str, k: int = None) -> list[tuple[Document, float]]:
+        with stage_metrics.span("retrieve_bm25", self.user_id):
+            return self.bm25_retriever.get_documents_with_scores(question, k or self.sparse_k)
+
+    def _fuse(self, sparse, dense, k, weights, fusion):
+        with stage_metrics.span("fuse", self.user_id):
+            return fuse([sparse, dense], weights or self.weights, fusion or self.fusion, k=k)
+
+    def _candidates(self, k: int = None):
+        return k * self.candidate_factor if k else None
+
+    def search(self, question: str, vector, k: int = None, weights=None, fusion: str = None):
+        """Sparse then dense in the calling thread, fused. k limits the fused result."""
+        fetch_k = self._candidates(k)
+        return self._fuse(self.sparse(question, fetch_k), self.dense(vector, fetch_k), k, weights, fusion)
+
+    async def asearch(self, question: str, vector, k: int = None, weights=None, fusion: str = None):
+        """search(), with the BM25 and FAISS searches running concurrently."""
+        fetch_k = self._candidates(k)
+        sparse, dense = await asyncio.gather(
+            run_in_thread(self.sparse, question, fetch_k),
+            run_in_thread(self.dense, vector, fetch_k),
+        )
+        return self._fuse(sparse, dense, k, weights, fusion)
+
+    def balanced(self, vector, sources: list[str], k: int) -> list[tuple[Document, float]]:
+        """Dense top-k within each source's own chunks, interleaved by rank.
+
+        Every source contributes up to k chunks however many other documents the user has,
+        unlike a metadata post-filter over the global top candidates.
+        """
+        with stage_metrics.span("retrieve_faiss", self.user_id):
+            positions = self.vector_store.source_positions(sources)
+            per_source = [self.vector_store.similarity_search_in(vector, positions[source], k) for source in sources]
+        return [(hits[rank][0], self._similarity(hits[rank][1]))
+                for rank in range(k) for hits in per_source if rank < len(hits)]
+
+    def resolve(self, hits: list[tuple[str, float]]) -> list[tuple[Document, float]]:
+        """(Document, score) pairs for cached (chunk id, score) pairs, skipping deleted chunks."""
+        resolved = []
+        for doc_id, score in hits:
+            doc = self.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                resolved.append((doc, score))
+        return resolved
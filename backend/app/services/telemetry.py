@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Seconds; spans range from sub-millisecond BM25 lookups to minute-long uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   120.0)
+# Users beyond this many get the label "other", which bounds the number of series
+OTHER_USERS = "other"
+
+span_logger = logging.getLogger("rag.spans")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """A labeled Prometheus histogram; observe() is thread-safe and O(log buckets)."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, counts, total in sorted(series):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{_number(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {_number(total)}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class StageMetrics:
+    """Duration histograms of the pipeline stages (parse, embed, retrieve_bm25, llm...) per user.
+
+    span(stage, user_id) times a block; observe() records a duration measured elsewhere, e.g.
+    in a worker process. A sample of spans is also logged as structured records on the
+    "rag.spans" logger. render() is the Prometheus text served at /metrics.
+    """
+
+    def __init__(self, max_users: int = 1000, log_sample_rate: float = 0.01):
+        self.max_users = max_users
+        self.log_sample_rate = log_sample_rate
+        self.stage_seconds = Histogram(
+            "rag_stage_duration_seconds", "Time spent in each RAG pipeline stage.", ("stage", "user")
+        )
+        self._users = set()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_users=int(os.getenv("METRICS_MAX_USERS", "1000")),
+            log_sample_rate=float(os.getenv("SPAN_LOG_SAMPLE_RATE", "0.01")),
+        )
+
+    def _user_label(self, user_id) -> str:
+        if user_id is None:
+            return ""
+        user = str(user_id)
+        if user not in self._users:
+            if len(self._users) >= self.max_users:
+                return OTHER_USERS
+            self._users.add(user)
+        return user
+
+    def observe(self, stage: str, seconds: float, user_id=None):
+        user = self._user_label(user_id)
+        self.stage_seconds.observe(seconds, stage, user)
+        if self.log_sample_rate and random.random() < self.log_sample_rate:
+            span_logger.info("span", extra={"fields": {"stage": stage, "user": user, "ms": round(seconds * 1000, 3)}})
+
+    @contextmanager
+    def span(self, stage: str, user_id=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, user_id)
+
+    def render(self) -> str:
+        return "\n".join(self.stage_seconds.render()) + "\n"
+
+
+stage_metrics = StageMetrics.from_env()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra={"fields": {...}}."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a `rate` share of records below WARNING; warnings, errors and spans always pass.
+
+    Spans are sampled by StageMetrics before a record is even created.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or record.name == span_logger.name or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: records are dropped, and counted, while the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging():
+    """Sends all logging through a bounded queue to a rotating JSON-lines file.
+
+    Request handlers only enqueue records; a background thread formats and writes them.
+    LOG_FILE, LOG_LEVEL (INFO), LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE_RATE (share of
+    INFO/DEBUG records kept) and LOG_QUEUE_SIZE configure it. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    file_handler = RotatingFileHandler(
+        os.getenv("LOG_FILE", "backend.log"),
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        encoding="utf-8",
+        delay=True,
+    )
+    file_handler.setFormatter(JSONFormatter())
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1.0"))))
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(queue_handler)
+    # These log every HTTP/2 frame at DEBUG
+    for name in ("httpx", "httpcore", "hpack", "h2", "urllib3"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flushes queued records to the file and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,361 @@
+import os
+import math
+import uuid
+from collections import defaultdict
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from backend.app.services.chunk_store import ChunkStore, read_state, remove_unused, save_chunk_store
+from backend.app.services.document_manifest import chunk_source
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+
+class ANNConfig:
+    """Which FAISS index a user's corpus gets, and its build/search knobs.
+
+    With index_type="auto" the choice follows corpus size: exact flat search below
+    flat_max vectors, IVF-Flat up to pq_min, IVF-PQ above it. HNSW is opt-in: it has the
+    best latency/recall trade-off but cannot remove vectors, so deletes rebuild it.
+    """
+
+    def __init__(self, index_type: str = "auto", flat_max: int = 20_000, pq_min: int = 500_000,
+                 nlist: int = 0, nprobe: int = 16, hnsw_m: int = 32, ef_construction: int = 80,
+                 ef_search: int = 64, pq_m: int = 64, pq_bits: int = 8):
+        if index_type != "auto" and index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected auto or one of {INDEX_TYPES}")
+        self.index_type = index_type
+        self.flat_max = flat_max
+        self.pq_min = pq_min
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "auto"),
+            flat_max=int(os.getenv("FAISS_FLAT_MAX", "20000")),
+            pq_min=int(os.getenv("FAISS_PQ_MIN", "500000")),
+            nlist=int(os.getenv("FAISS_NLIST", "0")),
+            nprobe=int(os.getenv("FAISS_NPROBE", "16")),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+            ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", "80")),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+            pq_m=int(os.getenv("FAISS_PQ_M", "64")),
+            pq_bits=int(os.getenv("FAISS_PQ_BITS", "8")),
+        )
+
+    def choose(self, n: int, current: str = None) -> str:
+        if self.index_type != "auto":
+            return self.index_type
+        # Step down only once well below a threshold, so a corpus hovering around it
+        # does not migrate back and forth on every upload/delete
+        flat_max = self.flat_max // 2 if current in ("ivf_flat", "ivf_pq") else self.flat_max
+        pq_min = self.pq_min // 2 if current == "ivf_pq" else self.pq_min
+        if n < flat_max:
+            return "flat"
+        return "ivf_flat" if n < pq_min else "ivf_pq"
+
+    def nlist_for(self, n: int) -> int:
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid as FAISS recommends
+        return self.nlist or max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def index_kind(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def _pq_subquantizers(dim: int, m: int) -> int:
+    # IVF-PQ needs the vector dimension to split evenly into m sub-vectors
+    return max(d for d in range(1, min(dim, m) + 1) if dim % d == 0)
+
+
+def build_index(kind: str, vectors: np.ndarray, config: ANNConfig):
+    """Builds (and trains, for IVF) an index of `kind` holding vectors under ids 0..n-1."""
+    n, dim = vectors.shape
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+        return index
+
+    if kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, config.hnsw_m)
+        hnsw.hnsw.efConstruction = config.ef_construction
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        nlist = config.nlist_for(n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim, config.pq_m), config.pq_bits)
+        # Training cost grows with the sample, and ~256 points per centroid is plenty
+        sample_size = min(n, nlist * 256)
+        sample = vectors[np.random.default_rng(0).choice(n, sample_size, replace=False)] if sample_size < n else vectors
+        index.train(sample)
+        # Lets reconstruct() work with sparse ids, for migrations and MMR search
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    index.add_with_ids(vectors, np.arange(n, dtype=np.int64))
+    apply_search_params(index, config)
+    return index
+
+
+def selective_search_params(index, config: ANNConfig, selector):
+    """Search parameters restricting `index` to the ids accepted by selector, keeping nprobe/efSearch."""
+    kind = index_kind(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=config.nprobe)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=config.ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+
+def apply_search_params(index, config: ANNConfig):
+    """Sets nprobe (IVF) or efSearch (HNSW); a no-op for flat indexes."""
+    kind = index_kind(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = config.nprobe
+    elif kind == "hnsw":
+        faiss.downcast_index(faiss.downcast_index(index).index).hnsw.efSearch = config.ef_search
+
+
+class ANNVectorStore(FAISS):
+    """LangChain FAISS store that also works with IVF-Flat, HNSW and IVF-PQ indexes.
+
+    A plain flat index keeps LangChain's positional ids and behaviour. The other kinds are
+    added to with explicit int64 ids that stay stable across deletes, so index_to_docstore_id
+    may have gaps. migrate() rebuilds the index as another kind, e.g. once the corpus outgrows
+    exact search.
+
+    Chunks are persisted in a ChunkStore instead of a pickle. load_local(mmap=True) also
+    memory-maps flat codes and IVF lists instead of reading them into RAM. Such a store is
+    read-only; mutations need a store loaded with mmap=False.
+    """
+
+    # Build/search knobs used when the store rebuilds itself; set by set_search_params
+    ann_config = ANNConfig()
+    mmapped = False
+    # source filename -> FAISS positions of its chunks, built on first use
+    _source_index = None
+
+    @property
+    def kind(self) -> str:
+        return index_kind(self.index)
+
+    @staticmethod
+    def exists(folder_path: str, index_name: str = "index") -> bool:
+        return read_state(folder_path, index_name) is not None or os.path.exists(
+            os.path.join(folder_path, f"{index_name}.faiss"))
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings, index_name: str = "index", *,
+                   allow_dangerous_deserialization: bool = False, mmap: bool = False, **kwargs):
+        docstore = ChunkStore.open(folder_path, index_name)
+        if docstore is None:
+            # Saved before the chunk store: LangChain's index.faiss + pickled docstore.
+            # The next save_local converts it
+            return super().load_local(folder_path, embeddings, index_name,
+                                      allow_dangerous_deserialization=allow_dangerous_deserialization, **kwargs)
+
+        index_path = os.path.join(folder_path, docstore.state["faiss"])
+        if mmap:
+            # IVF lists are mapped by IO_FLAG_MMAP, flat codes (incl. HNSW storage) by IO_FLAG_MMAP_IFC;
+            # FAISS rejects the IVF hook when both are set
+            if docstore.state.get("kind") in ("ivf_flat", "ivf_pq"):
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            else:
+                flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+            index = faiss.read_index(index_path, flags)
+            index_to_docstore_id = docstore.position_map()
+        else:
+            index = faiss.read_index(index_path)
+            index_to_docstore_id = docstore.position_dict()
+        store = cls(embeddings, index, docstore, index_to_docstore_id, **kwargs)
+        store.mmapped = mmap
+        return store
+
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        """Saves the FAISS index and its chunks as the next version of the chunk store.
+
+        Files are versioned rather than overwritten, so a store memory-mapping the previous
+        version keeps reading valid data; they are deleted once no store here reads them.
+        Afterwards the store reads chunks from disk.
+        """
+        save_chunk_store(folder_path, self.docstore, self.index_to_docstore_id,
+                         lambda file_path: faiss.write_index(self.index, file_path), index_name,
+                         extra={"kind": self.kind})
+        # Swap the in-memory/pickled docstore for the saved one, so the next save appends
+        self.docstore = ChunkStore.open(folder_path, index_name)
+        # The replaced docstore no longer holds the previous version's files
+        remove_unused(folder_path, index_name)
+
+    def _check_writable(self):
+        # Mutating memory-mapped codes aborts inside FAISS rather than raising
+        if self.mmapped:
+            raise RuntimeError("This vector store is memory-mapped and read-only; load it with mmap=False to modify it.")
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        self._check_writable()
+        self._source_index = None
+        if self.kind == "flat":
+            return super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+        texts, embeddings = zip(*text_embeddings)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        start = max(self.index_to_docstore_id, default=-1) + 1
+        positions = np.arange(start, start + len(ids), dtype=np.int64)
+        self.index.add_with_ids(vectors, positions)
+        self.docstore.add({
+            id_: Document(id=id_, page_content=text, metadata=metadata)
+            for id_, text, metadata in zip(ids, texts, metadatas)
+        })
+        self.index_to_docstore_id.update(zip(positions.tolist(), ids))
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        self._check_writable()
+        self._source_index = None
+        if self.kind == "flat":
+            return super().delete(ids, **kwargs)
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        missing_ids = set(ids).difference(self.index_to_docstore_id.values())
+        if missing_ids:
+            raise ValueError(f"Some specified ids do not exist in the current store. Ids not found: {missing_ids}")
+
+        reversed_index = {id_: position for position, id_ in self.index_to_docstore_id.items()}
+        positions = [reversed_index[id_] for id_ in ids]
+        if self.kind != "hnsw":
+            self.index.remove_ids(np.array(positions, dtype=np.int64))
+        self.docstore.delete(ids)
+        for position in positions:
+            del self.index_to_docstore_id[position]
+        if self.kind == "hnsw":
+            # HNSW graphs can't drop nodes: rebuild from the surviving vectors
+            self.migrate("hnsw", self.ann_config)
+        return True
+
+    def merge_from(self, target: FAISS) -> None:
+        self._check_writable()
+        self._source_index = None
+        if self.kind == "flat" and index_kind(target.index) == "flat":
+            return super().merge_from(target)
+        positions = sorted(target.index_to_docstore_id)
+        ids = [target.index_to_docstore_id[p] for p in positions]
+        docs = [target.docstore.search(id_) for id_ in ids]
+        vectors = ANNVectorStore.reconstruct_vectors(target, np.array(positions, dtype=np.int64))
+        self.add_embeddings(
+            zip([doc.page_content for doc in docs], vectors),
+            metadatas=[doc.metadata for doc in docs],
+            ids=ids,
+        )
+
+    def reconstruct_vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Stored vectors at the given positions (decoded, so approximate, for IVF-PQ)."""
+        if len(positions) == 0:
+            return np.zeros((0, self.index.d), dtype=np.float32)
+        if index_kind(self.index) == "flat" and len(positions) * 4 > self.index.ntotal:
+            return self.index.reconstruct_n(0, self.index.ntotal)[positions]
+        return self.index.reconstruct_batch(positions)
+
+    def _chunk_source(self, chunk_id: str):
+        source = chunk_source(chunk_id)
+        if source is None:
+            # Not a manifest-style id (e.g. a uuid from an older index): read the metadata
+            doc = self.docstore.search(chunk_id)
+            source = doc.metadata.get("source") if isinstance(doc, Document) else None
+        return source
+
+    def source_positions(self, sources: list[str]) -> dict:
+        """FAISS positions of each source's chunks, as int64 arrays (empty if unknown)."""
+        if self._source_index is None:
+            groups = defaultdict(list)
+            for position, chunk_id in self.index_to_docstore_id.items():
+                groups[self._chunk_source(chunk_id)].append(position)
+            self._source_index = {source: np.array(positions, dtype=np.int64) for source, positions in groups.items()}
+        return {source: self._source_index.get(source, np.zeros(0, dtype=np.int64)) for source in sources}
+
+    def similarity_search_in(self, embedding, positions: np.ndarray, k: int):
+        """Top-k (Document, distance) among the vectors at `positions` only.
+
+        Selections up to ann_config.flat_max vectors are scored exactly from their stored
+        vectors, touching nothing else. Larger ones run the index's own search restricted by
+        an IDSelector, so other chunks can't crowd them out the way a post-filter does.
+        """
+        if len(positions) == 0:
+            return []
+        query = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(query)
+        k = min(k, len(positions))
+        inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        if len(positions) <= self.ann_config.flat_max:
+            vectors = self.reconstruct_vectors(positions)
+            if inner_product:
+                distances = vectors @ query[0]
+                order = np.argsort(-distances, kind="stable")[:k]
+            else:
+                distances = ((vectors - query[0]) ** 2).sum(axis=1)
+                order = np.argsort(distances, kind="stable")[:k]
+            hits = zip(positions[order].tolist(), distances[order].tolist())
+        else:
+            selector = faiss.IDSelectorBatch(positions)
+            params = selective_search_params(self.index, self.ann_config, selector)
+            distances, found = self.index.search(query, k, params=params)
+            hits = [(int(i), float(d)) for i, d in zip(found[0], distances[0]) if i != -1]
+        results = []
+        for position, distance in hits:
+            doc = self.docstore.search(self.index_to_docstore_id[position])
+            if isinstance(doc, Document):
+                results.append((doc, distance))
+        return results
+
+    def migration_target(self, config: ANNConfig):
+        """The index kind this store should move to, or None if it is fine as it is."""
+        n = len(self.index_to_docstore_id)
+        target = config.choose(n, current=self.kind)
+        if target != self.kind:
+            return target
+        # IVF lists trained on a much smaller corpus get long and slow: retrain
+        if target in ("ivf_flat", "ivf_pq") and faiss.extract_index_ivf(self.index).nlist * 2 < config.nlist_for(n):
+            return target
+        return None
+
+    def migrate(self, kind: str, config: ANNConfig, vectors: np.ndarray = None):
+        """Rebuilds the index as `kind`. vectors, if given, are in sorted position order."""
+        self._check_writable()
+        positions = np.array(sorted(self.index_to_docstore_id), dtype=np.int64)
+        if vectors is None:
+            vectors = self.reconstruct_vectors(positions)
+        ids = [self.index_to_docstore_id[p] for p in positions.tolist()]
+        index = build_index(kind, np.ascontiguousarray(vectors, dtype=np.float32), config)
+        # Positions are renumbered 0..n-1 in the new index
+        self.index = index
+        self.index_to_docstore_id = dict(enumerate(ids))
+        self._source_index = None
+        self.ann_config = config
+
+    def set_search_params(self, config: ANNConfig):
+        self.ann_config = config
+        apply_search_params(self.index, config)
@@ -1,75 +1,130 @@
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.colors import HexColor
 from reportlab.lib.enums import TA_CENTER
+from xml.sax.saxutils import escape
+from functools import lru_cache
 import io
 
+FOOTER = "Generated by AIDoc Intel - Project Researcher Laboratory"
+
+
+@lru_cache(maxsize=1)
+def report_styles():
+    """Paragraph styles of the report, built once per process."""
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'MainTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=HexColor('#6366f1'), # Brand Indigo
+            alignment=TA_CENTER,
+            spaceAfter=20
+        ),
+        'heading': styles['Heading2'],
+        'user': ParagraphStyle(
+            'UserMessage',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=HexColor('#374151'),
+            leftIndent=20,
+            spaceBefore=10
+        ),
+        'assistant': ParagraphStyle(
+            'AssistantMessage',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=HexColor('#1f2937'),
+            backgroundColor=HexColor('#f3f4f6'),
+            borderPadding=5,
+            spaceBefore=15,
+            spaceAfter=15
+        ),
+        'sources': styles['Italic'],
+        'footer': ParagraphStyle('Footer', parent=styles['Italic'], fontSize=8, alignment=TA_CENTER),
+    }
+
+
+def markup(text: str) -> str:
+    """Message text as Paragraph markup: escaped, with line breaks kept."""
+    return escape(text or "").replace("\n", "<br/>")
+
+
+def source_names(sources: list) -> tuple:
+    """The documents an answer cites, each once, in the order they were retrieved."""
+    return tuple(dict.fromkeys(s.get('metadata', {}).get('source', 'unknown') for s in sources))
+
+
+def message_flowables(messages, batch_size: int = 50):
+    """Yields the report body as lists of flowables covering batch_size messages each."""
+    styles = report_styles()
+    # Answers citing the same documents share one source line
+    source_lines = {}
+    batch = []
+    for i, msg in enumerate(messages, 1):
+        if msg.get("role", "user") == "user":
+            batch.append(Paragraph(f"<b>Question:</b> {markup(msg.get('content'))}", styles['user']))
+        else:
+            batch.append(Paragraph(f"<b>Researcher Insight:</b> {markup(msg.get('content'))}", styles['assistant']))
+            names = source_names(msg.get("sources") or [])
+            if names:
+                if names not in source_lines:
+                    source_lines[names] = "<i>Sources: " + escape(", ".join(names)) + "</i>"
+                batch.append(Paragraph(source_lines[names], styles['sources']))
+        batch.append(Spacer(1, 10))
+        if i % batch_size == 0:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BatchedFlowables(list):
+    """The flowable list SimpleDocTemplate.build() consumes, refilled one batch at a time.
+
+    build() lays out and removes flowables from the front while len() is non-zero, so
+    refilling on len() keeps only the current batch of Paragraphs alive instead of the
+    whole session's.
+    """
+
+    def __init__(self, batches):
+        super().__init__()
+        self.batches = iter(batches)
+
+    def __len__(self):
+        if not super().__len__():
+            self.extend(next(self.batches, []))
+        return super().__len__()
+
+
+def render_session_report(session_title, messages, out, batch_size: int = 50):
+    """Renders the report to `out`, a path or binary file, laying out batch_size messages at a time.
+
+    Pages are compressed as they are finished, but reportlab writes the file only once the
+    last page is done, so nothing can be sent before rendering ends.
+    """
+    styles = report_styles()
+    doc = SimpleDocTemplate(out, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+
+    def batches():
+        # Header
+        yield [
+            Paragraph("AI Document Intelligence Report", styles['title']),
+            Paragraph(f"Session: {escape(session_title or 'Research Session')}", styles['heading']),
+            Spacer(1, 12),
+        ]
+        yield from message_flowables(messages, batch_size)
+        # Footer
+        yield [Spacer(1, 50), Paragraph(FOOTER, styles['footer'])]
+
+    doc.build(BatchedFlowables(batches()))
+
+
 def generate_session_report(session_title, messages):
     """Generates a professional PDF report from a list of chat messages."""
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
-    styles = getSampleStyleSheet()
-    
-    # Custom Styles
-    title_style = ParagraphStyle(
-        'MainTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=HexColor('#6366f1'), # Brand Indigo
-        alignment=TA_CENTER,
-        spaceAfter=20
-    )
-    
-    bubble_user = ParagraphStyle(
-        'UserMessage',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=HexColor('#374151'),
-        leftIndent=20,
-        spaceBefore=10
-    )
-    
-    bubble_ai = ParagraphStyle(
-        'AssistantMessage',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=HexColor('#1f2937'),
-        backgroundColor=HexColor('#f3f4f6'),
-        borderPadding=5,
-        spaceBefore=15,
-        spaceAfter=15
-    )
-
-    content = []
-    
-    # Header
-    content.append(Paragraph("AI Document Intelligence Report", title_style))
-    content.append(Paragraph(f"Session: {session_title or 'Research Session'}", styles['Heading2']))
-    content.append(Spacer(1, 12))
-    
-    # Body
-    for msg in messages:
-        role = msg.get("role", "user")
-        text = msg.get("content", "")
-        
-        if role == "user":
-            content.append(Paragraph(f"<b>Question:</b> {text}", bubble_user))
-        else:
-            content.append(Paragraph(f"<b>Researcher Insight:</b> {text}", bubble_ai))
-            
-            # Sources if available
-            sources = msg.get("sources", [])
-            if sources:
-                source_text = "<i>Sources: " + ", ".join(list(set([s['metadata']['source'] for s in sources]))) + "</i>"
-                content.append(Paragraph(source_text, styles['Italic']))
-        
-        content.append(Spacer(1, 10))
-
-    # Footer
-    content.append(Spacer(1, 50))
-    content.append(Paragraph("Generated by AIDoc Intel - Project Researcher Laboratory", styles['Caption']))
-
-    doc.build(content)
+    render_session_report(session_title, messages, buffer)
     buffer.seek(0)
     return buffer
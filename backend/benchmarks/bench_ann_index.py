@@ -0,0 +1,111 @@
+"""
+Recall@k against query latency for each FAISS index type, on synthetic vectors.
+
+    python -m backend.benchmarks.bench_ann_index --vectors 200000 --dim 768 --nprobe 4 16 64 --ef-search 32 64 128
+
+Vectors are clustered and low-rank, like real embeddings, and ground truth comes from exact flat search. For every index type and knob value it reports
+build time (including IVF training), index size, recall@k and p50/p95 single-query latency,
+the same access pattern as RAGService. Use it to pick FAISS_* settings offline.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+from backend.app.services.vector_index import ANNConfig, apply_search_params, build_index
+
+
+def make_vectors(n: int, dim: int, clusters: int, rng, latent_dim: int = 48):
+    # Real embeddings are clustered and have far fewer intrinsic dimensions than coordinates:
+    # sample clustered points in a low-dimensional space and project them up, plus a little noise
+    space = np.random.default_rng(42)
+    centres = space.standard_normal((clusters, latent_dim))
+    projection = space.standard_normal((latent_dim, dim)) / np.sqrt(latent_dim)
+    latent = centres[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, latent_dim))
+    return (latent @ projection + 0.05 * rng.standard_normal((n, dim))).astype(np.float32)
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def measure(index, queries, truth, k, threads):
+    faiss.omp_set_num_threads(threads)
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(found[0].tolist()) & set(expected.tolist()))
+    return {
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+    }
+
+
+def main(args):
+    build_threads = faiss.omp_get_max_threads()
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors, args.dim, args.clusters, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, rng)
+
+    results = []
+    for kind in args.types:
+        config = ANNConfig(index_type=kind, nlist=args.nlist, hnsw_m=args.hnsw_m, pq_m=args.pq_m)
+        faiss.omp_set_num_threads(build_threads)
+        start = time.perf_counter()
+        index = build_index(kind, vectors, config)
+        build_s = time.perf_counter() - start
+        if kind == "flat":
+            _, truth = index.search(queries, args.k)
+        entry = {
+            "type": kind,
+            "build_s": round(build_s, 3),
+            "index_mb": round(faiss.serialize_index(index).nbytes / 1e6, 1),
+            "runs": [],
+        }
+        if kind in ("ivf_flat", "ivf_pq"):
+            entry["nlist"] = faiss.extract_index_ivf(index).nlist
+            knobs = [("nprobe", v) for v in args.nprobe]
+        elif kind == "hnsw":
+            knobs = [("ef_search", v) for v in args.ef_search]
+        else:
+            knobs = [(None, None)]
+        for name, value in knobs:
+            if name:
+                setattr(config, name, value)
+                apply_search_params(index, config)
+            run = measure(index, queries, truth, args.k, args.threads)
+            if name:
+                run = {name: value, **run}
+            entry["runs"].append(run)
+        results.append(entry)
+        print(json.dumps(entry), flush=True)
+
+    print(json.dumps({"vectors": args.vectors, "dim": args.dim, "k": args.k, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768, help="models/embedding-001 returns 768 dims")
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=["flat", "ivf_flat", "hnsw", "ivf_pq"],
+                        help="flat must come first: it provides the ground truth")
+    parser.add_argument("--nlist", type=int, default=0, help="0 picks ~4*sqrt(n)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads per search")
+    args = parser.parse_args()
+    if args.types[0] != "flat":
+        parser.error("--types must start with flat")
+    main(args)
@@ -0,0 +1,114 @@
+"""
+BM25Index (inverted index + MaxScore pruning) against LangChain's BM25Retriever (rank_bm25).
+
+    python -m backend.benchmarks.bench_bm25 --chunks 20000 100000 --queries 200
+
+For each corpus size reports build time, p50/p95 query latency for rank_bm25, exhaustive
+BM25Index scoring and pruned BM25Index scoring, recall@k of the pruned search against the
+exhaustive one (MaxScore is exact, so this should be 1.0) and against rank_bm25 (lower,
+since rank_bm25 uses Okapi IDF with an epsilon floor rather than Lucene's), the
+cost of an incremental add compared with a full rebuild, and the same pruned/exhaustive
+recall after deleting every 7th chunk (tombstoned, below the compaction ratio), with the
+number of queries the pruned search wrongly answers with nothing.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from langchain_community.retrievers import BM25Retriever
+from langchain_core.documents import Document
+
+from backend.app.services.bm25_index import BM25Index, tokenize
+
+
+def make_corpus(n: int, vocab_size: int = 30000, seed: int = 0):
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    # Zipf-like term distribution, like real text: a few very common terms, a long tail
+    weights = [1 / (i + 1) for i in range(vocab_size)]
+    return [" ".join(rng.choices(vocab, weights, k=rng.randint(80, 180))) for _ in range(n)]
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def timed(fn, queries):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(fn(q))
+        latencies.append(time.perf_counter() - start)
+    return results, {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+    }
+
+
+def recall(results, reference):
+    scores = [len(set(r) & set(ref)) / len(ref) for r, ref in zip(results, reference) if ref]
+    return round(sum(scores) / len(scores), 4) if scores else None
+
+
+def run(n, args):
+    texts = make_corpus(n)
+    ids = [str(i) for i in range(n)]
+    rng = random.Random(1)
+    queries = [" ".join(rng.sample(tokenize(rng.choice(texts)), args.terms)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    index = BM25Index.build(ids, texts)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    retriever = BM25Retriever.from_documents([Document(page_content=t, id=i) for t, i in zip(texts, ids)], k=args.k)
+    baseline_build_s = time.perf_counter() - start
+
+    exhaustive, exhaustive_lat = timed(lambda q: [d for d, _ in index.search(q, args.k, prune=False)], queries)
+    pruned, pruned_lat = timed(lambda q: [d for d, _ in index.search(q, args.k)], queries)
+    baseline, baseline_lat = timed(lambda q: [d.id for d in retriever.invoke(q)], queries)
+
+    # Incremental add of 1% new chunks vs rebuilding everything
+    extra = make_corpus(max(1, n // 100), seed=2)
+    extra_ids = [f"new-{i}" for i in range(len(extra))]
+    start = time.perf_counter()
+    index.add(extra_ids, extra)
+    add_s = time.perf_counter() - start
+    start = time.perf_counter()
+    rebuilt = BM25Index.build(ids + extra_ids, texts + extra)
+    rebuild_s = time.perf_counter() - start
+    incremental_matches = recall([[d for d, _ in index.search(q, args.k, prune=False)] for q in queries[:50]],
+                                 [[d for d, _ in rebuilt.search(q, args.k, prune=False)] for q in queries[:50]])
+
+    # Deletes short of compaction leave tombstoned rows in the postings
+    index.delete(ids[::7])
+    exhaustive_deleted = [[d for d, _ in index.search(q, args.k, prune=False)] for q in queries]
+    pruned_deleted = [[d for d, _ in index.search(q, args.k)] for q in queries]
+
+    return {
+        "chunks": n,
+        "build_s": {"bm25_index": round(build_s, 3), "rank_bm25": round(baseline_build_s, 3)},
+        "latency": {"rank_bm25": baseline_lat, "bm25_index_exhaustive": exhaustive_lat, "bm25_index_pruned": pruned_lat},
+        f"recall@{args.k}": {"pruned_vs_exhaustive": recall(pruned, exhaustive), "pruned_vs_rank_bm25": recall(pruned, baseline)},
+        "incremental_add_1pct_s": round(add_s, 3),
+        "full_rebuild_s": round(rebuild_s, 3),
+        "incremental_matches_rebuild": incremental_matches,
+        "after_delete": {
+            "tombstoned": int(index.deleted.sum()),
+            f"pruned_vs_exhaustive_recall@{args.k}": recall(pruned_deleted, exhaustive_deleted),
+            "pruned_empty": sum(1 for p, e in zip(pruned_deleted, exhaustive_deleted) if e and not p),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--terms", type=int, default=4, help="Terms per query")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps([run(n, args) for n in args.chunks], indent=2))
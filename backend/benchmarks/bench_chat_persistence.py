@@ -0,0 +1,125 @@
+"""
+Chat history persistence cost per /query: synchronous round trips against the write-behind writer.
+
+    python -m backend.benchmarks.bench_chat_persistence --requests 500 --sessions 20 --concurrency 1 16 --rtt-ms 80
+
+Both paths write to a SQLiteRepository behind a wrapper that waits rtt_ms per call, standing
+in for the Supabase/PostgREST round trip. "sync" is the previous save_chat_messages: session
+lookup, session insert when missing, then one insert per message, all on the request path.
+"write_behind" is ChatHistoryWriter: the request only queues the exchange, and batches
+are flushed in the background. Reports the persistence time each request waits for, round
+trips, time until everything is durable, and checks that every message was stored in order.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from backend.app.services.chat_persistence import ChatHistoryWriter
+from backend.app.services.repository import SQLiteRepository
+from backend.benchmarks.bench_bm25 import percentile
+
+
+class RoundTripRepository:
+    """Forwards chat writes to a repository, waiting `rtt` seconds per call like a remote database."""
+
+    def __init__(self, repository, rtt: float):
+        self.repository = repository
+        self.rtt = rtt
+        self.calls = 0
+
+    async def round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+
+    async def ensure_sessions(self, sessions):
+        await self.round_trip()
+        await self.repository.ensure_sessions(sessions)
+
+    async def insert_messages(self, messages):
+        await self.round_trip()
+        await self.repository.insert_messages(messages)
+
+
+async def legacy_save(repository: RoundTripRepository, known: set, session_id: str, user_id: str, question: str,
+                      answer: str):
+    # select id from chat_sessions, insert if missing, then one insert per message
+    await repository.round_trip()
+    if session_id not in known:
+        await repository.ensure_sessions([{"id": session_id, "user_id": user_id, "title": "New Chat Session"}])
+        known.add(session_id)
+    now = time.time()
+    for offset, (role, content) in enumerate((("user", question), ("assistant", answer))):
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now % 1 * 1e6) + offset:06d}+00:00"
+        await repository.insert_messages([{"session_id": session_id, "role": role, "content": content, "sources": [],
+                                           "created_at": created_at}])
+
+
+def check_order(path: str, expected: int) -> bool:
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT session_id, role, content FROM chat_messages ORDER BY session_id, created_at").fetchall()
+    conn.close()
+    if len(rows) != expected:
+        return False
+    # Every question is directly followed by its answer
+    return all(rows[i][1] == "user" and rows[i + 1][1] == "assistant" and rows[i + 1][2] == f"answer to {rows[i][2]}"
+               for i in range(0, len(rows), 2))
+
+
+async def run_path(name: str, args, concurrency: int, tmp: str):
+    path = os.path.join(tmp, f"{name}-{concurrency}.sqlite")
+    repository = RoundTripRepository(SQLiteRepository(path), args.rtt_ms / 1000)
+    writer = ChatHistoryWriter(repository, batch_size=args.batch_size, flush_interval=args.flush_ms / 1000)
+    known = set()
+    waits = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i):
+        session_id, question = f"session-{i % args.sessions}", f"question {i}"
+        async with semaphore:
+            start = time.perf_counter()
+            if name == "sync":
+                await legacy_save(repository, known, session_id, "user", question, f"answer to {question}")
+            else:
+                await writer.enqueue(session_id, "user", question, {"answer": f"answer to {question}", "sources": []})
+            waits.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[request(i) for i in range(args.requests)])
+    await writer.close()
+    durable_s = time.perf_counter() - start
+    return {
+        "request_wait_p50_ms": round(statistics.median(waits) * 1000, 3),
+        "request_wait_p95_ms": round(percentile(waits, 0.95) * 1000, 3),
+        "round_trips": repository.calls,
+        "all_durable_s": round(durable_s, 3),
+        "ordered_and_complete": check_order(path, 2 * args.requests),
+    }
+
+
+async def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrency in args.concurrency:
+            entry = {"requests": args.requests, "sessions": args.sessions, "concurrency": concurrency,
+                     "rtt_ms": args.rtt_ms}
+            for name in ("sync", "write_behind"):
+                entry[name] = await run_path(name, args, concurrency, tmp)
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--rtt-ms", type=float, default=80)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-ms", type=float, default=500)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+Load time and memory of the chunk store against LangChain's pickled docstore.
+
+    python -m backend.benchmarks.bench_chunk_store --chunks 20000 100000
+
+Saves the same synthetic corpus (1000-char chunks, real-looking metadata, 768-dim vectors)
+both ways, then loads each format in a fresh subprocess and reports load time, RSS growth
+after loading, and the latency of one top-k search including materializing the hits.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+WORDS = ("reactor cooling pressure turbine sodium containment valve sensor signal budget "
+         "revenue forecast contract clause liability warranty schedule").split()
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build(path: str, n: int, dim: int):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from backend.app.services.vector_index import ANNVectorStore
+
+    rng = random.Random(0)
+    texts = [" ".join(rng.choices(WORDS, k=140))[:1000] for _ in range(n)]
+    metadatas = [{"source": f"report-{i % 50}.pdf", "page": i % 300, "page_label": str(i % 300 + 1),
+                  "total_pages": 300} for i in range(n)]
+    ids = [f"report-{i % 50}.pdf#{i:012x}#{i}" for i in range(n)]
+    vectors = np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32).tolist()
+    store = FAISS.from_embeddings(list(zip(texts, vectors)), DeterministicFakeEmbedding(size=dim),
+                                  metadatas=metadatas, ids=ids)
+    store.save_local(os.path.join(path, "pickle"))
+    ANNVectorStore(store.embedding_function, store.index, store.docstore, store.index_to_docstore_id).save_local(
+        os.path.join(path, "chunk_store"))
+
+
+def child(fmt: str, path: str, dim: int, k: int):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from backend.app.services.vector_index import ANNVectorStore
+
+    embeddings = DeterministicFakeEmbedding(size=dim)
+    before = rss_mb()
+    start = time.perf_counter()
+    store = ANNVectorStore.load_local(os.path.join(path, "pickle" if fmt == "pickle" else "chunk_store"), embeddings,
+                                      allow_dangerous_deserialization=True, mmap=fmt == "chunk_store_mmap")
+    load_s = time.perf_counter() - start
+    loaded = rss_mb()
+    query = np.random.default_rng(1).standard_normal(dim).astype(np.float32).tolist()
+    start = time.perf_counter()
+    docs = store.similarity_search_by_vector(query, k=k)
+    search_ms = (time.perf_counter() - start) * 1000
+    assert len(docs) == k
+    print(json.dumps({
+        "load_s": round(load_s, 3),
+        "rss_after_load_mb": round(loaded - before, 1),
+        "first_search_ms": round(search_ms, 2),
+    }))
+
+
+def main(args):
+    results = []
+    for n in args.chunks:
+        with tempfile.TemporaryDirectory() as tmp:
+            build(tmp, n, args.dim)
+            sizes = {
+                fmt: round(sum(os.path.getsize(os.path.join(tmp, fmt, f)) for f in os.listdir(os.path.join(tmp, fmt))) / 1e6, 1)
+                for fmt in ("pickle", "chunk_store")
+            }
+            entry = {"chunks": n, "disk_mb": sizes}
+            for fmt in ("pickle", "chunk_store", "chunk_store_mmap"):
+                out = subprocess.run(
+                    [sys.executable, "-m", "backend.benchmarks.bench_chunk_store", "--child", fmt, tmp,
+                     "--dim", str(args.dim), "--k", str(args.k)],
+                    capture_output=True, text=True, check=True,
+                ).stdout.strip().splitlines()[-1]
+                entry[fmt] = json.loads(out)
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], args.dim, args.k)
+    else:
+        main(args)
@@ -0,0 +1,106 @@
+"""
+Evidence per document for compare_documents: metadata post-filter against per-source pre-filtering.
+
+    python -m backend.benchmarks.bench_compare_filter --documents 200 --chunks-per-doc 250 --select 2 5
+
+Builds one user's store of many documents, then for random selections of documents retrieves
+comparison context the old way (LangChain's filter={"source": {"$in": ...}} applied to the
+global top fetch_k candidates, k=10) and the new way (HybridPipeline.balanced: exact or
+IDSelector-restricted top-k inside each selected document). Reports how many selected
+documents got at least one chunk, chunks per document, recall against the exact per-document
+top-k, and latency, for each index type.
+"""
+import argparse
+import json
+import math
+import statistics
+import time
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.app.services.retrieval import HybridPipeline
+from backend.app.services.vector_index import ANNConfig, ANNVectorStore
+from backend.benchmarks.bench_ann_index import make_vectors
+
+COMPARE_K = 10
+
+
+def build_store(documents: int, chunks_per_doc: int, dim: int, kind: str, rng):
+    n = documents * chunks_per_doc
+    vectors = make_vectors(n, dim, clusters=max(8, documents // 4), rng=rng)
+    sources = [f"report-{i % documents}.pdf" for i in range(n)]
+    ids = [f"{source}#{'0' * 12}#{i}" for i, source in enumerate(sources)]
+    store = ANNVectorStore.from_embeddings(
+        list(zip([str(i) for i in range(n)], vectors.tolist())), DeterministicFakeEmbedding(size=dim),
+        metadatas=[{"source": source} for source in sources], ids=ids,
+    )
+    config = ANNConfig()
+    if kind != "flat":
+        store.migrate(kind, config)
+    store.set_search_params(config)
+    return store, vectors, np.array(sources)
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    results = []
+    for kind in args.index_types:
+        store, vectors, sources = build_store(args.documents, args.chunks_per_doc, args.dim, kind, rng)
+        pipeline = HybridPipeline(store, None)
+        start = time.perf_counter()
+        store.source_positions([])
+        index_ms = (time.perf_counter() - start) * 1000
+        for select in args.select:
+            k = max(2, math.ceil(COMPARE_K / select))
+            stats = {"post_filter": [], "balanced": []}
+            for _ in range(args.queries):
+                filenames = [f"report-{i}.pdf" for i in rng.choice(args.documents, select, replace=False)]
+                query = vectors[rng.integers(len(vectors))] + 0.1 * rng.standard_normal(args.dim).astype(np.float32)
+                truth = {}
+                for filename in filenames:
+                    members = np.flatnonzero(sources == filename)
+                    distances = ((vectors[members] - query) ** 2).sum(axis=1)
+                    truth[filename] = set(members[np.argsort(distances)[:k]].tolist())
+
+                runs = {
+                    "post_filter": lambda: store.similarity_search_by_vector(
+                        query.tolist(), k=COMPARE_K, filter={"source": {"$in": filenames}}),
+                    "balanced": lambda: [doc for doc, _ in pipeline.balanced(query.tolist(), filenames, k)],
+                }
+                for name, run in runs.items():
+                    start = time.perf_counter()
+                    docs = run()
+                    elapsed = (time.perf_counter() - start) * 1000
+                    per_doc = {filename: [int(d.page_content) for d in docs if d.metadata["source"] == filename]
+                               for filename in filenames}
+                    hits = sum(len(truth[f] & set(per_doc[f])) for f in filenames)
+                    stats[name].append({
+                        "ms": elapsed,
+                        "covered": sum(1 for f in filenames if per_doc[f]) / select,
+                        "min_per_doc": min(len(v) for v in per_doc.values()),
+                        "recall": hits / sum(len(t) for t in truth.values()),
+                    })
+            entry = {"index": kind, "chunks": len(vectors), "select": select, "k_per_doc": k,
+                     "source_index_build_ms": round(index_ms, 1)}
+            for name, samples in stats.items():
+                entry[name] = {
+                    "docs_covered": round(statistics.fmean(s["covered"] for s in samples), 3),
+                    "min_chunks_per_doc": min(s["min_per_doc"] for s in samples),
+                    "recall_vs_exact_per_doc": round(statistics.fmean(s["recall"] for s in samples), 3),
+                    "p50_ms": round(statistics.median(s["ms"] for s in samples), 2),
+                }
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--chunks-per-doc", type=int, default=250)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--select", type=int, nargs="+", default=[2, 5])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "ivf_flat", "hnsw"])
+    main(parser.parse_args())
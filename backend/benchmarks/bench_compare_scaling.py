@@ -0,0 +1,87 @@
+"""
+compare_documents latency against the number of files, for map-step concurrency limits.
+
+    python -m backend.benchmarks.bench_compare_scaling --files 1 2 4 8 16 --concurrency 1 4 8 --llm-latency-ms 400
+
+Indexes synthetic PDFs for one user and compares growing selections of them. The chat
+model is a fake with a fixed latency per call (map summaries and the reduce call alike),
+so the numbers show how the map-reduce schedule scales: with concurrency c, n files cost
+about ceil(n / c) + 1 LLM round trips cold. "warm" repeats the comparison with the same
+aspect, when every per-document summary comes from the (document hash, aspect) cache.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from backend.app.services.comparison import MapReduceComparison
+from backend.app.services.embedding_cache import EmbeddingCache
+from backend.benchmarks.bench_pdf_pipeline import make_pdf
+from backend.benchmarks.bench_query_overhead import SlowEmbeddings, rag_service
+
+USER_ID = "bench"
+
+
+class SlowChatModel(FakeListChatModel):
+    """Fake chat model that takes `latency` seconds per call."""
+    latency: float = 0.0
+
+    async def _agenerate(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+async def timed_compare(filenames, aspect):
+    start = time.perf_counter()
+    await rag_service.compare_documents(USER_ID, filenames, aspect)
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        rag_service.index_dir = os.path.join(tmp, "vector_index")
+        rag_service.embedding_cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        rag_service.embeddings = SlowEmbeddings(size=args.dim)
+        rag_service.llm = SlowChatModel(responses=["summary"], latency=args.llm_latency_ms / 1000)
+
+        paths = []
+        for i in range(max(args.files)):
+            path = os.path.join(tmp, f"report-{i}.pdf")
+            make_pdf(path, args.pages, seed=i)
+            paths.append(path)
+        await rag_service.process_pdfs(paths, USER_ID)
+        filenames = [os.path.basename(path) for path in paths]
+
+        results = []
+        for concurrency in args.concurrency:
+            rag_service.comparison = MapReduceComparison(max_concurrency=concurrency)
+            for n in args.files:
+                aspect = f"risk factors, run {concurrency}-{n}"
+                entry = {
+                    "concurrency": concurrency,
+                    "files": n,
+                    "cold_ms": await timed_compare(filenames[:n], aspect),
+                    "warm_ms": await timed_compare(filenames[:n], aspect),
+                }
+                results.append(entry)
+                print(json.dumps(entry), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+Prompt tokens per query with and without context packing, unbudgeted (the default) and at
+several token budgets.
+
+    python -m backend.benchmarks.bench_context_packing --pages 120 --queries 200 --budgets 1000 1500 2000 4000
+
+Indexes synthetic PDFs for one user, then runs the hybrid (BM25 + FAISS) retrieval of
+RAGService.query for keyword questions and packs the results with ContextPacker. Reports
+estimated context tokens before and after, duplicates dropped, chunks merged and packing
+time. Prompt processing time of the LLM grows with these tokens; the fake embeddings make
+the dense half of the ranking arbitrary, so overlaps here come mostly from BM25 and FAISS
+returning the same or neighbouring chunks.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from backend.app.services.context_packing import ContextPacker, estimate_tokens
+from backend.app.services.embedding_cache import EmbeddingCache
+from backend.benchmarks.bench_pdf_pipeline import WORDS, make_pdf
+from backend.benchmarks.bench_query_overhead import SlowEmbeddings, rag_service
+
+USER_ID = "bench"
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        rag_service.index_dir = os.path.join(tmp, "vector_index")
+        rag_service.embedding_cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        rag_service.embeddings = SlowEmbeddings(size=args.dim)
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"report-{i}.pdf")
+            make_pdf(path, args.pages // args.files, seed=i)
+            paths.append(path)
+        await rag_service.process_pdfs(paths, USER_ID)
+        pipeline = await rag_service._pipeline(USER_ID)
+
+        rng = random.Random(0)
+        retrieved = []
+        for _ in range(args.queries):
+            question = " ".join(rng.sample(WORDS, 3))
+            vector = await rag_service._embed_query(question)
+            retrieved.append([doc for doc, _ in pipeline.search(question, vector)])
+
+        results = []
+        for budget in [None] + args.budgets:
+            packer = ContextPacker(token_budget=budget)
+            timings = []
+            for docs in retrieved:
+                start = time.perf_counter()
+                packer.pack(docs)
+                timings.append((time.perf_counter() - start) * 1e6)
+            stats = packer.stats()
+            entry = {
+                "budget": budget,
+                "avg_chunks_in": round(stats["chunks_in"] / args.queries, 2),
+                "avg_passages_out": round(stats["chunks_out"] / args.queries, 2),
+                "avg_tokens_in": round(stats["tokens_in"] / args.queries, 1),
+                "avg_tokens_out": stats["avg_tokens_out"],
+                "token_reduction": stats["token_reduction"],
+                "duplicates_dropped": stats["duplicates_dropped"],
+                "chunks_merged": stats["chunks_merged"],
+                "over_budget_dropped": stats["over_budget_dropped"],
+                "pack_p50_us": round(statistics.median(timings), 1),
+            }
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+        unpacked = [sum(estimate_tokens(doc.page_content) for doc in docs) for docs in retrieved]
+        print(json.dumps({"unpacked_max_tokens": max(unpacked), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[1000, 1500, 2000, 4000])
+    asyncio.run(run(parser.parse_args()))
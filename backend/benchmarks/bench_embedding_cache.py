@@ -0,0 +1,105 @@
+"""
+Re-ingest time with and without the embedding cache.
+
+    python -m backend.benchmarks.bench_embedding_cache --chunks 5000 --latency-ms 150
+
+Embeds a synthetic corpus through EmbeddingScheduler against a fake API with fixed
+per-request latency, first cold and then again (a re-upload of the same documents),
+and reports wall time and cache hit/miss counters for both passes. A last pass fails
+mid-way with 429s and is retried: only the texts the failed pass did not get may reach
+the API again, and progress must count every chunk.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from backend.app.services.embedding_cache import EmbeddingCache
+from backend.app.services.embedding_scheduler import EmbeddingScheduler, EmbeddingError
+
+
+def make_fake_embed(latency: float, dim: int):
+    async def embed(texts):
+        await asyncio.sleep(latency)
+        return [[b / 255.0 for b in hashlib.sha256(t.encode("utf-8")).digest()[:dim]] for t in texts]
+    return embed
+
+
+def make_failing_embed(embed_fn, succeed: int):
+    """embed_fn that answers 429 to every call after the first `succeed`."""
+    calls = 0
+
+    async def embed(texts):
+        nonlocal calls
+        calls += 1
+        if calls > succeed:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return await embed_fn(texts)
+    return embed
+
+
+async def ingest(cache, texts, embed_fn, max_retries: int = 6):
+    scheduler = EmbeddingScheduler(embed_fn, requests_per_minute=100_000, tokens_per_minute=100_000_000,
+                                   max_retries=max_retries, base_delay=0.01, max_delay=0.05)
+    before = cache.stats()
+    progress = []
+    start = time.perf_counter()
+    result = {}
+    try:
+        await cache.embed("fake-embedding", texts, scheduler.embed,
+                          progress_callback=lambda done, total: progress.append((done, total)))
+    except EmbeddingError as e:
+        result["failed_with_partial"] = len(e.partial)
+    elapsed = time.perf_counter() - start
+    after = cache.stats()
+    return {
+        "seconds": round(elapsed, 3),
+        "api_requests": scheduler.stats()["requests"],
+        "api_texts": scheduler.stats()["texts"],
+        "hits": after["hits"] - before["hits"],
+        "misses": after["misses"] - before["misses"],
+        "last_progress": progress[-1] if progress else None,
+        **result,
+    }
+
+
+async def main(args):
+    texts = [f"Section {i}. " + "The quarterly report covers revenue and risk. " * (5 + i % 15)
+             for i in range(args.chunks)]
+    embed_fn = make_fake_embed(args.latency_ms / 1000, dim=32)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "cache.sqlite"), max_bytes=args.max_mb * 1024 * 1024)
+        cold = await ingest(cache, texts, embed_fn)
+        warm = await ingest(cache, texts, embed_fn)
+        # Half the corpus changed: only the new half should reach the API
+        mixed = await ingest(cache, texts[: args.chunks // 2] + [t + " (rev 2)" for t in texts[args.chunks // 2:]], embed_fn)
+        for run in (cold, warm, mixed):
+            assert run["last_progress"] == (args.chunks, args.chunks), run
+        # A pass that gives up half way keeps what it embedded: the retry only sends the rest
+        revised = [t + " (rev 3)" for t in texts]
+        failed = await ingest(cache, revised, make_failing_embed(embed_fn, succeed=5), max_retries=0)
+        assert 0 < failed["failed_with_partial"] < args.chunks, failed
+        retried = await ingest(cache, revised, embed_fn)
+        assert retried["hits"] == failed["failed_with_partial"], (failed, retried)
+        assert retried["api_texts"] == args.chunks - failed["failed_with_partial"], (failed, retried)
+        print(json.dumps({
+            "chunks": args.chunks,
+            "cold": cold,
+            "reingest": warm,
+            "half_changed": mixed,
+            "failed_mid_way": failed,
+            "retry_after_failure": retried,
+            "speedup": round(cold["seconds"] / max(warm["seconds"], 1e-9), 1),
+            "cache": cache.stats(),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--max-mb", type=int, default=256)
+    asyncio.run(main(parser.parse_args()))
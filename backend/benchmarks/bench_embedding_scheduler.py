@@ -0,0 +1,115 @@
+"""
+Drives EmbeddingScheduler against the local fake embeddings server with injected 429s.
+
+    python -m backend.benchmarks.bench_embedding_scheduler --texts 2000 --rate-limit 0.25
+
+Checks that every vector is correct, that no text was embedded twice (rate-limited batches
+are retried, successful ones are not), and that a run the server cuts off after
+--fail-after requests can be resumed from EmbeddingError.partial (directly and through
+embed_resumable) without re-sending the texts that already succeeded.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from backend.app.services.embedding_scheduler import EmbeddingScheduler, EmbeddingError
+from backend.benchmarks.fake_embeddings_server import FakeEmbeddingsServer, fake_vector
+
+
+def make_embed_fn(client, url):
+    async def embed(texts):
+        res = await client.post(f"{url}/embed", json={"texts": texts})
+        res.raise_for_status()
+        return res.json()["embeddings"]
+    return embed
+
+
+async def run(args):
+    server = FakeEmbeddingsServer(rate_limit=args.rate_limit, retry_after=args.retry_after).start()
+    texts = [f"chunk {i}: " + "lorem ipsum " * (i % 40) for i in range(args.texts)]
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        embed_fn = make_embed_fn(client, server.url)
+
+        scheduler = EmbeddingScheduler(embed_fn, requests_per_minute=args.rpm, max_concurrency=args.concurrency,
+                                       base_delay=0.05, max_delay=1.0)
+        start = time.perf_counter()
+        vectors = await scheduler.embed(texts)
+        elapsed = time.perf_counter() - start
+
+        correct = all(v == fake_vector(t) for t, v in zip(texts, vectors))
+        duplicates = sum(1 for t in texts if server.embedded[t] > 1)
+        first_run = {"server_requests": server.requests, "server_429s": server.rejected}
+
+        # Resume: an outage after a few accepted requests makes the run give up mid-way,
+        # then it is finished from EmbeddingError.partial
+        server.embedded.clear()
+        server.rate_limit = 0.0
+        server.outage(after_accepted=args.fail_after, seconds=3600)
+        impatient = EmbeddingScheduler(embed_fn, max_concurrency=args.concurrency, max_retries=1, base_delay=0.01,
+                                       max_delay=0.05)
+        partial = {}
+        try:
+            await impatient.embed(texts)
+        except EmbeddingError as e:
+            partial = dict(e.partial)
+        assert partial, "the outage should leave a partial result behind"
+        assert len(partial) < len(texts), "the run should have given up before finishing"
+        assert all(partial[i] == fake_vector(texts[i]) for i in partial)
+        assert len(partial) == sum(server.embedded.values()), "every embedded text is kept"
+        server.outage_until = 0.0
+        patient = EmbeddingScheduler(embed_fn, max_concurrency=args.concurrency, base_delay=0.05, max_delay=1.0)
+        resumed_vectors = await patient.embed(texts, completed=partial)
+        resume_ok = all(v == fake_vector(t) for t, v in zip(texts, resumed_vectors))
+        assert resume_ok
+        assert patient.stats()["texts"] == len(texts) - len(partial), "only the missing texts are sent again"
+        assert max(server.embedded.values()) == 1, "no text is embedded twice"
+
+        # The same through embed_resumable: the outage ends while it waits to resume
+        server.embedded.clear()
+        server.outage(after_accepted=args.fail_after, seconds=3600)
+        resuming = EmbeddingScheduler(embed_fn, max_concurrency=args.concurrency, max_retries=1, base_delay=0.01,
+                                      max_delay=0.05, resume_cooldown=0.2)
+
+        async def end_outage_on_resume():
+            while not resuming.stats()["resumes"]:
+                await asyncio.sleep(0.01)
+            server.outage_until = 0.0
+
+        recovery = asyncio.create_task(end_outage_on_resume())
+        auto_vectors = await resuming.embed_resumable(texts)
+        await recovery
+        assert all(v == fake_vector(t) for t, v in zip(texts, auto_vectors))
+        assert resuming.stats()["resumes"] >= 1 and max(server.embedded.values()) == 1
+
+    server.shutdown()
+    print(json.dumps({
+        "texts": len(texts),
+        "seconds": round(elapsed, 3),
+        "texts_per_sec": round(len(texts) / elapsed, 1),
+        "vectors_correct": correct,
+        "texts_embedded_twice": duplicates,
+        **first_run,
+        "scheduler": scheduler.stats(),
+        "resume": {
+            "kept_from_partial": len(partial),
+            "sent_after_resume": patient.stats()["texts"],
+            "vectors_correct": resume_ok,
+            "embed_resumable_resumes": resuming.stats()["resumes"],
+            "embed_resumable_texts_sent": resuming.stats()["texts"],
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--rate-limit", type=float, default=0.25)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--rpm", type=float, default=6000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--fail-after", type=int, default=5, help="Accepted requests before the resume test's outage")
+    asyncio.run(run(parser.parse_args()))
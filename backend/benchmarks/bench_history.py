@@ -0,0 +1,109 @@
+"""
+Reopening a long chat session: full history reads against paged, cached ones.
+
+    python -m backend.benchmarks.bench_history --messages 100 1000 5000 --reloads 50 --rtt-ms 40
+
+Sessions of question/answer pairs (answers carry 4 sources) are stored in a SQLiteRepository
+behind a wrapper that waits rtt_ms per call, standing in for the Supabase round trip.
+"full" is the previous /history: every message with its sources on every reload. "cold"
+is the first page through ChatHistory (one tail query), "cached" a reload served from the
+in-process tail, "no_sources" the same page without sources, and "not_modified" a reload
+whose ETag still matches. Reports latency, database round trips and response bytes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from backend.app.services.chat_history import ChatHistory
+from backend.app.services.repository import SQLiteRepository
+
+SOURCE = {"content": "Alpha reactor cooling uses liquid sodium. " * 8,
+          "metadata": {"source": "alpha.pdf", "page": 3, "page_label": "4", "total_pages": 40}}
+
+
+class RoundTripRepository:
+    """Forwards history reads to a repository, waiting `rtt` seconds per call like a remote database."""
+
+    def __init__(self, repository, rtt: float):
+        self.repository = repository
+        self.rtt = rtt
+        self.calls = 0
+
+    async def list_messages(self, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+        return await self.repository.list_messages(*args, **kwargs)
+
+
+async def fill(repository: SQLiteRepository, session_id: str, count: int):
+    await repository.ensure_sessions([{"id": session_id, "user_id": "bench", "title": "Benchmark"}])
+    start = datetime.now(timezone.utc)
+    await repository.insert_messages([
+        {"id": str(uuid.uuid4()), "session_id": session_id, "role": "user" if i % 2 == 0 else "assistant",
+         "content": f"message {i} " + "lorem ipsum dolor " * (5 if i % 2 == 0 else 60),
+         "sources": [] if i % 2 == 0 else [SOURCE] * 4,
+         "created_at": (start + timedelta(microseconds=i)).isoformat(timespec="microseconds")}
+        for i in range(count)
+    ])
+
+
+async def measure(repository: RoundTripRepository, reloads: int, call) -> dict:
+    latencies, sizes = [], []
+    calls = repository.calls
+    for _ in range(reloads):
+        start = time.perf_counter()
+        body = await call()
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(json.dumps(body)) if body is not None else 0)
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "round_trips_per_reload": round((repository.calls - calls) / reloads, 2),
+        "response_bytes": int(statistics.median(sizes)),
+    }
+
+
+async def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SQLiteRepository(os.path.join(tmp, "bench.sqlite"))
+        for count in args.messages:
+            session_id = str(uuid.uuid4())
+            await fill(sqlite, session_id, count)
+            repository = RoundTripRepository(sqlite, args.rtt_ms / 1000)
+            entry = {"messages": count, "rtt_ms": args.rtt_ms, "page_size": args.page_size}
+            entry["full"] = await measure(repository, args.reloads, lambda: repository.list_messages(session_id))
+
+            def history():
+                return ChatHistory(repository, page_size=args.page_size)
+
+            entry["cold"] = await measure(repository, args.reloads, lambda: history().page(session_id))
+            cached = history()
+            page = await cached.page(session_id)
+            entry["cached"] = await measure(repository, args.reloads, lambda: cached.page(session_id))
+            entry["no_sources"] = await measure(
+                repository, args.reloads, lambda: cached.page(session_id, include_sources=False))
+
+            async def revalidate():
+                # What /history does with a matching If-None-Match: compare, then send no body
+                assert await cached.page_etag(session_id) == page["etag"]
+                return None
+
+            entry["not_modified"] = await measure(repository, args.reloads, revalidate)
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--reloads", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    asyncio.run(run(parser.parse_args()))
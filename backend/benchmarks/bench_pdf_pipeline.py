@@ -0,0 +1,89 @@
+"""
+Pages/sec of the streaming PDF pipeline against process-pool size.
+
+    python -m backend.benchmarks.bench_pdf_pipeline --files 24 --pages 40
+
+Generates synthetic multi-page PDFs, streams them through stream_pdf_chunks with
+1..N worker processes and checks that every run yields the identical chunk sequence.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from backend.app.services.pdf_pipeline import stream_pdf_chunks
+
+WORDS = ("reactor cooling pressure turbine sodium containment valve sensor signal "
+         "budget revenue forecast contract clause liability warranty schedule").split()
+
+
+def make_pdf(path: str, pages: int, seed: int):
+    rng = random.Random(seed)
+    c = canvas.Canvas(path, pagesize=letter)
+    for _ in range(pages):
+        y = 750
+        for _ in range(45):
+            c.drawString(50, y, " ".join(rng.choice(WORDS) for _ in range(14)))
+            y -= 15
+        c.showPage()
+    c.save()
+
+
+async def run(file_paths, workers):
+    digest = hashlib.sha256()
+    pages = chunks = 0
+    start = time.perf_counter()
+    first_chunk_at = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        async for _, pages_done, total_pages, batch in stream_pdf_chunks(file_paths, executor=executor):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter() - start
+            for doc in batch:
+                digest.update(doc.page_content.encode("utf-8"))
+                digest.update(f"{doc.metadata['source']}:{doc.metadata['page']}".encode("utf-8"))
+            chunks += len(batch)
+            if pages_done == total_pages:
+                pages += total_pages
+        elapsed = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1),
+        "first_chunk_ms": round(first_chunk_at * 1000, 1),
+        "digest": digest.hexdigest()[:16],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"doc_{i:03d}.pdf")
+            make_pdf(path, args.pages, seed=i)
+            file_paths.append(path)
+
+        worker_counts = sorted({1, 2, 4, 8, args.max_workers} & set(range(1, args.max_workers + 1)))
+        results = [asyncio.run(run(file_paths, workers)) for workers in worker_counts]
+
+    deterministic = len({r["digest"] for r in results}) == 1
+    print(json.dumps({"deterministic": deterministic, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
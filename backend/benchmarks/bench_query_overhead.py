@@ -0,0 +1,134 @@
+"""
+Per-request overhead of RAGService.query before the LLM is called.
+
+    python -m backend.benchmarks.bench_query_overhead --pages 200 --queries 50 --embed-latency-ms 80
+
+Indexes synthetic PDFs for one user, then times each query from entry until the chat model
+receives its prompt (the model is a fake, so generation itself is excluded). Three paths:
+
+  legacy    the previous query body, which built an EnsembleRetriever and RetrievalQA per
+            request and embedded the question twice (answer cache, then the FAISS retriever)
+  cold      the prebuilt per-user pipeline with new questions: one embedding call, searches
+  warm      the same questions again: embedding and top-k chunk ids come from the LRU caches
+
+The answer cache is disabled throughout so every request reaches the LLM.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from langchain.chains import RetrievalQA
+from langchain.retrievers import EnsembleRetriever
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from backend.app.services.answer_cache import AnswerCache
+from backend.app.services.embedding_cache import EmbeddingCache
+from backend.app.services.rag_service import rag_service
+from backend.benchmarks.bench_pdf_pipeline import WORDS, make_pdf
+
+USER_ID = "bench"
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic vectors with a simulated network round trip per query."""
+    model: str = "fake-embedding"
+    latency: float = 0.0
+
+    async def aembed_query(self, text: str):
+        await asyncio.sleep(self.latency)
+        return self.embed_query(text)
+
+
+class LLMStart(BaseCallbackHandler):
+    def __init__(self):
+        self.at = None
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.at = time.perf_counter()
+
+
+async def legacy_query(question: str, user_id: str):
+    """The query body before per-user pipelines, kept here for comparison."""
+    vector_store = await rag_service._load_vector_store(user_id)
+    version = await rag_service._index_version(user_id)
+    rag_service.answer_cache.get_exact(user_id, version, question)
+    question_vector = await rag_service.embeddings.aembed_query(question)
+    rag_service.answer_cache.get_similar(user_id, version, question_vector)
+    bm25_retriever = await rag_service._load_bm25(user_id, vector_store)
+    retriever = EnsembleRetriever(
+        retrievers=[bm25_retriever, vector_store.as_retriever(search_kwargs={"k": 5})],
+        weights=[0.4, 0.6],
+    )
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=rag_service.llm, chain_type="stuff", retriever=retriever, return_source_documents=True
+    )
+    return await qa_chain.ainvoke({"query": question})
+
+
+async def measure(query_fn, questions, handler):
+    overheads = []
+    for question in questions:
+        start = time.perf_counter()
+        await query_fn(question, USER_ID)
+        overheads.append((handler.at - start) * 1000)
+    ordered = sorted(overheads)
+    return {
+        "p50_ms": round(statistics.median(ordered), 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+    }
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        rag_service.index_dir = os.path.join(tmp, "vector_index")
+        rag_service.embedding_cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        rag_service.embeddings = SlowEmbeddings(size=args.dim)
+        handler = LLMStart()
+        rag_service.llm = FakeListChatModel(responses=["answer"], callbacks=[handler])
+        rag_service.answer_cache = AnswerCache(max_entries=0)
+
+        pdfs = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"report-{i}.pdf")
+            make_pdf(path, args.pages // args.files, seed=i)
+            pdfs.append(path)
+        await rag_service.process_pdfs(pdfs, USER_ID)
+        rag_service.embeddings.latency = args.embed_latency_ms / 1000
+
+        questions = [f"{WORDS[i % len(WORDS)]} {WORDS[(i * 7) % len(WORDS)]} question {i}"
+                     for i in range(args.queries * 3)]
+        legacy_questions, new_questions = questions[:args.queries], questions[args.queries:args.queries * 2]
+        # First query builds the pipeline and loads BM25; both paths start resident
+        await rag_service.query(questions[-1], USER_ID)
+
+        results = {
+            "chunks": len(rag_service.residency.entries[USER_ID].vector_store.index_to_docstore_id),
+            "embed_latency_ms": args.embed_latency_ms,
+            "legacy": await measure(legacy_query, legacy_questions, handler),
+            "cold": await measure(rag_service.query, new_questions, handler),
+            "warm": await measure(rag_service.query, new_questions, handler),
+            "retrieval_cache": rag_service.retrieval_cache.stats(),
+            "query_embedding_cache": rag_service.query_embedding_cache.stats(),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency-ms", type=float, default=80)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,185 @@
+"""
+PDF session report export: the previous in-memory build against batched, cached rendering.
+
+    python -m backend.benchmarks.bench_report_export --messages 200 1000 --exports 5
+
+Sessions are question/answer pairs; every answer cites 4 chunks from 2 documents.
+"inline" is the previous export: every Paragraph built up front and the document rendered
+into a BytesIO on the event loop. "cold" is ReportExporter's first export (a render on the
+process pool, BatchedFlowables feeding batch_size messages at a time), "cached" a repeat
+export of the same session version. Reports time to the first byte of the response, the
+longest event-loop stall while exporting (a 5 ms heartbeat runs alongside), Python heap
+peak of the render (tracemalloc, measured in a separate pass in the process that renders:
+the API process for inline, a fresh pool worker for cold, which also reports how far the
+worker's peak RSS grew) and the PDF size.
+"""
+import argparse
+import asyncio
+import io
+import json
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from backend.app.services.executors import shutdown_executors
+from backend.app.services.report_export import ReportExporter
+from backend.app.utils.reporting import FOOTER, render_session_report, report_styles
+
+CHUNK = 64 * 1024
+
+
+def make_session(count: int) -> list[dict]:
+    sources = [{"content": "Alpha reactor cooling uses liquid sodium. " * 8,
+                "metadata": {"source": name, "page": page}}
+               for name, page in (("alpha.pdf", 3), ("beta.pdf", 1), ("alpha.pdf", 7), ("beta.pdf", 2))]
+    return [
+        {"id": str(uuid.uuid4()), "role": "user" if i % 2 == 0 else "assistant",
+         "content": f"message {i} " + "lorem ipsum dolor sit amet " * (3 if i % 2 == 0 else 40),
+         "sources": [] if i % 2 == 0 else sources}
+        for i in range(count)
+    ]
+
+
+def inline_report(title, messages):
+    """The previous generate_session_report: all flowables first, then one build into memory."""
+    styles = report_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+    content = [Paragraph("AI Document Intelligence Report", styles['title']),
+               Paragraph(f"Session: {title}", styles['heading']), Spacer(1, 12)]
+    for msg in messages:
+        if msg["role"] == "user":
+            content.append(Paragraph(f"<b>Question:</b> {msg['content']}", styles['user']))
+        else:
+            content.append(Paragraph(f"<b>Researcher Insight:</b> {msg['content']}", styles['assistant']))
+            if msg["sources"]:
+                names = ", ".join(list(set([s['metadata']['source'] for s in msg["sources"]])))
+                content.append(Paragraph(f"<i>Sources: {names}</i>", styles['sources']))
+        content.append(Spacer(1, 10))
+    content += [Spacer(1, 50), Paragraph(FOOTER, styles['footer'])]
+    doc.build(content)
+    buffer.seek(0)
+    return buffer
+
+
+def heap_peak_mb(render) -> float:
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(peak / 2**20, 1)
+
+
+def worker_render_peaks(title, messages, out, batch_size) -> dict:
+    """Runs in the pool worker: heap peak of the render there and the growth of the worker's peak RSS."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    heap = heap_peak_mb(lambda: render_session_report(title, messages, out, batch_size))
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    return {"heap_peak_mb": heap, "worker_rss_growth_mb": round((rss_after - rss_before) / 1024, 1)}
+
+
+async def cold_render_peaks(title, messages, out, batch_size) -> dict:
+    # A fresh worker, so neither earlier renders nor the exports above raise its peak RSS
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, worker_render_peaks, title, messages, out, batch_size)
+
+
+async def with_heartbeat(call):
+    """Runs call() while a heartbeat measures the longest event-loop stall. Returns (result, stall_s)."""
+    stalls, running = [0.0], True
+
+    async def heartbeat():
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - start - 0.005)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    try:
+        result = await call()
+    finally:
+        running = False
+        await beat
+    return result, max(stalls)
+
+
+async def first_byte_from_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(CHUNK)
+
+
+def summary(timings, stalls, **extra) -> dict:
+    return {"first_byte_p50_ms": round(statistics.median(timings) * 1000, 1),
+            "max_loop_stall_ms": round(max(stalls) * 1000, 1), **extra}
+
+
+async def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.messages:
+            messages = make_session(count)
+            entry = {"messages": count, "batch_size": args.batch_size}
+
+            timings, stalls = [], []
+            for _ in range(args.exports):
+                start = time.perf_counter()
+
+                async def inline():
+                    # Ran directly in the async endpoint
+                    return inline_report("Benchmark", messages).read(CHUNK)
+
+                _, stall = await with_heartbeat(inline)
+                timings.append(time.perf_counter() - start)
+                stalls.append(stall)
+            size = len(inline_report("Benchmark", messages).getvalue())
+            entry["inline"] = summary(timings, stalls, heap_peak_mb=heap_peak_mb(
+                lambda: inline_report("Benchmark", messages)), pdf_bytes=size)
+
+            exporter = ReportExporter(f"{tmp}/reports-{count}", batch_size=args.batch_size)
+
+            async def load():
+                return "Benchmark", messages
+
+            async def export(key):
+                return await first_byte_from_file(await exporter.export(key, load))
+
+            cold, cold_stalls = [], []
+            for _ in range(args.exports):
+                key = exporter.key("session", str(uuid.uuid4()), "Benchmark")
+                start = time.perf_counter()
+                _, stall = await with_heartbeat(lambda: export(key))
+                cold.append(time.perf_counter() - start)
+                cold_stalls.append(stall)
+            entry["cold"] = summary(cold, cold_stalls, **await cold_render_peaks(
+                "Benchmark", messages, f"{tmp}/peak.pdf", args.batch_size),
+                pdf_bytes=exporter.stats()["bytes"] // exporter.stats()["entries"])
+
+            cached, cached_stalls = [], []
+            for _ in range(args.exports):
+                start = time.perf_counter()
+                _, stall = await with_heartbeat(lambda: export(key))
+                cached.append(time.perf_counter() - start)
+                cached_stalls.append(stall)
+            entry["cached"] = summary(cached, cached_stalls)
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+    shutdown_executors()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--exports", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
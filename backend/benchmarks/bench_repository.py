@@ -0,0 +1,93 @@
+"""
+Per-call latency of the storage repository: session/message writes, session lookup, history reads.
+
+    python -m backend.benchmarks.bench_repository --sessions 50 --messages 10 100 1000
+    STORAGE_BACKEND=postgres DATABASE_URL=postgresql://localhost/rag python -m backend.benchmarks.bench_repository
+    STORAGE_BACKEND=supabase python -m backend.benchmarks.bench_repository --messages 10 100
+
+Uses the repository STORAGE_BACKEND selects (as the API does), or a SQLiteRepository in a
+temporary directory when it is unset, so the default run needs nothing but this repo.
+Sessions and messages are written with fresh UUIDs, then each session's history of
+1..N messages is read back; against a shared database they are left behind.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from backend.app.services.repository import SQLiteRepository, repository_from_env
+from backend.benchmarks.bench_bm25 import percentile
+
+USER_ID = "8625119c-5b13-4bc2-a21f-0abbf282a0cb"
+
+
+def summary(latencies) -> dict:
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+    }
+
+
+async def timed(latencies: list, call):
+    start = time.perf_counter()
+    result = await call
+    latencies.append(time.perf_counter() - start)
+    return result
+
+
+def make_messages(session_id: str, count: int, start: datetime) -> list[dict]:
+    return [
+        {"session_id": session_id, "role": "user" if i % 2 == 0 else "assistant",
+         "content": f"message {i} " + "lorem ipsum " * 40,
+         "sources": [] if i % 2 == 0 else [{"source": "report.pdf", "page": i % 30}] * 4,
+         "created_at": (start + timedelta(microseconds=i)).isoformat(timespec="microseconds")}
+        for i in range(count)
+    ]
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        if os.getenv("STORAGE_BACKEND"):
+            from backend.app.api.v1.auth import get_supabase
+            repository = repository_from_env(get_supabase)
+        else:
+            repository = SQLiteRepository(os.path.join(tmp, "bench.sqlite"))
+        results = {"repository": type(repository).__name__}
+        try:
+            ensure, insert_exchange, get_session = [], [], []
+            for size in args.messages:
+                insert_bulk, reads = [], []
+                sessions = [str(uuid.uuid4()) for _ in range(args.sessions)]
+                for session_id in sessions:
+                    await timed(ensure, repository.ensure_sessions(
+                        [{"id": session_id, "user_id": USER_ID, "title": "Benchmark"}]))
+                    # One question/answer pair, then the rest of the history in one insert
+                    messages = make_messages(session_id, size, datetime.now(timezone.utc))
+                    await timed(insert_exchange, repository.insert_messages(messages[:2]))
+                    if messages[2:]:
+                        await timed(insert_bulk, repository.insert_messages(messages[2:]))
+                for session_id in sessions:
+                    await timed(get_session, repository.get_session(session_id))
+                    history = await timed(reads, repository.list_messages(session_id))
+                    assert len(history) == size, (len(history), size)
+                results[f"history_{size}"] = {"insert_rest": summary(insert_bulk) if insert_bulk else None,
+                                              "list_messages": summary(reads)}
+                print(json.dumps({size: results[f"history_{size}"]}), flush=True)
+            results["ensure_session"] = summary(ensure)
+            results["insert_exchange"] = summary(insert_exchange)
+            results["get_session"] = summary(get_session)
+        finally:
+            await repository.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000])
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,100 @@
+"""
+What the rerank stage buys and costs: nDCG@k against added latency, by candidates and batch size.
+
+    python -m backend.benchmarks.bench_reranker --chunks 20000 --candidates 10 25 50 --batch-sizes 1 8 32
+    python -m backend.benchmarks.bench_reranker --model cross-encoder/ms-marco-MiniLM-L-6-v2
+
+Uses the labeled topic corpus of bench_hybrid. Hybrid search (RRF) retrieves N candidates
+and the Reranker keeps the top k. Without --model the scorer counts query words in the
+chunk (a stand-in for a cross-encoder's relevance judgement) and simulates cross-encoder
+CPU cost as batch overhead + per-pair cost, so batching effects show without downloading a
+model; with --model (needs sentence-transformers) the real cross-encoder is used.
+The simulated scores are the same word overlap that grades relevance, so its nDCG is an
+upper bound: how much of the quality within the top N candidates a perfect reranker
+recovers. Latencies are the part to read as-is.
+"warm" repeats the queries, when every (query, chunk) score comes from the cache.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from backend.app.services.bm25_index import BM25Index, BM25IndexRetriever
+from backend.app.services.reranker import CrossEncoderScorer, Reranker
+from backend.app.services.retrieval import HybridPipeline
+from backend.app.services.vector_index import ANNVectorStore
+from backend.benchmarks.bench_hybrid import BagOfWordsEmbeddings, make_corpus, make_queries, ndcg
+
+
+class SimulatedCrossEncoder:
+    """Query-word overlap scores, taking batch_overhead + pairs * pair_cost seconds per call."""
+    name = "simulated-cross-encoder"
+
+    def __init__(self, batch_overhead: float, pair_cost: float):
+        self.batch_overhead = batch_overhead
+        self.pair_cost = pair_cost
+
+    def __call__(self, query: str, texts: list[str]) -> list[float]:
+        time.sleep(self.batch_overhead + self.pair_cost * len(texts))
+        words = set(query.split())
+        return [float(len(words & set(text.split()))) for text in texts]
+
+
+async def run(args):
+    rng = random.Random(0)
+    texts, chunk_topics, topic_words = make_corpus(args.chunks, args.topics, rng)
+    embeddings = BagOfWordsEmbeddings(args.dim)
+    ids = [str(i) for i in range(args.chunks)]
+    store = ANNVectorStore.from_embeddings(list(zip(texts, embeddings.embed_documents(texts))), embeddings, ids=ids)
+    pipeline = HybridPipeline(store, BM25IndexRetriever(index=BM25Index.build(ids, texts), docstore=store.docstore))
+    queries = make_queries(args.queries, texts, chunk_topics, topic_words, rng)
+    vectors = [embeddings.embed_query(question) for question, _ in queries]
+    if args.model:
+        scorer = CrossEncoderScorer(args.model)
+    else:
+        scorer = SimulatedCrossEncoder(args.batch_overhead_ms / 1000, args.pair_cost_ms / 1000)
+
+    baseline = []
+    for (question, grades), vector in zip(queries, vectors):
+        hits = await pipeline.asearch(question, vector, k=args.k)
+        baseline.append(ndcg([doc.id for doc, _ in hits], grades, args.k))
+    results = [{"mode": "no_rerank", "k": args.k, f"ndcg@{args.k}": round(statistics.fmean(baseline), 4)}]
+    print(json.dumps(results[0]), flush=True)
+
+    for candidates in args.candidates:
+        retrieved = [await pipeline.asearch(question, vector, k=candidates)
+                     for (question, _), vector in zip(queries, vectors)]
+        for batch_size in args.batch_sizes:
+            reranker = Reranker(scorer, candidates=candidates, top_n=args.k, batch_size=batch_size)
+            entry = {"mode": "rerank", "candidates": candidates, "batch_size": batch_size}
+            for phase in ("cold", "warm"):
+                latencies, scores = [], []
+                for (question, grades), hits in zip(queries, retrieved):
+                    start = time.perf_counter()
+                    top = reranker.rerank(question, hits)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    scores.append(ndcg([doc.id for doc, _ in top], grades, args.k))
+                entry[f"ndcg@{args.k}"] = round(statistics.fmean(scores), 4)
+                entry[f"{phase}_p50_ms"] = round(statistics.median(latencies), 2)
+            entry["score_cache_hit_rate"] = reranker.stats()["score_cache"]["hit_rate"]
+            results.append(entry)
+            print(json.dumps(entry), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 25, 50])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--model", help="sentence-transformers cross-encoder to use instead of the simulation")
+    # Rough MiniLM-L6 CPU costs for ~250-token passages
+    parser.add_argument("--batch-overhead-ms", type=float, default=4.0)
+    parser.add_argument("--pair-cost-ms", type=float, default=1.5)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,115 @@
+"""
+Local stand-in for an embeddings API that injects rate limiting.
+
+    python -m backend.benchmarks.fake_embeddings_server --port 8765 --rate-limit 0.2
+
+POST /embed {"texts": [...]} returns {"embeddings": [[...], ...]}. A configurable share of
+requests (and anything over --max-rpm) is answered with 429 and a Retry-After header;
+outage() rejects everything for a while once a number of requests have been accepted.
+Vectors are a deterministic function of the text, so callers can verify every result.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_vector(text: str, dim: int = 16):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [round(digest[i % len(digest)] / 255.0, 6) for i in range(dim)]
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, rate_limit=0.2, retry_after=0.05, max_rpm=None, latency=0.01, seed=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.max_rpm = max_rpm
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        # How many times each text was successfully embedded
+        self.embedded = Counter()
+        self.requests = 0
+        self.rejected = 0
+        self.accepted = 0
+        self.outage_after = None
+        self.outage_seconds = 0.0
+        self.outage_until = 0.0
+
+    def outage(self, after_accepted: int, seconds: float):
+        """Rejects every request for `seconds` once `after_accepted` more requests have succeeded."""
+        with self.lock:
+            self.outage_after = self.accepted + after_accepted
+            self.outage_seconds = seconds
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def should_reject(self):
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            if self.outage_after is not None and self.accepted >= self.outage_after:
+                self.outage_until = now + self.outage_seconds
+                self.outage_after = None
+            if now < self.outage_until:
+                self.rejected += 1
+                return True
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if (self.max_rpm and len(self.recent) >= self.max_rpm) or self.rng.random() < self.rate_limit:
+                self.rejected += 1
+                return True
+            self.recent.append(now)
+            self.accepted += 1
+            return False
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        time.sleep(server.latency)
+        if server.should_reject():
+            self.send_response(429)
+            self.send_header("Retry-After", str(server.retry_after))
+            self.end_headers()
+            self.wfile.write(b'{"error": "RESOURCE_EXHAUSTED"}')
+            return
+        texts = body["texts"]
+        with server.lock:
+            server.embedded.update(texts)
+        payload = json.dumps({"embeddings": [fake_vector(t) for t in texts]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-limit", type=float, default=0.2, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--max-rpm", type=int, default=None)
+    args = parser.parse_args()
+    server = FakeEmbeddingsServer(args.port, args.rate_limit, args.retry_after, args.max_rpm)
+    print(f"Fake embeddings API on {server.url}/embed")
+    server.serve_forever()
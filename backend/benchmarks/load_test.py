@@ -0,0 +1,86 @@
+"""
+Event-loop responsiveness check: probes /health and /query before and during an ingestion job.
+
+Run the API first (python backend/main.py), then:
+    python -m backend.benchmarks.load_test path/to/a.pdf path/to/b.pdf
+
+If ingestion still blocked the event loop, the "during" latencies would jump to the
+length of a PDF parse or embedding batch; with the async execution model they stay flat.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+async def probe(client, method, url, samples, stop, interval, **kwargs):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            pass
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def measure(client, duration, interval, question):
+    health, query = [], []
+    stop = asyncio.Event()
+    tasks = [
+        asyncio.create_task(probe(client, "GET", "/health", health, stop, interval)),
+        asyncio.create_task(probe(client, "POST", "/api/v1/query", query, stop, interval,
+                                  json={"question": question, "session_id": ""})),
+    ]
+    await duration()
+    stop.set()
+    await asyncio.gather(*tasks)
+    return {"health": summarize(health), "query": summarize(query)}
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=300) as client:
+        async def idle():
+            await asyncio.sleep(args.baseline_seconds)
+
+        async def ingest():
+            files = [("files", (os.path.basename(p), open(p, "rb"), "application/pdf")) for p in args.pdfs]
+            res = await client.post("/api/v1/upload", files=files)
+            res.raise_for_status()
+            job_id = res.json()["job_id"]
+            while True:
+                job = (await client.get(f"/api/v1/jobs/{job_id}")).json()
+                if job["status"] not in ("queued", "running"):
+                    return job
+                await asyncio.sleep(0.5)
+
+        baseline = await measure(client, idle, args.interval, args.question)
+        during = await measure(client, ingest, args.interval, args.question)
+
+    print(json.dumps({"baseline": baseline, "during_ingestion": during}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+", help="PDFs to upload while probing")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--question", default="What is this document about?")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between probes")
+    parser.add_argument("--baseline-seconds", type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,343 @@
+"""
+Offline benchmark suite: ingestion, index builds, query latency, memory and recall@k.
+
+    python -m backend.benchmarks.suite --out bench.json
+    python -m backend.benchmarks.suite --chunks 1000 10000 100000 1000000 --dim 128 --out bench.json
+    python -m backend.benchmarks.suite --baseline bench.json
+
+Runs without network access or API keys, unlike test_rag.py and backend/verify_backend.py.
+Everything is generated and seeded, so two runs on the same machine measure the same work.
+
+  ingest     synthetic PDFs (bench_pdf_pipeline.make_pdf) through RAGService.process_pdfs
+             with deterministic fake embeddings: pages/sec, chunks/sec and RSS growth. Then
+             RAGService.query end to end with a fake LLM and the answer cache off:
+             p50/p95/p99 latency.
+  retrieval  for each corpus size, the topic-labeled corpus of bench_hybrid embedded by its
+             bag-of-words model. Builds the FAISS index ANNConfig picks for that size (or
+             --index-types, with FAISS_* settings from the environment as in the service),
+             BM25Index and a HybridPipeline over both. Reports build time and RSS growth
+             per index, then p50/p95/p99 search latency and recall@k for the faiss, bm25
+             and hybrid paths. Query vectors are computed up front, so latency
+             is search plus chunk lookup.
+
+recall@k is the share of the query's fully relevant chunks (on its topic and containing all
+of its words) found in the top k, out of min(k, relevant). The faiss path also reports
+ann_recall@k against exact flat search, i.e. what the approximate index loses.
+
+The full report is printed and written to --out as JSON. With --baseline, every latency,
+build time, memory and throughput figure is compared with an earlier report. The run exits
+with status 1 if any got worse by more than --tolerance, or if a recall dropped by more
+than 0.02. It also exits with status 1 if hybrid recall@k is below FAISS recall@k for any entry
+(see hybrid_failures). At 1M chunks the texts, vectors and indexes need roughly 8 GB of RAM at the
+default dimension; a smaller --dim lowers it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from backend.app.services.answer_cache import AnswerCache
+from backend.app.services.bm25_index import BM25Index, BM25IndexRetriever
+from backend.app.services.embedding_cache import EmbeddingCache
+from backend.app.services.retrieval import HybridPipeline
+from backend.app.services.vector_index import ANNConfig, ANNVectorStore, build_index
+from backend.benchmarks.bench_bm25 import percentile
+from backend.benchmarks.bench_chunk_store import rss_mb
+from backend.benchmarks.bench_hybrid import BagOfWordsEmbeddings, make_corpus, make_queries
+from backend.benchmarks.bench_pdf_pipeline import WORDS, make_pdf
+from backend.benchmarks.bench_query_overhead import SlowEmbeddings, rag_service
+
+USER_ID = "bench"
+CHUNKS_PER_TOPIC = 500
+RECALL_DROP = 0.02
+# Absolute changes below these are timer jitter / allocator noise, not regressions
+NOISE_FLOOR = {"_ms": 1.0, "_s": 0.1, "_mb": 8.0}
+
+
+def latency_summary(latencies) -> dict:
+    """p50/p95/p99 in milliseconds of latencies in seconds."""
+    return {f"p{p}_ms": round(percentile(latencies, p / 100) * 1000, 3) for p in (50, 95, 99)}
+
+
+def embed_corpus(embeddings: BagOfWordsEmbeddings, texts, batch_size: int = 1024) -> np.ndarray:
+    """embeddings.embed_documents(texts) as a float32 matrix, vectorized over a word table."""
+    vocabulary = {}
+    rows, offsets = [], []
+    for text in texts:
+        offsets.append(len(rows))
+        rows.extend(vocabulary.setdefault(word, len(vocabulary)) for word in text.split())
+    table = np.stack([embeddings._word(word) for word in vocabulary])
+    rows = np.array(rows, dtype=np.int64)
+    offsets.append(len(rows))
+    vectors = np.empty((len(texts), embeddings.dim), dtype=np.float32)
+    for start in range(0, len(texts), batch_size):
+        end = min(start + batch_size, len(texts))
+        lo, hi = offsets[start], offsets[end]
+        sums = np.add.reduceat(table[rows[lo:hi]], np.array(offsets[start:end]) - lo, axis=0)
+        vectors[start:end] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+
+def timed_searches(search, queries):
+    latencies, ranked = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ranked.append(search(*query))
+        latencies.append(time.perf_counter() - start)
+    return latencies, ranked
+
+
+def recall_at_k(ranked, relevant, k: int):
+    scores = [len(set(ids[:k]) & rel) / min(k, len(rel)) for ids, rel in zip(ranked, relevant) if rel]
+    return round(float(np.mean(scores)), 4) if scores else None
+
+
+async def bench_ingest(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        rag_service.index_dir = os.path.join(tmp, "vector_index")
+        rag_service.embedding_cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        rag_service.embeddings = SlowEmbeddings(size=args.dim)
+        rag_service.llm = FakeListChatModel(responses=["answer"])
+        rag_service.answer_cache = AnswerCache(max_entries=0)
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"report-{i}.pdf")
+            make_pdf(path, args.pages // args.files, seed=i)
+            paths.append(path)
+
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        await rag_service.process_pdfs(paths, USER_ID)
+        seconds = time.perf_counter() - start
+        chunks = len(rag_service.residency.entries[USER_ID].vector_store.index_to_docstore_id)
+
+        rng = random.Random(0)
+        questions = [f"{' '.join(rng.sample(WORDS, 3))} {i}" for i in range(args.queries + 1)]
+        await rag_service.query(questions.pop(), USER_ID)  # builds the pipeline
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            await rag_service.query(question, USER_ID)
+            latencies.append(time.perf_counter() - start)
+        return {
+            "pages": args.files * (args.pages // args.files),
+            "chunks": chunks,
+            "seconds": round(seconds, 3),
+            "pages_per_s": round(args.files * (args.pages // args.files) / seconds, 2),
+            "chunks_per_s": round(chunks / seconds, 1),
+            "rss_growth_mb": round(rss_mb() - rss_before, 1),
+            "query": latency_summary(latencies),
+        }
+
+
+async def bench_retrieval(n: int, args) -> list[dict]:
+    rng = random.Random(n)
+    texts, chunk_topics, topic_words = make_corpus(n, max(2, n // CHUNKS_PER_TOPIC), rng)
+    queries = make_queries(args.queries, texts, chunk_topics, topic_words, rng)
+    embeddings = BagOfWordsEmbeddings(args.dim)
+    start = time.perf_counter()
+    vectors = embed_corpus(embeddings, texts)
+    embed_s = time.perf_counter() - start
+    query_vectors = [embeddings.embed_query(question) for question, _ in queries]
+    # Fully relevant: every query word present, the highest grade make_queries gives
+    relevant = [{doc_id for doc_id, grade in grades.items() if grade == len(question.split())}
+                for question, grades in queries]
+    ids = [str(i) for i in range(n)]
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    bm25_index = BM25Index.build(ids, texts)
+    bm25_s = time.perf_counter() - start
+    bm25_rss = rss_mb() - rss_before
+
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, exact_top = exact.search(np.array(query_vectors, dtype=np.float32), args.k)
+    del exact
+
+    config = ANNConfig.from_env()
+    entries = []
+    for kind in args.index_types:
+        kind = config.choose(n) if kind == "auto" else kind
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        docstore = InMemoryDocstore({doc_id: Document(id=doc_id, page_content=text) for doc_id, text in zip(ids, texts)})
+        store = ANNVectorStore(embeddings, build_index(kind, vectors, config), docstore, dict(enumerate(ids)))
+        store.set_search_params(config)
+        faiss_s = time.perf_counter() - start
+        faiss_rss = rss_mb() - rss_before
+        pipeline = HybridPipeline(store, BM25IndexRetriever(index=bm25_index, docstore=docstore))
+
+        searches = [(question, vector) for (question, _), vector in zip(queries, query_vectors)]
+        paths = {
+            "faiss": lambda question, vector: [doc.id for doc, _ in pipeline.dense(vector, args.k)],
+            "bm25": lambda question, vector: [doc.id for doc, _ in pipeline.sparse(question, args.k)],
+        }
+        entry = {
+            "chunks": n,
+            "index": kind,
+            "build": {
+                "embed_s": round(embed_s, 3),
+                "faiss_s": round(faiss_s, 3),
+                "bm25_s": round(bm25_s, 3),
+                "faiss_rss_mb": round(faiss_rss, 1),
+                "bm25_rss_mb": round(bm25_rss, 1),
+            },
+        }
+        for name, search in paths.items():
+            search(*searches[0])  # warm up
+            latencies, ranked = timed_searches(search, searches)
+            entry[name] = {**latency_summary(latencies), f"recall@{args.k}": recall_at_k(ranked, relevant, args.k)}
+            if name == "faiss":
+                exact_ids = [{str(i) for i in row if i >= 0} for row in exact_top]
+                entry[name][f"ann_recall@{args.k}"] = recall_at_k(ranked, exact_ids, args.k)
+
+        await pipeline.asearch(*searches[0], k=args.k)
+        latencies, ranked = [], []
+        for question, vector in searches:
+            start = time.perf_counter()
+            hits = await pipeline.asearch(question, vector, k=args.k)
+            latencies.append(time.perf_counter() - start)
+            ranked.append([doc.id for doc, _ in hits])
+        entry["hybrid"] = {**latency_summary(latencies), f"recall@{args.k}": recall_at_k(ranked, relevant, args.k)}
+        # Fusion should keep what its lists found: below the better list is what it costs
+        best = max(entry[name][f"recall@{args.k}"] for name in paths)
+        entry["hybrid"]["recall_vs_best_list"] = round(entry["hybrid"][f"recall@{args.k}"] - best, 4)
+        entries.append(entry)
+        print(json.dumps(entry), flush=True)
+        del pipeline, store, docstore
+    return entries
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "faiss": faiss.__version__,
+        "numpy": np.__version__,
+        "args": vars(args),
+    }
+
+
+def flatten(report: dict) -> dict:
+    """Comparable figures of a report as {"ingest.query.p95_ms": value, ...}."""
+    figures = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            figures[prefix] = value
+
+    walk("ingest", report.get("ingest") or {})
+    for entry in report.get("retrieval", []):
+        walk(f"retrieval.{entry['chunks']}.{entry['index']}", {k: v for k, v in entry.items() if isinstance(v, dict)})
+    return figures
+
+
+def hybrid_failures(report: dict, k: int) -> list[str]:
+    """Retrieval entries whose fused hybrid recall@k is below the FAISS list it mostly weighs.
+
+    With the default 0.4/0.6 weights a chunk only FAISS ranks outscores one only BM25 ranks,
+    so hybrid falls short of BM25 when FAISS is much the weaker (recall_vs_best_list says
+    by how much). Falling below FAISS itself means fusion is losing candidates, as it did
+    when each list was cut to k before fusing.
+    """
+    return [
+        f"retrieval.{entry['chunks']}.{entry['index']}: hybrid {entry['hybrid'][f'recall@{k}']} "
+        f"< faiss {entry['faiss'][f'recall@{k}']}"
+        for entry in report.get("retrieval", [])
+        if entry["hybrid"][f"recall@{k}"] < entry["faiss"][f"recall@{k}"]
+    ]
+
+
+def regressions(baseline: dict, report: dict, tolerance: float) -> list[str]:
+    """Figures of report worse than in baseline: beyond tolerance (relative), or recall by RECALL_DROP."""
+    before, after = flatten(baseline), flatten(report)
+    found = []
+    for key, old in before.items():
+        new = after.get(key)
+        if new is None:
+            continue
+        name = key.rsplit(".", 1)[-1]
+        if "recall" in name:
+            worse = new < old - RECALL_DROP
+        elif name.endswith("per_s"):
+            worse = new < old * (1 - tolerance)
+        elif name.endswith(tuple(NOISE_FLOOR)):
+            floor = next(value for suffix, value in NOISE_FLOOR.items() if name.endswith(suffix))
+            worse = new > old * (1 + tolerance) and new - old > floor
+        else:
+            continue
+        if worse:
+            found.append(f"{key}: {old} -> {new}")
+    return found
+
+
+async def run(args):
+    report = {"meta": metadata(args)}
+    rss_start = rss_mb()
+    if not args.skip_ingest:
+        report["ingest"] = await bench_ingest(args)
+        print(json.dumps({"ingest": report["ingest"]}), flush=True)
+    report["retrieval"] = []
+    for n in args.chunks:
+        report["retrieval"].extend(await bench_retrieval(n, args))
+    report["meta"]["rss_start_mb"] = round(rss_start, 1)
+    # ru_maxrss is in KiB on Linux
+    report["meta"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    failed = hybrid_failures(report, args.k)
+    if failed:
+        print(json.dumps({"hybrid_below_faiss": failed}, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(json.load(f), report, args.tolerance)
+        print(json.dumps({"baseline": args.baseline, "regressions": found}, indent=2))
+        failed += found
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--index-types", nargs="+", default=["auto"],
+                        help="FAISS index kinds to build, auto picks ANNConfig's choice per size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=80)
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown/growth counted as a regression")
+    asyncio.run(run(parser.parse_args()))
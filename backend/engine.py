@@ -1,4 +1,5 @@
 import os
+import asyncio
 import tempfile
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -6,6 +7,8 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain_google_genai import ChatGoogleGenerativeAI
+from backend.app.services.embedding_scheduler import EmbeddingScheduler
+from backend.app.services.embedding_cache import get_embedding_cache
 
 def process_document_to_vector_store(uploaded_files, progress_callback=None):
     """
@@ -43,45 +46,30 @@ def process_document_to_vector_store(uploaded_files, progress_callback=None):
     # Step 6: Embeddings Generation
     embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
     
-    # Step 7: Vector Store Creation - STRICT SERIAL PROCESSING
-    import time
-    vector_store = None
-    total_chunks = len(all_texts)
-    
-    for i, text_chunk in enumerate(all_texts):
-        # Update progress callback
-        if progress_callback:
-            progress_callback(i + 1, total_chunks)
-            
-        success = False
-        retries = 3
-        retry_delay = 30 # Start with 30s delay
-        
-        while not success and retries > 0:
-            try:
-                # Create a single-item list for the loader
-                batch = [text_chunk]
-                
-                if vector_store is None:
-                    vector_store = FAISS.from_documents(batch, embeddings)
-                else:
-                    vector_store.add_documents(batch)
-                    
-                success = True
-                # Small delay after each successful add
-                time.sleep(0.5) 
-                
-            except Exception as e:
-                if "429" in str(e):
-                    time.sleep(retry_delay) 
-                    retry_delay *= 2 # Exponential backoff: 30 -> 60 -> 120
-                    retries -= 1
-                else:
-                    raise e
-        
-        if not success:
-            raise Exception(f"Failed to process chunk {i+1} due to rate limits after retries.")
-    
+    # Step 7: Vector Store Creation - rate-limit-aware concurrent batching
+    # The scheduler keeps several batches in flight under the RPM/TPM budgets, adapts the
+    # batch size to 429s and honors Retry-After instead of sleeping after every chunk
+    if not all_texts:
+        return None
+
+    scheduler = EmbeddingScheduler.from_env(
+        lambda texts: asyncio.to_thread(embeddings.embed_documents, texts)
+    )
+    texts = [doc.page_content for doc in all_texts]
+    # Chunks embedded before (same model, same normalized text) come from the local cache;
+    # progress counts every chunk, cached ones included
+    vectors = asyncio.run(get_embedding_cache().embed(
+        embeddings.model,
+        texts,
+        scheduler.embed_resumable,
+        progress_callback=progress_callback
+    ))
+
+    vector_store = FAISS.from_embeddings(
+        list(zip(texts, vectors)),
+        embeddings,
+        metadatas=[doc.metadata for doc in all_texts]
+    )
     return vector_store
 
 def create_qa_chain(vector_store):
@@ -36,6 +36,11 @@ CREATE TABLE public.chat_messages (
   created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 
+-- History is read per session in (created_at, id) order, paged by keyset on both
+CREATE INDEX chat_messages_session_created_id ON public.chat_messages (session_id, created_at, id);
+CREATE INDEX chat_sessions_user ON public.chat_sessions (user_id);
+CREATE INDEX documents_user_filename ON public.documents (user_id, filename);
+
 -- Row Level Security (RLS)
 ALTER TABLE public.profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.documents ENABLE ROW LEVEL SECURITY;
@@ -19,6 +19,16 @@ export function DocumentUploader({ onUploadComplete }: { onUploadComplete: (file
         try {
             const response = await api.uploadDocs(files);
             const uploadedFilenames = response.filenames || [];
+
+            // Ingestion runs in the background; poll the job until it finishes
+            let job = response;
+            while (job.job_id && (job.status === "queued" || job.status === "running")) {
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                job = await api.getJob(job.job_id);
+            }
+            if (job.status === "failed" || job.status === "cancelled") {
+                throw new Error(job.error || `Ingestion ${job.status}`);
+            }
             setStatus("success");
             onUploadComplete(uploadedFilenames);
             setTimeout(() => {
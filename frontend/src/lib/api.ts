@@ -25,6 +25,21 @@ export const api = {
         return response.data;
     },
 
+    getJob: async (jobId: string) => {
+        const response = await instance.get(`/jobs/${jobId}`);
+        return response.data;
+    },
+
+    cancelJob: async (jobId: string) => {
+        const response = await instance.delete(`/jobs/${jobId}`);
+        return response.data;
+    },
+
+    deleteDoc: async (filename: string) => {
+        const response = await instance.delete(`/documents/${encodeURIComponent(filename)}`);
+        return response.data;
+    },
+
     queryDocs: async (question: string, sessionId?: string) => {
         const response = await instance.post("/query", {
             question,
@@ -33,8 +48,18 @@ export const api = {
         return response.data;
     },
 
-    getHistory: async (sessionId: string) => {
-        const response = await instance.get(`/history/${sessionId}`);
+    // Without before/after/limit: every message, as an array. With any of them, one page:
+    // { messages, older_cursor, newer_cursor }; pass older_cursor as `before` to page back
+    getHistory: async (sessionId: string, params: { before?: string; after?: string; limit?: number; sources?: boolean } = {}) => {
+        const response = await instance.get(`/history/${sessionId}`, { params });
+        return response.data;
+    },
+
+    getHistorySources: async (sessionId: string, ids: string[]) => {
+        const response = await instance.get(`/history/${sessionId}/sources`, {
+            params: { ids },
+            paramsSerializer: { indexes: null }
+        });
         return response.data;
     },
 